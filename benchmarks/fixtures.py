@@ -0,0 +1,71 @@
+"""Generated inputs for benchmarks: WAV files, sound directory trees and profiles."""
+import os
+import json
+import math
+import wave
+import struct
+from pathlib import Path
+from typing import List
+
+
+def write_wav(path: Path, *, duration_ms: int = 200, sample_rate: int = 44100, channel_count: int = 2,
+              frequency: float = 440.0):
+    """Write 16 bit sine wave WAV file."""
+    frame_count = sample_rate * duration_ms // 1000
+    frames = bytearray()
+    for frame in range(frame_count):
+        sample = int(12000 * math.sin(2 * math.pi * frequency * frame / sample_rate))
+        frames += struct.pack("<h", sample) * channel_count
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(channel_count)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(bytes(frames))
+
+
+def make_sound_tree(root: Path, file_count: int, *, files_per_directory: int = 100) -> List[Path]:
+    """
+    Create directory tree with file_count sound files spread over sub directories.
+    Only the first file is a real WAV, the rest are hard links (or copies) of it so generating 100k files stays fast.
+    """
+    template = root / "template.wav"
+    write_wav(template, duration_ms=50)
+
+    paths = []
+    for index in range(file_count):
+        path = root / f"dir_{index // files_per_directory:04}" / f"sound_{index:06}.wav"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(template, path)
+        except OSError:
+            path.write_bytes(template.read_bytes())
+        paths.append(path)
+
+    template.unlink()
+    return paths
+
+
+KEYS = [*"abcdefghijklmnopqrstuvwxyz0123456789", *(f"f{number}" for number in range(1, 13))]
+MODIFIERS = ("ctrl", "alt", "shift", "ctrl+alt", "ctrl+shift", "alt+shift")
+
+
+def make_hotkeys(count: int) -> List[str]:
+    """Unique, valid keyboard hotkeys, two step ones (like 'ctrl+a, b') so there are enough of them."""
+    hotkeys = [
+        f"{modifier}+{first_key}, {second_key}" for modifier in MODIFIERS for first_key in KEYS for second_key in KEYS
+    ]
+    if count > len(hotkeys):
+        raise ValueError(f"Can't make more than {len(hotkeys)} hotkeys.")
+    return hotkeys[:count]
+
+
+def make_profile(profiles_directory: Path, name: str, sound_path: Path, entry_count: int) -> Path:
+    """Write profile json with entry_count hotkeys all pointing to sound_path."""
+    profiles_directory.mkdir(parents=True, exist_ok=True)
+    profile = {hotkey: str(sound_path) for hotkey in make_hotkeys(entry_count)}
+    path = profiles_directory / f"{name}.json"
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=4)
+    return path
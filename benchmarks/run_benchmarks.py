@@ -0,0 +1,593 @@
+"""
+Headless benchmarks for playback and profile paths.
+
+Everything runs with Qt offscreen platform in a temporary working directory with generated WAV files, sound trees and
+profiles, so it can run on a plain Linux box without display or sound card. Results are saved as json and can be
+compared against a stored baseline, in which case the exit code is 1 if anything got slower than allowed tolerance.
+
+Usage (from repository root):
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json --tolerance 0.25
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import threading
+import statistics
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+SOURCE_DIRECTORY = REPOSITORY_ROOT / "mc_fart_mic"
+sys.path.insert(0, str(SOURCE_DIRECTORY))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import fixtures  # noqa E402 benchmarks directory is on path when run as script
+
+Results = Dict[str, Dict[str, float]]
+BENCHMARKS: Dict[str, Callable[["BenchmarkContext"], Results]] = {}
+
+
+def benchmark(name: str):
+    """Register function as benchmark, function takes BenchmarkContext and returns results for one or more cases."""
+    def decorator(function: Callable[["BenchmarkContext"], Results]):
+        BENCHMARKS[name] = function
+        return function
+    return decorator
+
+
+def measure(function: Callable[[], object], *, repeat: int, number: int = 1) -> Dict[str, float]:
+    """Call function number times per round for repeat rounds, report per call timings of the rounds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+
+    median = statistics.median(timings)
+    return {
+        "median_ms": round(median * 1000, 6),
+        "min_ms": round(min(timings) * 1000, 6),
+        "ops_per_sec": round(1 / median, 2) if median else float("inf")
+    }
+
+
+class BenchmarkContext:
+    """Working directory with generated fixtures and lazily created Qt application and main window."""
+    def __init__(self, work_directory: Path, *, quick: bool):
+        self.work_directory = work_directory
+        self.quick = quick
+        self.repeat = 3 if quick else 7
+        self.short_wav = work_directory / "sounds" / "short.wav"
+        fixtures.write_wav(self.short_wav)
+        self._application = None
+        self._window = None
+
+        # Program uses paths relative to working directory (layouts, profiles, config)
+        shutil.copytree(SOURCE_DIRECTORY / "layouts", work_directory / "layouts")
+        (work_directory / "profiles").mkdir()
+        os.chdir(work_directory)
+
+    @property
+    def application(self):
+        if self._application is None:
+            from PyQt5.QtWidgets import QApplication
+            self._application = QApplication.instance() or QApplication([sys.argv[0]])
+        return self._application
+
+    @property
+    def window(self):
+        if self._window is None:
+            self.application
+            from main_menu import MainWindowUi
+            self._window = MainWindowUi()
+            # Exception hook shows modal message boxes which would block a headless run
+            sys.excepthook = self._window._backup_excepthook
+        return self._window
+
+    def process_events(self, duration_ms: int = 0):
+        deadline = time.perf_counter() + duration_ms / 1000
+        while True:
+            self.application.processEvents()
+            if time.perf_counter() >= deadline:
+                break
+
+    def url(self, path: Path):
+        from PyQt5.QtCore import QUrl
+        return QUrl.fromLocalFile(str(path))
+
+
+@benchmark("player_pool_manager_play")
+def benchmark_player_pool_manager_play(context: BenchmarkContext) -> Results:
+    from player_pool import PlayerPool, PlayerPoolManager, MAX_MAX_CONCURRENT_SOUNDS
+
+    context.application
+    results = {}
+    url = context.url(context.short_wav)
+    for case, cache_budget in (("cached", None), ("uncached", 0)):
+        manager = PlayerPoolManager(PlayerPool(MAX_MAX_CONCURRENT_SOUNDS), PlayerPool(MAX_MAX_CONCURRENT_SOUNDS))
+        manager.set_player_pool_enabled(1, True)
+        if cache_budget is not None:
+            manager.sound_cache.budget_bytes = cache_budget
+        manager.play(url=url)
+        context.process_events(50)
+        results[f"player_pool_manager_play[{case}]"] = measure(
+            lambda: manager.play(url=url), repeat=context.repeat, number=50
+        )
+        manager.stop_all_playback()
+    return results
+
+
+@benchmark("player_pool_get_player")
+def benchmark_player_pool_get_player(context: BenchmarkContext) -> Results:
+    """Allocation on a saturated pool, so every call has to steal a voice."""
+    from player_pool import PlayerPool, MIN_MAX_CONCURRENT_SOUNDS, MAX_MAX_CONCURRENT_SOUNDS
+
+    context.application
+    results = {}
+    url = context.url(context.short_wav)
+    for pool_size in range(MIN_MAX_CONCURRENT_SOUNDS, MAX_MAX_CONCURRENT_SOUNDS + 1):
+        pool = PlayerPool(pool_size)
+        for _ in range(pool_size):
+            pool.play(url)
+        results[f"player_pool_get_player[{pool_size}]"] = measure(
+            lambda: pool.play(url), repeat=context.repeat, number=50
+        )
+        pool.stop_all_playbacks()
+    return results
+
+
+@benchmark("player_pool_burst")
+def benchmark_player_pool_burst(context: BenchmarkContext) -> Results:
+    """Burst of sounds on an idle pool, players are created on demand while the burst plays."""
+    from player_pool import PlayerPool, MAX_MAX_CONCURRENT_SOUNDS
+
+    context.application
+    url = context.url(context.short_wav)
+    pool = PlayerPool(MAX_MAX_CONCURRENT_SOUNDS, idle_timeout_ms=0)
+
+    def burst():
+        for _ in range(MAX_MAX_CONCURRENT_SOUNDS):
+            pool.play(url)
+        pool.stop_all_playbacks()
+        # Reaps every idle player so the next burst starts from an empty pool again
+        pool.warm_players = 0
+        context.process_events(1)
+
+    return {"player_pool_burst": measure(burst, repeat=context.repeat)}
+
+
+@benchmark("audio_devices")
+def benchmark_audio_devices(context: BenchmarkContext) -> Results:
+    """Device lookup as done by settings window and switching a full pool between a device and default device."""
+    from audio_devices import AudioDeviceRegistry
+    from player_pool import PlayerPool, MAX_MAX_CONCURRENT_SOUNDS
+
+    context.application
+    # Fixed device list so the case is the same on machines without any output device
+    device_registry = AudioDeviceRegistry(lambda: {"Benchmark device": "benchmark-device"}, poll_interval_ms=0)
+    pool = PlayerPool(MAX_MAX_CONCURRENT_SOUNDS, device_registry=device_registry)
+
+    def switch_device():
+        pool.change_device(None if pool.device_name == "Benchmark device" else "Benchmark device")
+
+    return {
+        "audio_devices[available_devices]": measure(pool.available_devices, repeat=context.repeat, number=100),
+        "audio_devices[change_device]": measure(switch_device, repeat=context.repeat, number=20)
+    }
+
+
+@benchmark("play_sound_directory")
+def benchmark_play_sound_directory(context: BenchmarkContext) -> Results:
+    file_count = 1000 if context.quick else 10000
+    tree = context.work_directory / f"tree_{file_count}"
+    fixtures.make_sound_tree(tree, file_count)
+    window = context.window
+
+    first_start = time.perf_counter()
+    window.play_sound(str(tree))
+    first_ms = (time.perf_counter() - first_start) * 1000
+
+    results = {f"play_sound_directory[{file_count}]": measure(
+        lambda: window.play_sound(str(tree)), repeat=context.repeat, number=20
+    )}
+    results[f"play_sound_directory[{file_count}]"]["first_call_ms"] = round(first_ms, 6)
+    window.player_pool_manager.stop_all_playback()
+    return results
+
+
+@benchmark("library_scan")
+def benchmark_library_scan(context: BenchmarkContext) -> Results:
+    """Scan of a sound tree into an empty catalog, then a rescan where nothing changed. All files are duplicates."""
+    from sound_library import LibraryScanner, SoundCatalog
+
+    file_count = 10000 if context.quick else 100000
+    tree = context.work_directory / f"library_tree_{file_count}"
+    fixtures.make_sound_tree(tree, file_count, files_per_directory=500)
+    catalog = SoundCatalog(context.work_directory / "sound_catalog.sqlite3")
+    scanner = LibraryScanner(catalog)
+    results = {}
+    for case in ("full", "unchanged"):
+        # Each round after the first sees an unchanged tree, so the full case is a single round on an empty catalog
+        timings = measure(lambda: scanner.scan(str(tree)), repeat=1 if case == "full" else context.repeat)
+        timings["files_per_sec"] = round(file_count * 1000 / timings["median_ms"], 2)
+        results[f"library_scan[{case}, {file_count}]"] = timings
+    catalog.close()
+    return results
+
+
+@benchmark("profile")
+def benchmark_profile(context: BenchmarkContext) -> Results:
+    from PyQt5.QtCore import QModelIndex
+    from hotkey_entry import HotkeyEntry
+
+    entry_count = 1000 if context.quick else 5000
+    window = context.window
+    profile_name = f"benchmark_{entry_count}"
+    json_path = fixtures.make_profile(window.PROFILES_DIRECTORY, profile_name, context.short_wav, entry_count)
+
+    def import_json():
+        window.profile_store.delete_profile(profile_name)
+        window.profile_store.import_json(json_path)
+
+    results = {f"import_profile_json[{entry_count}]": measure(import_json, repeat=context.repeat)}
+    results[f"load_profile[{entry_count}]"] = measure(
+        lambda: window.load_profile(profile_name), repeat=context.repeat
+    )
+    window.profile = window.load_profile(profile_name)
+
+    entry = HotkeyEntry(fixtures.make_hotkeys(1)[0], str(context.short_wav))
+
+    def add_and_delete_entry():
+        window.profile_store.add_entry(profile_name, entry)
+        window.profile_store.delete_entry(entry)
+
+    results[f"profile_store_add_delete_entry[{entry_count}]"] = measure(
+        add_and_delete_entry, repeat=context.repeat, number=20
+    )
+
+    def populate():
+        # Table reads the first page once laid out, window isn't shown here so it's read the same way by hand
+        window.hotkey_table_model.set_profile(window.profile_store, profile_name)
+        window.hotkey_table_model.fetchMore(QModelIndex())
+        context.process_events()
+
+    results[f"populate_hotkey_table[{entry_count}]"] = measure(populate, repeat=context.repeat)
+
+    # Second profile shares 90% of the hotkeys, switching between the two only registers the other 10%
+    hotkeys = fixtures.make_hotkeys(entry_count + entry_count // 10)
+    profiles = (window.profile, [
+        HotkeyEntry(hotkey, str(context.short_wav)) for hotkey in hotkeys[entry_count // 10:]
+    ])
+    switches = iter(range(10 ** 9))
+
+    def switch_profile():
+        window.profile = profiles[next(switches) % 2]
+        window.refresh_hotkeys()
+
+    try:
+        results[f"refresh_hotkeys[{entry_count}]"] = measure(window.refresh_hotkeys, repeat=context.repeat)
+        results[f"switch_profile_hotkeys[{entry_count}]"] = measure(switch_profile, repeat=context.repeat)
+    except Exception as e:  # noqa PyBroadException keyboard hooks need elevated permissions on some systems
+        print(f"Skipping refresh_hotkeys: {e}", file=sys.stderr)
+    return results
+
+
+@benchmark("loudness_analysis")
+def benchmark_loudness_analysis(context: BenchmarkContext) -> Results:
+    """Analysis of a sound tree in worker processes, then a rescan of the same tree where nothing changed."""
+    from loudness import LoudnessAnalyzer
+
+    file_count = 200 if context.quick else 1000
+    tree = context.work_directory / f"loudness_tree_{file_count}"
+    fixtures.make_sound_tree(tree, file_count)
+    results = {}
+    for case in ("full", "unchanged"):
+        analyzer = LoudnessAnalyzer(context.work_directory / "loudness_index.sqlite3")
+        analyzer.enabled = True
+        finished = []
+        analyzer.analysis_finished.connect(lambda: finished.append(True))
+
+        def analyze():
+            finished.clear()
+            analyzer.analyze([str(tree)])
+            while not finished:
+                context.process_events()
+
+        # Each round after the first sees an unchanged tree, so the full case is a single round on an empty index
+        results[f"loudness_analysis[{case}]"] = measure(analyze, repeat=1 if case == "full" else context.repeat)
+        analyzer.shutdown()
+    return results
+
+
+@benchmark("hotkey_search")
+def benchmark_hotkey_search(context: BenchmarkContext) -> Results:
+    """Typing search text one character at a time and deleting it again, as user would."""
+    from hotkey_entry import HotkeyEntry
+    from hotkey_table import HotkeyTableModel
+
+    context.application
+    entry_count = 10000 if context.quick else 50000
+    # Hotkeys repeat, profiles can have multiple entries per hotkey
+    hotkeys = fixtures.make_hotkeys(1000)
+    entries = [
+        HotkeyEntry(hotkeys[index % len(hotkeys)], f"sounds/sound_{index:06}.wav") for index in range(entry_count)
+    ]
+    model = HotkeyTableModel()
+    model.set_entries(entries)
+    text = "sound_0012"
+
+    def type_and_delete():
+        for length in (*range(1, len(text) + 1), *range(len(text) - 1, -1, -1)):
+            model.set_filter(text[:length])
+
+    return {f"hotkey_search[{entry_count}]": measure(type_and_delete, repeat=context.repeat)}
+
+
+@benchmark("hotkey_trigger")
+def benchmark_hotkey_trigger(context: BenchmarkContext) -> Results:
+    """
+    Synthetic key presses: call hotkey callback from a separate thread the same way keyboard hook thread does.
+    Measured is the time hook thread spends in the callback, with every press accepted and with presses coalesced as
+    key repeats.
+    """
+    from hotkey_entry import HotkeyEntry
+
+    window = context.window
+    dispatcher = window.hotkey_dispatcher
+    entry = HotkeyEntry(fixtures.make_hotkeys(1)[0], str(context.short_wav))
+    trigger_count = 200 if context.quick else 1000
+    backup_repeat_window_ms = dispatcher.repeat_window_ms
+    results = {}
+
+    for case, repeat_window_ms in (("accepted", 0), ("coalesced", 10 ** 6)):
+        dispatcher.repeat_window_ms = repeat_window_ms
+        dispatcher.reset()
+        timings = []
+
+        def hook_thread():
+            for _ in range(trigger_count):
+                start = time.perf_counter()
+                dispatcher.submit(entry)
+                timings.append(time.perf_counter() - start)
+
+        thread = threading.Thread(target=hook_thread)
+        thread.start()
+        while thread.is_alive():
+            context.process_events()
+        context.process_events(50)
+        window.player_pool_manager.stop_all_playback()
+
+        median = statistics.median(timings)
+        results[f"hotkey_trigger_callback[{case}]"] = {
+            "median_ms": round(median * 1000, 6),
+            "min_ms": round(min(timings) * 1000, 6),
+            "ops_per_sec": round(1 / median, 2) if median else float("inf")
+        }
+
+    dispatcher.repeat_window_ms = backup_repeat_window_ms
+    return results
+
+
+@benchmark("trigger_server")
+def benchmark_trigger_server(context: BenchmarkContext) -> Results:
+    """
+    Round trips of concurrent trigger server clients, as reported by the bundled load generator. Hotkey plays are
+    answered from the server thread, stop waits for the GUI thread.
+    """
+    from hotkey_entry import HotkeyEntry
+    from trigger_load import run_load
+
+    window = context.window
+    if window.trigger_server is None and not window.start_trigger_server("127.0.0.1:0"):
+        raise RuntimeError("Trigger server didn't start.")
+    entry = HotkeyEntry(fixtures.make_hotkeys(1)[0], str(context.short_wav))
+    window.trigger_server.set_entries([entry])
+    client_count = 10
+    request_count = 50 if context.quick else 200
+    results = {}
+
+    cases = (
+        ("ping", {"op": "ping"}, 1),
+        ("play", {"op": "play", "hotkey": entry.hotkey}, 1),
+        ("play_batch", {"op": "play", "hotkey": entry.hotkey}, 10),
+        ("stop", {"op": "stop"}, 1)
+    )
+    for case, request, batch in cases:
+        load = {}
+
+        def clients():
+            load.update(run_load(
+                window.trigger_server.address, request, client_count=client_count, request_count=request_count,
+                batch=batch
+            ))
+
+        thread = threading.Thread(target=clients)
+        thread.start()
+        while thread.is_alive():
+            context.process_events()
+        window.player_pool_manager.stop_all_playback()
+        window.hotkey_dispatcher.reset()
+
+        if load["errors"]:
+            raise RuntimeError(f"Trigger server answered {load['errors']} requests with an error in case {case}.")
+        results[f"trigger_server[{case}]"] = {
+            "median_ms": load["median_ms"],
+            "p99_ms": load["p99_ms"],
+            "ops_per_sec": load["requests_per_sec"] * batch
+        }
+
+    window.refresh_trigger_server()
+    return results
+
+
+@benchmark("config_update")
+def benchmark_config_update(context: BenchmarkContext) -> Results:
+    """Single settings change as done on every slider move, and writing a batch of changes to file."""
+    from config import Config
+
+    context.application
+    values = iter(range(10 ** 9))
+    results = {"config_data_update": measure(
+        lambda: Config._config_data_update(lambda: "benchmark_slider", lambda: next(values)),
+        repeat=context.repeat, number=100
+    )}
+
+    def update_and_flush():
+        Config._config_data_update(lambda: "benchmark_slider", lambda: next(values))
+        Config.flush()
+
+    results["config_flush"] = measure(update_and_flush, repeat=context.repeat, number=20)
+    return results
+
+
+@benchmark("preload")
+def benchmark_preload(context: BenchmarkContext) -> Results:
+    """
+    Preloading most played sounds when a profile with a distinct file per hotkey is loaded, and share of plays that
+    start from memory afterwards. Plays are skewed like real hotkey use, a few hotkeys get most of them.
+    """
+    from hotkey_entry import HotkeyEntry
+
+    entry_count = 100 if context.quick else 500
+    window = context.window
+    preloader = window.sound_preloader
+    profile_name = f"preload_{entry_count}"
+    window.profile_store.create_profile(profile_name)
+    sounds = context.work_directory / "preload"
+    sounds.mkdir()
+    entries = []
+    for index, hotkey in enumerate(fixtures.make_hotkeys(entry_count)):
+        # Copies are separate files as far as sound cache is concerned
+        shutil.copyfile(context.short_wav, sounds / f"{index}.wav")
+        entries.append(HotkeyEntry(hotkey, str(sounds / f"{index}.wav")))
+    window.profile_store.add_entries(profile_name, entries)
+
+    # Zipf distribution, hotkeys are shuffled so the most played ones are not simply the first ones in profile
+    popularity = random.Random(0).sample(entries, entry_count)
+    weights = [1 / rank for rank in range(1, entry_count + 1)]
+    for entry in random.Random(1).choices(popularity, weights, k=entry_count * 2):
+        preloader.record_play(entry)
+    # Hit rates are measured on other plays than the ones usage was learned from
+    plays = random.Random(2).choices(popularity, weights, k=entry_count)
+
+    results = {}
+    for preload_count in (0, 10, 50):
+        preloader.preload_count = preload_count
+
+        def load_profile():
+            window.player_pool_manager.sound_cache.clear()
+            preloader.set_entries(entries)
+            while preloader.preloading:
+                context.process_events()
+
+        case = f"preload[{preload_count}/{entry_count}]"
+        results[case] = measure(load_profile, repeat=context.repeat)
+        preloader.stats.update(dict.fromkeys(preloader.stats, 0))
+        for entry in plays:
+            window.play_entry(entry)
+        window.player_pool_manager.stop_all_playback()
+        results[case].update(preloader.hit_rates)
+    return results
+
+
+def run_startup(*arguments: str) -> Tuple[float, float]:
+    """
+    Start the program in a new process from the working directory and let it exit once it's up.
+    :return: startup time in ms and resident memory in MB, memory is 0 if it can't be read on this system
+    """
+    command = [sys.executable, str(SOURCE_DIRECTORY / "main_menu.py"), "--profile-startup", "--exit-after-startup"]
+    # Exit code is not checked, keyboard hooks can fail on exit on systems without input devices, after the report
+    output = subprocess.run([*command, *arguments], capture_output=True, text=True, timeout=60).stdout
+    report = dict(line.strip().rsplit(None, 2)[:2] for line in output.splitlines()[1:] if line.startswith("    "))
+    if "total" not in report:
+        raise RuntimeError(f"Program didn't report its startup with arguments {arguments}.")
+    return float(report["total"]), float(report.get("resident memory", 0))
+
+
+@benchmark("startup")
+def benchmark_startup(context: BenchmarkContext) -> Results:
+    """Time until the program is up and its resident memory then, with main window and headless."""
+    results = {}
+    for mode, arguments in (("gui", ()), ("headless", ("--headless",))):
+        runs = [run_startup(*arguments) for _ in range(context.repeat)]
+        startup_ms = statistics.median(startup_ms for startup_ms, _ in runs)
+        results[f"startup[{mode}]"] = {
+            "median_ms": round(startup_ms, 3),
+            "min_ms": round(min(startup_ms for startup_ms, _ in runs), 3),
+            "ops_per_sec": round(1000 / startup_ms, 2),
+            "resident_memory_mb": round(statistics.median(memory for _, memory in runs), 2)
+        }
+    return results
+
+
+def compare(results: Results, baseline: Results, tolerance: float) -> List[str]:
+    """Return descriptions of all cases that are slower than baseline by more than tolerance (0.25 = 25%)."""
+    regressions = []
+    for case, metrics in results.items():
+        baseline_metrics = baseline.get(case)
+        if baseline_metrics is None:
+            continue
+        if metrics["median_ms"] > baseline_metrics["median_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{case}: {metrics['median_ms']:.4f} ms, baseline {baseline_metrics['median_ms']:.4f} ms "
+                f"({metrics['median_ms'] / baseline_metrics['median_ms'] - 1:+.0%})"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, help="save results to this json file")
+    parser.add_argument("--baseline", type=Path, help="compare results against this results json file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against baseline")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller fixtures and fewer rounds")
+    arguments = parser.parse_args()
+
+    output = arguments.output.resolve() if arguments.output else None
+    baseline_path = arguments.baseline.resolve() if arguments.baseline else None
+
+    results: Results = {}
+    with tempfile.TemporaryDirectory(prefix="mc_fart_mic_benchmark_") as work_directory:
+        context = BenchmarkContext(Path(work_directory), quick=arguments.quick)
+        for name in arguments.only or BENCHMARKS:
+            print(f"Running {name}...", file=sys.stderr)
+            results.update(BENCHMARKS[name](context))
+        os.chdir(REPOSITORY_ROOT)
+
+    for case, metrics in results.items():
+        print(f"{case:<45} {metrics['median_ms']:>12.4f} ms {metrics['ops_per_sec']:>14.1f} ops/s")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": arguments.quick
+        },
+        "results": results
+    }
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if baseline_path is not None:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f)["results"], arguments.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Load generator for the trigger server (start the program with --trigger-server).
+
+Every client keeps one connection open and sends its requests one after another, each waiting for the response of the
+previous one, so reported latencies are full round trips as a script would see them.
+
+Usage (from repository root):
+    python benchmarks/trigger_load.py --hotkey ctrl+1 --clients 20 --requests 500
+    python benchmarks/trigger_load.py --address /tmp/mc_fart_mic.sock --hotkey ctrl+1 --batch 10
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from typing import Dict, List
+
+SOURCE_DIRECTORY = Path(__file__).resolve().parent.parent / "mc_fart_mic"
+sys.path.insert(0, str(SOURCE_DIRECTORY))
+
+from trigger_server import DEFAULT_TRIGGER_SERVER_ADDRESS, encode_message, parse_address  # noqa E402
+
+
+async def _open_connection(address: str):
+    parsed_address = parse_address(address)
+    if isinstance(parsed_address, str):
+        return await asyncio.open_unix_connection(parsed_address)
+    return await asyncio.open_connection(*parsed_address)
+
+
+async def _run_client(address: str, request: bytes, request_count: int, latencies: List[float], errors: List[str]):
+    reader, writer = await _open_connection(address)
+    try:
+        for _ in range(request_count):
+            start = time.perf_counter()
+            writer.write(request)
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if not response["ok"]:
+                errors.append(response["error"])
+    finally:
+        writer.close()
+
+
+async def _run_clients(address: str, request: bytes, client_count: int, request_count: int) -> Dict[str, float]:
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _run_client(address, request, request_count, latencies, errors) for _ in range(client_count)
+    ))
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(duration, 3),
+        "requests_per_sec": round(len(latencies) / duration, 1),
+        "median_ms": round(statistics.median(latencies) * 1000, 4),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 4),
+        "max_ms": round(latencies[-1] * 1000, 4)
+    }
+
+
+def run_load(
+        address: str, request: dict, *, client_count: int = 10, request_count: int = 100, batch: int = 1
+) -> Dict[str, float]:
+    """
+    Send request_count copies of request from each of client_count concurrent clients.
+    :param batch: if over 1 requests are sent as batches of this many copies of request
+    :return: dict with number of requests and errors, duration, throughput and round trip latencies
+    """
+    if batch > 1:
+        request = {"op": "batch", "requests": [request] * batch}
+    return asyncio.run(_run_clients(address, encode_message(request), client_count, request_count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default=DEFAULT_TRIGGER_SERVER_ADDRESS, help="address the program listens on")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--hotkey", help="hotkey from the loaded profile to trigger")
+    target.add_argument("--sound", help="sound file or directory to play")
+    target.add_argument("--ping", action="store_true", help="only measure request overhead, nothing plays")
+    parser.add_argument("--clients", type=int, default=10, help="number of concurrent connections")
+    parser.add_argument("--requests", type=int, default=100, help="requests sent by each client")
+    parser.add_argument("--batch", type=int, default=1, help="triggers sent in each request")
+    arguments = parser.parse_args()
+
+    if arguments.ping:
+        request = {"op": "ping"}
+    elif arguments.hotkey is not None:
+        request = {"op": "play", "hotkey": arguments.hotkey}
+    else:
+        request = {"op": "play", "sound": arguments.sound}
+
+    results = run_load(
+        arguments.address, request, client_count=arguments.clients, request_count=arguments.requests,
+        batch=arguments.batch
+    )
+    for name, value in results.items():
+        print(f"{name:<20} {value}")
+    print(f"{'triggers_per_sec':<20} {results['requests_per_sec'] * arguments.batch:.1f}")
+
+
+if __name__ == "__main__":
+    main()
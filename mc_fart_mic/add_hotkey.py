@@ -1,8 +1,8 @@
 import keyboard
-from PyQt5 import uic
 from PyQt5.QtCore import QTimer, QEventLoop, pyqtSlot
 from PyQt5.QtWidgets import QWidget, QFileDialog, qApp, QStyle
 
+from ui_loader import load_ui
 from constants import SURE_SUPPORTED_AUDIO_FORMATS, POSSIBLE_AUDIO_FORMATS
 from message_boxes import show_simple_info_message, show_simple_warning_message
 
@@ -12,7 +12,7 @@ class AddHotkeyUI(QWidget):
 
     def __init__(self, main_menu):
         super(AddHotkeyUI, self).__init__()
-        uic.loadUi("layouts/add_hotkey.ui", self)
+        load_ui("add_hotkey.ui", self)
         self.setFixedSize(self.size())
 
         self._main_menu = main_menu
@@ -30,6 +30,12 @@ class AddHotkeyUI(QWidget):
         self.select_sound_directory_button.setIcon(qApp.style().standardIcon(QStyle.SP_DirLinkIcon))
         self.select_sound_directory_button.clicked.connect(self.select_directory_dialog)
 
+        self.help_priority_choke_group.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_priority_choke_group.clicked.connect(self.show_help_priority_choke_group)
+
+        self.help_keyword.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_keyword.clicked.connect(self.show_help_keyword)
+
         self.button_save_hotkey.clicked.connect(self.save_hotkey)
 
     def listen_hotkey(self):
@@ -70,6 +76,24 @@ class AddHotkeyUI(QWidget):
             "they will just not play."
         )
 
+    @pyqtSlot()
+    def show_help_priority_choke_group(self):
+        show_simple_info_message(
+            "Priority is used when maximum number of concurrent sounds is reached and voice stealing in settings is set "
+            "to lowest priority: sound with lowest priority is stopped to make room for new one, and new sound doesn't "
+            "play at all if every playing sound has higher priority.\n\n"
+            "Choke group is any name you choose. When a sound with choke group starts playing all other sounds from "
+            "the same group are instantly stopped. Leave it empty to not use it."
+        )
+
+    @pyqtSlot()
+    def show_help_keyword(self):
+        show_simple_info_message(
+            "Optional word that also plays the sound when you type it, anywhere in any program.\n\n"
+            "Keywords are not case sensitive and can't be longer than maximum keyword length in settings. "
+            "Leave it empty to play the sound only with the hotkey."
+        )
+
     @pyqtSlot()
     def select_filename_dialog(self):
         options = QFileDialog.Options()
@@ -106,5 +130,11 @@ class AddHotkeyUI(QWidget):
         elif not self.sound_file_line_edit.text():
             return show_simple_warning_message("Please select a sound file.")
 
-        self._main_menu.new_hotkey_entry(self.hotkey_line_edit.text(), self.sound_file_line_edit.text())
+        self._main_menu.new_hotkey_entry(
+            self.hotkey_line_edit.text(), self.sound_file_line_edit.text(),
+            priority=self.priority_spin_box.value(), choke_group=self.choke_group_line_edit.text().strip() or None,
+            # 0 is shown as auto, start is left to skipping leading silence
+            start_offset_ms=self.start_offset_spin_box.value() or None,
+            keyword=self.keyword_line_edit.text().strip() or None
+        )
         self.hide()
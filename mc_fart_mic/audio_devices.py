@@ -0,0 +1,136 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PyQt5 import QtCore
+from PyQt5.QtMultimedia import QAudio, QAudioDeviceInfo
+
+
+logger = logging.getLogger(__name__)
+
+# Qt 5 doesn't notify about added or removed audio devices, so they are checked for in the background this often
+DEVICE_POLL_INTERVAL_MS: int = 5000
+DEFAULT_DEVICE_NAME = "Default"
+
+
+def enumerate_audio_outputs() -> Dict[str, QAudioDeviceInfo]:
+    """Audio output devices as device name -> QAudioDeviceInfo."""
+    return {info.deviceName(): info for info in QAudioDeviceInfo.availableDevices(QAudio.AudioOutput)}
+
+
+def audio_outputs_fingerprint() -> Tuple[str, ...]:
+    """Names of audio output devices and default device last, changes whenever a device is added or removed."""
+    names = sorted(info.deviceName() for info in QAudioDeviceInfo.availableDevices(QAudio.AudioOutput))
+    return (*names, QAudioDeviceInfo.defaultOutputDevice().deviceName())
+
+
+class AudioDeviceRegistry(QtCore.QObject):
+    """
+    Process wide cache of audio output devices of one playback backend, as friendly name -> device identifier.
+
+    Devices are enumerated once on first use, after that looking up a device is a dict lookup. Whether devices were
+    added or removed is checked periodically on a background thread (trough QAudioDeviceInfo, which is safe to use from
+    any thread), only when something changed the backend's own enumeration runs again on the registry thread and
+    devices_changed is emitted if the devices it sees changed.
+    """
+    devices_changed = QtCore.pyqtSignal()
+    _fingerprint_ready = QtCore.pyqtSignal(object)
+
+    _shared: Dict[Callable, "AudioDeviceRegistry"] = {}
+
+    def __init__(
+            self, enumerate_devices: Callable[[], Dict[str, Any]], poll_interval_ms: int = DEVICE_POLL_INTERVAL_MS
+    ):
+        """
+        :param enumerate_devices: callable returning dict of device friendly name -> device identifier, runs on the
+                                  thread the registry was created on
+        :param poll_interval_ms: int how often to check for added or removed devices, 0 disables checking
+        """
+        super().__init__()
+        self._enumerate_devices = enumerate_devices
+        self._devices: Optional[Dict[str, Any]] = None
+        self._fingerprint: Optional[Tuple[str, ...]] = None
+        self._polling = False
+        self._poll_timer = QtCore.QTimer(self)
+        self._poll_timer.setInterval(poll_interval_ms)
+        self._poll_timer.timeout.connect(self._poll)
+        # Emitted from the background thread, delivered queued on the registry thread
+        self._fingerprint_ready.connect(self._on_fingerprint_ready)
+        self.stats = {"enumerations": 0, "polls": 0, "changes": 0}
+
+    @classmethod
+    def shared(cls, enumerate_devices: Callable[[], Dict[str, Any]]) -> "AudioDeviceRegistry":
+        """Registry shared by everything that enumerates devices with enumerate_devices, created on first call."""
+        registry = cls._shared.get(enumerate_devices)
+        if registry is None:
+            registry = cls._shared[enumerate_devices] = cls(enumerate_devices)
+        return registry
+
+    def devices(self) -> Dict[str, Any]:
+        """Cached devices as friendly name -> identifier, devices are enumerated on the first call."""
+        if self._devices is None:
+            self._fingerprint = self._read_fingerprint()
+            self._devices = self._enumerate()
+            if self._poll_timer.interval() > 0 and QtCore.QCoreApplication.instance() is not None:
+                self._poll_timer.start()
+        return self._devices
+
+    def device_names(self) -> List[str]:
+        return list(self.devices())
+
+    def identifier(self, device_name: Optional[str]) -> Optional[Any]:
+        """Identifier of device with friendly name device_name, None if there's no such device or name is None."""
+        if device_name is None:
+            return None
+        return self.devices().get(device_name)
+
+    def refresh(self) -> bool:
+        """
+        Enumerate devices again right away.
+        :return: bool whether devices changed, devices_changed is emitted if they did
+        """
+        devices = self._enumerate()
+        if devices == self._devices:
+            return False
+
+        self._devices = devices
+        self.stats["changes"] += 1
+        logger.info(f"Audio devices changed, available: {list(devices)}")
+        self.devices_changed.emit()
+        return True
+
+    def _enumerate(self) -> Dict[str, Any]:
+        self.stats["enumerations"] += 1
+        try:
+            return self._enumerate_devices()
+        except Exception as e:  # noqa PyBroadException backend errors shouldn't take down playback
+            logger.warning(f"Can't enumerate audio devices: {e}")
+            return self._devices if self._devices is not None else {}
+
+    @classmethod
+    def _read_fingerprint(cls) -> Optional[Tuple[str, ...]]:
+        try:
+            return audio_outputs_fingerprint()
+        except Exception as e:  # noqa PyBroadException
+            logger.warning(f"Can't check audio devices: {e}")
+            return None
+
+    @QtCore.pyqtSlot()
+    def _poll(self):
+        if self._polling:
+            return
+
+        self._polling = True
+        self.stats["polls"] += 1
+        threading.Thread(
+            target=lambda: self._fingerprint_ready.emit(self._read_fingerprint()), name="audio device poll", daemon=True
+        ).start()
+
+    @QtCore.pyqtSlot(object)
+    def _on_fingerprint_ready(self, fingerprint: Optional[Tuple[str, ...]]):
+        self._polling = False
+        if fingerprint is None or fingerprint == self._fingerprint:
+            return
+
+        self._fingerprint = fingerprint
+        self.refresh()
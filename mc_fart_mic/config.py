@@ -1,11 +1,17 @@
+import os
 import json
+import time
+import atexit
 import logging
 from pathlib import Path
 from functools import partial
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
 from PyQt5 import QtCore
-from PyQt5.QtWidgets import QCheckBox, QSlider, QComboBox
+
+if TYPE_CHECKING:
+    # Only annotations, headless mode reads and saves config without ever importing widgets
+    from PyQt5.QtWidgets import QCheckBox, QSlider, QComboBox, QSpinBox
 
 
 logger = logging.getLogger(__name__)
@@ -17,29 +23,55 @@ class Config:
 
     You just need to call appropriate classmethod for your object and that's it.
     In the backend the classmethod will tie appropriate update method of that object and for each object state update
-    save that new state change to config file.
+    save that new state change to config file. Changes are batched, file is written once they stop coming for
+    FLUSH_DELAY_MS and on exit, call flush to write them right away.
 
     This classmethod will also restore object state when register method is called,
     if such object is found in saved config file.
 
     """
     PATH = Path("config.json")
+    # Changes are written to file once none came for this many ms, dragging a slider is a single write
+    FLUSH_DELAY_MS: int = 500
+
+    _config_data: Optional[dict] = None
+    _dirty = False
+    _flush_timer: Optional[QtCore.QTimer] = None
+    _metrics = {"updates": 0, "flushes": 0, "flush_errors": 0, "last_flush_ms": 0.0}
+
+    @classmethod
+    def _data(cls) -> dict:
+        """Config data, loaded from file on first access."""
+        if cls._config_data is None:
+            cls._config_data = cls._load()
+            atexit.register(cls.flush)
+        return cls._config_data
+
+    @classmethod
+    def _load(cls) -> dict:
+        try:
+            with open(cls.PATH) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            logger.info("Can't find config file, it will be created on first change.")
+        except Exception as e:  # noqa PyBroadException
+            logger.warning(f"Can't open config file: {e}, treating it as if it's empty.")
+        return {}
 
-    try:
-        with open(PATH) as f:
-            _config_data = json.load(f)
-    except FileNotFoundError:
-        logger.info("Can't find config file, creating new empty one.")
-        open(PATH, "w").close()
-        _config_data = {}
-    except Exception as e:  # noqa PyBroadException
-        logger.warning(f"Can't open config file: {e}, treating it as if it's empty.")
-        _config_data = {}
+    @classmethod
+    def get(cls, key: str, default: Any = None) -> Any:
+        """Get saved value of object by its nameID, for values that are needed before the object itself is created."""
+        return cls._data().get(key, default)
+
+    @classmethod
+    def set(cls, key: str, value: Any):
+        """Save value by nameID, for values changed without their object, saved the same way as registered ones."""
+        cls._config_data_update(lambda: key, lambda: value)
 
     @classmethod
-    def register_combobox(cls, combobox: QComboBox):
-        if combobox.objectName() in cls._config_data:
-            value = cls._config_data[combobox.objectName()]
+    def register_combobox(cls, combobox: "QComboBox"):
+        if combobox.objectName() in cls._data():
+            value = cls._data()[combobox.objectName()]
             item_index = combobox.findText(value, QtCore.Qt.MatchFixedString)
             if item_index >= 0:
                 combobox.setCurrentIndex(item_index)
@@ -48,25 +80,33 @@ class Config:
         combobox.currentTextChanged.connect(lambda _: action())
 
     @classmethod
-    def register_checkbox(cls, checkbox: QCheckBox):
-        if checkbox.objectName() in cls._config_data:
-            checkbox.setChecked(cls._config_data[checkbox.objectName()])
+    def register_checkbox(cls, checkbox: "QCheckBox"):
+        if checkbox.objectName() in cls._data():
+            checkbox.setChecked(cls._data()[checkbox.objectName()])
 
         action = partial(cls._config_data_update, checkbox.objectName, checkbox.isChecked)
         checkbox.stateChanged.connect(lambda _: action())
 
     @classmethod
-    def register_slider(cls, slider: QSlider):
-        if slider.objectName() in cls._config_data:
-            slider.setValue(cls._config_data[slider.objectName()])
+    def register_slider(cls, slider: "QSlider"):
+        if slider.objectName() in cls._data():
+            slider.setValue(cls._data()[slider.objectName()])
 
         action = partial(cls._config_data_update, slider.objectName, slider.value)
         slider.valueChanged.connect(lambda _: action())
 
+    @classmethod
+    def register_spinbox(cls, spinbox: "QSpinBox"):
+        if spinbox.objectName() in cls._data():
+            spinbox.setValue(cls._data()[spinbox.objectName()])
+
+        action = partial(cls._config_data_update, spinbox.objectName, spinbox.value)
+        spinbox.valueChanged.connect(lambda _: action())
+
     @classmethod
     def _config_data_update(cls, key_callable: Callable[[], str], value_callable: Callable[[], Any]):
         """
-        Update config values in memory and, since we updated, save them to config file.
+        Update config values in memory and schedule saving them to config file.
 
         :param key_callable: Callable that takes no arguments and when called should return a string
                              representing nameID of object.
@@ -74,9 +114,59 @@ class Config:
                                represent new set value for object tied to key_callable.
         """
         key, value = key_callable(), value_callable()
-        cls._config_data[key] = value
-        with open(cls.PATH, "w") as f:
-            try:
+        data = cls._data()
+        cls._metrics["updates"] += 1
+        if key in data and data[key] == value:
+            return
+
+        data[key] = value
+        cls._dirty = True
+        cls._schedule_flush()
+
+    @classmethod
+    def _schedule_flush(cls):
+        if QtCore.QCoreApplication.instance() is None:
+            # No event loop to run the timer, happens when config is used outside of the program (scripts)
+            return cls.flush()
+
+        if cls._flush_timer is None:
+            cls._flush_timer = QtCore.QTimer()
+            cls._flush_timer.setSingleShot(True)
+            cls._flush_timer.setInterval(cls.FLUSH_DELAY_MS)
+            cls._flush_timer.timeout.connect(cls.flush)
+        # Restarted on every change, so the file is written only after they stop coming
+        cls._flush_timer.start()
+
+    @classmethod
+    def flush(cls):
+        """
+        Save pending changes to config file now, does nothing if nothing changed since last save.
+        File is replaced atomically so it's never left half written, even if program crashes while saving.
+        """
+        if not cls._dirty:
+            return
+
+        if cls._flush_timer is not None:
+            cls._flush_timer.stop()
+
+        start = time.perf_counter()
+        temporary_path = cls.PATH.with_name(f"{cls.PATH.name}.tmp")
+        try:
+            with open(temporary_path, "w") as f:
                 json.dump(cls._config_data, f, indent=4)
-            except Exception as e:  # noqa PyBroadException
-                logger.error(f"Can't save config: {e}")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_path, cls.PATH)
+        except Exception as e:  # noqa PyBroadException
+            cls._metrics["flush_errors"] += 1
+            logger.error(f"Can't save config: {e}")
+            return
+
+        cls._dirty = False
+        cls._metrics["flushes"] += 1
+        cls._metrics["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    @classmethod
+    def metrics(cls) -> dict:
+        """Number of value updates, number of file writes they were batched into and duration of last write."""
+        return {**cls._metrics, "pending": cls._dirty}
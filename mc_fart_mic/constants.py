@@ -10,3 +10,6 @@ POSSIBLE_AUDIO_FORMATS: set = {
     ".m4p", ".mpc", ".ogg", ".oga", ".opus", ".wma", ".webm", ".avi",
     *SURE_SUPPORTED_AUDIO_FORMATS
 }
+
+# Available playback engines, first one is the default
+PLAYBACK_ENGINES = ("Media player", "Software mixer")
@@ -0,0 +1,185 @@
+import os
+import random
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set
+
+from PyQt5.QtCore import QFileSystemWatcher
+
+from constants import POSSIBLE_AUDIO_FORMATS
+
+if TYPE_CHECKING:
+    from sound_library import SoundLibrary
+
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryIndex:
+    """
+    List of all audio files found (recursively) in a directory.
+
+    Index is built once and rebuilt only when something in the directory tree was added, removed or renamed, which is
+    detected either by a file system watcher (see DirectoryIndexCache) or by comparing modification times of
+    directories.
+    Picking a random file from it is O(1).
+    If deduplicate is passed it's called with the directory and all found files, files are picked only from the ones it
+    returns.
+    """
+    def __init__(self, directory: str, deduplicate: Callable[[str, List[str]], List[str]] = None):
+        self.directory = directory
+        self.dirty = True
+        self.watched = False
+        self._deduplicate = deduplicate
+        self._all_files: List[str] = []
+        self._files: List[str] = []
+        self._directory_mtimes: Dict[str, int] = {}
+        self._shuffle_bag: List[int] = []
+        self._last_played_index: Optional[int] = None
+
+    @property
+    def files(self) -> List[str]:
+        return self._files
+
+    @property
+    def directories(self) -> List[str]:
+        return list(self._directory_mtimes)
+
+    def rebuild(self):
+        """Walk the whole directory tree and collect audio files and modification times of each directory."""
+        files, directory_mtimes = [], {}
+        to_visit = [self.directory]
+        while to_visit:
+            directory = to_visit.pop()
+            try:
+                directory_mtimes[directory] = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            to_visit.append(entry.path)
+                        elif os.path.splitext(entry.name)[1] in POSSIBLE_AUDIO_FORMATS and entry.is_file():
+                            files.append(entry.path)
+            except OSError as e:
+                logger.warning(f"Can't index directory '{directory}': {e}")
+
+        self._all_files, self._directory_mtimes = files, directory_mtimes
+        self.deduplicate()
+        self.dirty = False
+
+    def deduplicate(self):
+        """Pick files again from all found files, for example once duplicates among them are known."""
+        files = self._deduplicate(self.directory, self._all_files) if self._deduplicate else self._all_files
+        if files != self._files:
+            self._files = files
+            self._shuffle_bag.clear()
+            self._last_played_index = None
+
+    def is_stale(self) -> bool:
+        """
+        Check if any directory in the tree changed since the index was built.
+        Adding, removing or renaming entries changes modification time of the directory that holds them.
+        """
+        if self.dirty:
+            return True
+        elif self.watched:
+            return False
+
+        for directory, mtime in self._directory_mtimes.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def random_file(self, *, no_repeat: bool = False) -> Optional[str]:
+        """
+        Returns random audio file from directory, rebuilding the index first if it's stale.
+        :param no_repeat: if True files are picked from a shuffle bag, so each file is played once before any of them
+                          repeats and the same file is never played twice in a row.
+        :return: str path of file or None if directory contains no audio files
+        """
+        if self.is_stale():
+            self.rebuild()
+
+        if not self._files:
+            return None
+        elif not no_repeat:
+            return random.choice(self._files)
+
+        if not self._shuffle_bag:
+            self._shuffle_bag = list(range(len(self._files)))
+            random.shuffle(self._shuffle_bag)
+            # Next pick is from the end, make sure the new bag doesn't start with the file that was just played
+            if len(self._shuffle_bag) > 1 and self._shuffle_bag[-1] == self._last_played_index:
+                self._shuffle_bag[0], self._shuffle_bag[-1] = self._shuffle_bag[-1], self._shuffle_bag[0]
+
+        self._last_played_index = self._shuffle_bag.pop()
+        return self._files[self._last_played_index]
+
+
+class DirectoryIndexCache:
+    """
+    Keeps DirectoryIndex for each directory hotkey.
+
+    Indexed directories are watched for changes so playing from them doesn't even need to check the disk,
+    if the watcher can't watch some directory (for example OS limit is reached) that index falls back to checking
+    modification times of its directories.
+    If sound library is passed each directory is scanned by it in background whenever its index is rebuilt, once the
+    scan is done duplicate files are left out of the index.
+    """
+    def __init__(self, sound_library: "SoundLibrary" = None):
+        self._indexes: Dict[str, DirectoryIndex] = {}
+        self._sound_library = sound_library
+        if sound_library is not None:
+            sound_library.directory_scanned.connect(self._on_directory_scanned)
+        self._watcher = QFileSystemWatcher()
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        # Multiple directory hotkeys can point to same or nested directories
+        self._watched_directory_owners: Dict[str, Set[DirectoryIndex]] = {}
+
+    def get(self, directory: str) -> DirectoryIndex:
+        index = self._indexes.get(directory)
+        if index is None:
+            index = self._indexes[directory] = DirectoryIndex(
+                directory, self._sound_library.unique_files if self._sound_library is not None else None
+            )
+        return index
+
+    def random_file(self, directory: str, *, no_repeat: bool = False) -> Optional[str]:
+        index = self.get(directory)
+        was_stale = index.is_stale()
+        random_file = index.random_file(no_repeat=no_repeat)
+        if was_stale:
+            self._watch(index)
+            if self._sound_library is not None:
+                self._sound_library.scan([directory])
+        return random_file
+
+    def _watch(self, index: DirectoryIndex):
+        directories = index.directories
+        for directory in directories:
+            self._watched_directory_owners.setdefault(directory, set()).add(index)
+
+        already_watched = set(self._watcher.directories())
+        new_directories = [directory for directory in directories if directory not in already_watched]
+        failed = self._watcher.addPaths(new_directories) if new_directories else []
+        index.watched = not failed
+
+    def _on_directory_changed(self, directory: str):
+        for index in self._watched_directory_owners.get(directory, ()):
+            index.dirty = True
+
+    def _on_directory_scanned(self, directory: str):
+        index = self._indexes.get(directory)
+        if index is not None and not index.dirty:
+            index.deduplicate()
+
+    def clear(self):
+        """Forget all indexes, for example when different profile is loaded."""
+        directories = self._watcher.directories()
+        if directories:
+            self._watcher.removePaths(directories)
+        self._watched_directory_owners.clear()
+        self._indexes.clear()
+        if self._sound_library is not None:
+            self._sound_library.clear()
@@ -0,0 +1,106 @@
+"""
+Headless mode: hotkeys, keywords, trigger server and playback of the active profile, without any windows.
+Runs on QCoreApplication and never imports QtWidgets, start it with `main_menu.py --headless` or run this module.
+"""
+import time
+# Before any other import so startup profiling includes time spent importing modules
+IMPORTS_STARTED = time.perf_counter()
+
+import sys
+import signal
+import logging
+import argparse
+import multiprocessing
+from pathlib import Path
+
+from PyQt5 import QtCore
+
+from startup_profiler import StartupProfiler
+from trigger_server import DEFAULT_TRIGGER_SERVER_ADDRESS
+
+
+# Python signal handlers run only between bytecodes, event loop is woken up this often so Ctrl+C quits promptly
+SIGNAL_CHECK_INTERVAL_MS: int = 250
+
+
+def argument_parser() -> argparse.ArgumentParser:
+    """Command line arguments of the program, the same in both modes."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--headless", action="store_true",
+        help="run without any windows, only hotkeys and playback of the last loaded profile"
+    )
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="print how long each startup phase took, until the main window is interactive"
+    )
+    parser.add_argument(
+        "--exit-after-startup", action="store_true",
+        help="exit as soon as the program is up, with --profile-startup to measure startup time and memory"
+    )
+    parser.add_argument(
+        "--profile-runtime", action="store_true",
+        help="sample where time goes in all threads and track memory until exit, results are written next to log.txt"
+    )
+    parser.add_argument(
+        "--trigger-server", nargs="?", const=DEFAULT_TRIGGER_SERVER_ADDRESS, metavar="ADDRESS",
+        help=(
+            "let scripts trigger sounds trough a local socket, ADDRESS is 'host:port', 'port' or a Unix socket path "
+            f"(default {DEFAULT_TRIGGER_SERVER_ADDRESS})"
+        )
+    )
+    return parser
+
+
+def main(imports_started: float = IMPORTS_STARTED) -> int:
+    logging.basicConfig(
+        filename="log.txt", level=logging.INFO, format="%(asctime)s - %(levelname)s %(name)s - %(message)s"
+    )
+    multiprocessing.freeze_support()
+    arguments, qt_arguments = argument_parser().parse_known_args()
+    startup = StartupProfiler(arguments.profile_startup, started=imports_started)
+
+    # Imported here so the time it takes is part of the profiled startup
+    from sound_board import SoundBoard
+    from saved_settings import SavedSettings
+    startup.mark("imports")
+
+    Path(SoundBoard.PROFILES_DIRECTORY).mkdir(exist_ok=True)
+    app = QtCore.QCoreApplication(sys.argv[:1] + qt_arguments)
+    startup.mark("application")
+
+    sound_board = SoundBoard()
+    sound_board.create_sound_board(startup)
+    if arguments.profile_runtime:
+        sound_board.runtime_profiler.start()
+    profile_name = sound_board.saved_profile_name()
+    sound_board.profile = sound_board.load_profile(profile_name)
+    startup.mark("profile load")
+
+    sound_board.refresh_profile()
+    if arguments.trigger_server is not None:
+        sound_board.start_trigger_server(arguments.trigger_server)
+    startup.mark("hotkey registration")
+    logging.info(f"Running headless with profile '{profile_name}' ({len(sound_board.profile)} hotkeys).")
+
+    # Needs device enumeration which is slow, so it's done once the event loop runs
+    QtCore.QTimer.singleShot(0, lambda: SavedSettings.apply_saved_devices(sound_board.player_pool_manager))
+
+    def on_first_event_loop_iteration():
+        startup.mark("first event loop iteration")
+        if startup.enabled:
+            startup.log_report()
+        if arguments.exit_after_startup:
+            app.quit()
+
+    QtCore.QTimer.singleShot(0, on_first_event_loop_iteration)
+    signal.signal(signal.SIGINT, lambda _signal, _frame: app.quit())
+    signal_check_timer = QtCore.QTimer()
+    signal_check_timer.timeout.connect(lambda: None)
+    signal_check_timer.start(SIGNAL_CHECK_INTERVAL_MS)
+
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
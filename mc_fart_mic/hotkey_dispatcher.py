@@ -0,0 +1,154 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from PyQt5 import QtCore
+
+from hotkey_entry import HotkeyEntry
+from latency_tracing import LatencyTracer, TriggerTrace, STAGE_DISPATCH
+
+
+logger = logging.getLogger(__name__)
+
+# What to do with a new trigger when the queue is full
+DROP_NEWEST = "newest"
+DROP_OLDEST = "oldest"
+
+DEFAULT_MAX_QUEUE_SIZE: int = 32
+DEFAULT_REPEAT_WINDOW_MS: int = 150
+DEFAULT_COOLDOWN_MS: int = 0
+DEFAULT_RATE_LIMIT_PER_SECOND: int = 0
+DEFAULT_RATE_LIMIT_BURST: int = 3
+
+Trigger = Tuple[HotkeyEntry, Optional[TriggerTrace]]
+
+
+class _HotkeyState:
+    """Per hotkey entry timestamps (time.monotonic) and token bucket."""
+    __slots__ = ("last_seen", "last_accepted", "tokens", "tokens_updated")
+
+    def __init__(self, now: float, tokens: float):
+        self.last_seen = None
+        self.last_accepted = None
+        self.tokens = tokens
+        self.tokens_updated = now
+
+
+class HotkeyDispatcher(QtCore.QObject):
+    """
+    Moves hotkey triggers from the keyboard hook thread to the Qt GUI thread trough a bounded queue.
+
+    Hook callback only timestamps the trigger, filters it and appends it to the queue, all playing is done later on
+    the GUI thread. Triggers are filtered per hotkey entry (hotkey can have multiple entries, each plays):
+        - repeats: triggers that come within repeat window of previous one are coalesced, so holding a key down
+          (keyboard auto-repeat) plays the sound once
+        - cooldown: minimum time between two accepted triggers (hotkey entry can override it)
+        - rate limit: token bucket allowing rate_limit_per_second triggers with bursts of up to rate_limit_burst
+    If the queue is full the oldest or the newest trigger is dropped, based on drop_policy.
+    """
+    _triggers_queued = QtCore.pyqtSignal()
+
+    def __init__(
+            self, handler: Callable[[HotkeyEntry, Optional[TriggerTrace]], None], *,
+            latency_tracer: LatencyTracer = None, max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+            drop_policy: str = DROP_OLDEST
+    ):
+        super().__init__()
+        self._handler = handler
+        self._latency_tracer = latency_tracer
+        self._max_queue_size = max_queue_size
+        self._drop_policy = drop_policy
+        self.repeat_window_ms = DEFAULT_REPEAT_WINDOW_MS
+        self.cooldown_ms = DEFAULT_COOLDOWN_MS
+        self.rate_limit_per_second = DEFAULT_RATE_LIMIT_PER_SECOND
+        self.rate_limit_burst = DEFAULT_RATE_LIMIT_BURST
+
+        self._lock = threading.Lock()
+        self._queue: Deque[Trigger] = deque()
+        self._hotkey_states: Dict[HotkeyEntry, _HotkeyState] = {}
+        self._drain_scheduled = False
+        self.stats = {"submitted": 0, "coalesced": 0, "cooldown": 0, "rate_limited": 0, "dropped": 0, "dispatched": 0}
+
+        # Queued connection, emitting from hook thread runs the slot on the thread this object lives in (GUI thread)
+        self._triggers_queued.connect(self._drain, QtCore.Qt.QueuedConnection)
+
+    def submit(self, entry: HotkeyEntry, *, coalesce_repeats: bool = True) -> bool:
+        """
+        Called from keyboard hook thread for each hotkey event, returns as soon as possible.
+        :param coalesce_repeats: False for triggers that can't come from a key held down, like trigger server requests
+        :return: bool whether trigger was queued
+        """
+        trace = self._latency_tracer.start(entry.hotkey) if self._latency_tracer is not None else None
+        now = time.monotonic()
+        with self._lock:
+            self.stats["submitted"] += 1
+            if not self._accept(entry, now, coalesce_repeats):
+                return False
+
+            if len(self._queue) >= self._max_queue_size:
+                self.stats["dropped"] += 1
+                if self._drop_policy == DROP_NEWEST:
+                    return False
+                self._queue.popleft()
+
+            self._queue.append((entry, trace))
+            schedule_drain = not self._drain_scheduled
+            self._drain_scheduled = True
+
+        if schedule_drain:
+            self._triggers_queued.emit()
+        return True
+
+    def _accept(self, entry: HotkeyEntry, now: float, coalesce_repeats: bool = True) -> bool:
+        """Apply repeat coalescing, cooldown and rate limit to a trigger, must be called with lock held."""
+        state = self._hotkey_states.get(entry)
+        if state is None:
+            state = self._hotkey_states[entry] = _HotkeyState(now, self.rate_limit_burst)
+
+        if coalesce_repeats:
+            # Window slides with every repeat so key held down for long is still a single trigger
+            last_seen, state.last_seen = state.last_seen, now
+            if last_seen is not None and (now - last_seen) * 1000 < self.repeat_window_ms:
+                self.stats["coalesced"] += 1
+                return False
+
+        cooldown_ms = self.cooldown_ms if entry.cooldown_ms is None else entry.cooldown_ms
+        if state.last_accepted is not None and (now - state.last_accepted) * 1000 < cooldown_ms:
+            self.stats["cooldown"] += 1
+            return False
+
+        if self.rate_limit_per_second:
+            elapsed = now - state.tokens_updated
+            state.tokens = min(self.rate_limit_burst, state.tokens + elapsed * self.rate_limit_per_second)
+            state.tokens_updated = now
+            if state.tokens < 1:
+                self.stats["rate_limited"] += 1
+                return False
+            state.tokens -= 1
+
+        state.last_accepted = now
+        return True
+
+    @QtCore.pyqtSlot()
+    def _drain(self):
+        with self._lock:
+            triggers: List[Trigger] = list(self._queue)
+            self._queue.clear()
+            self._drain_scheduled = False
+            self.stats["dispatched"] += len(triggers)
+
+        for entry, trace in triggers:
+            if trace is not None:
+                trace.mark(STAGE_DISPATCH)
+            try:
+                self._handler(entry, trace)
+            except Exception:  # noqa PyBroadException one bad trigger shouldn't drop the rest of the batch
+                logger.exception(f"Failed to play hotkey '{entry.hotkey}'")
+
+    def reset(self):
+        """Forget queued triggers and per hotkey entry state, for example when different profile is loaded."""
+        with self._lock:
+            self._queue.clear()
+            self._hotkey_states.clear()
@@ -0,0 +1,66 @@
+from typing import Optional, Union
+
+
+DEFAULT_PRIORITY: int = 0
+# Range priority can be set to when adding a hotkey
+MIN_PRIORITY: int = -10
+MAX_PRIORITY: int = 10
+
+
+class HotkeyEntry:
+    """
+    Sound file/directory bound to a hotkey together with its playback options.
+
+    Priority decides which sound gets cut first when voice stealing policy is by priority, starting a sound that has
+    a choke group instantly stops all other sounds playing in the same group.
+    Cooldown is minimum time in ms between two triggers of the hotkey, None uses cooldown from settings.
+    Start offset is position in ms the sound starts playing from, None uses measured end of leading silence if skipping
+    it is enabled in settings.
+    Keyword, if set, also triggers the entry when it's typed.
+    Entry id is set once the entry is saved to profile store.
+    In profile json entries without any options are saved as plain path string, same as in older profiles.
+    """
+    __slots__ = ("hotkey", "sound_path", "priority", "choke_group", "cooldown_ms", "start_offset_ms", "keyword",
+                 "entry_id")
+
+    def __init__(
+            self, hotkey: str, sound_path: str, *,
+            priority: int = DEFAULT_PRIORITY, choke_group: str = None, cooldown_ms: int = None,
+            start_offset_ms: int = None, keyword: str = None, entry_id: int = None
+    ):
+        self.hotkey = hotkey
+        self.sound_path = sound_path
+        self.priority = priority
+        self.choke_group: Optional[str] = choke_group or None
+        self.cooldown_ms: Optional[int] = cooldown_ms
+        self.start_offset_ms: Optional[int] = start_offset_ms
+        self.keyword: Optional[str] = keyword or None
+        self.entry_id: Optional[int] = entry_id
+
+    @classmethod
+    def from_json(cls, hotkey: str, value: Union[str, dict]) -> "HotkeyEntry":
+        if isinstance(value, str):
+            return cls(hotkey, value)
+
+        return cls(
+            hotkey, value["sound"],
+            priority=value.get("priority", DEFAULT_PRIORITY), choke_group=value.get("choke_group"),
+            cooldown_ms=value.get("cooldown_ms"), start_offset_ms=value.get("start_offset_ms"),
+            keyword=value.get("keyword")
+        )
+
+    def to_json(self) -> Union[str, dict]:
+        options = (self.choke_group, self.cooldown_ms, self.start_offset_ms, self.keyword)
+        if self.priority == DEFAULT_PRIORITY and all(option is None for option in options):
+            return self.sound_path
+
+        value = {"sound": self.sound_path, "priority": self.priority}
+        if self.choke_group is not None:
+            value["choke_group"] = self.choke_group
+        if self.cooldown_ms is not None:
+            value["cooldown_ms"] = self.cooldown_ms
+        if self.start_offset_ms is not None:
+            value["start_offset_ms"] = self.start_offset_ms
+        if self.keyword is not None:
+            value["keyword"] = self.keyword
+        return value
@@ -0,0 +1,92 @@
+import logging
+from typing import Callable, Dict, List, Tuple
+
+import keyboard
+
+from hotkey_entry import HotkeyEntry
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Binding:
+    """Registered keyboard hotkey, the entry it triggers can be swapped without registering the hotkey again."""
+    __slots__ = ("entry", "handle")
+
+    def __init__(self, entry: HotkeyEntry):
+        self.entry = entry
+        self.handle = None
+
+
+class HotkeyRegistry:
+    """
+    Keeps keyboard hotkeys registered for entries of the loaded profile.
+
+    Setting new entries only registers hotkeys that weren't registered before and removes ones that are no longer
+    used, hotkeys that stay only get their entry swapped. So switching between profiles costs keyboard hook work
+    proportional to the number of changed hotkeys, and hotkeys are added before old ones are removed so there is no
+    moment when no hotkey works. Other keyboard hooks (like typed keywords) are never touched.
+    """
+    def __init__(self, callback: Callable[[HotkeyEntry], None]):
+        self._callback = callback
+        self._bindings: Dict[str, List[_Binding]] = {}
+
+    def _trigger(self, binding: _Binding):
+        self._callback(binding.entry)
+
+    def _register(self, entry: HotkeyEntry) -> _Binding:
+        binding = _Binding(entry)
+        binding.handle = keyboard.add_hotkey(entry.hotkey, self._trigger, args=(binding,))
+        self._bindings.setdefault(entry.hotkey, []).append(binding)
+        return binding
+
+    @classmethod
+    def _unregister(cls, binding: _Binding):
+        try:
+            keyboard.remove_hotkey(binding.handle)
+        except (KeyError, ValueError):
+            logger.warning(f"Hotkey '{binding.entry.hotkey}' was already removed.")
+
+    def add(self, entry: HotkeyEntry):
+        """Register a single new entry, hotkey can already have other entries."""
+        self._register(entry)
+
+    def set_entries(self, entries: List[HotkeyEntry]) -> Tuple[int, int, int]:
+        """
+        Make registered hotkeys match entries.
+        :return: tuple of number of added, removed and reused hotkey registrations
+        """
+        entries_by_hotkey: Dict[str, List[HotkeyEntry]] = {}
+        for entry in entries:
+            entries_by_hotkey.setdefault(entry.hotkey, []).append(entry)
+
+        added, reused, surplus = 0, 0, []
+        for hotkey, bindings in self._bindings.items():
+            new_entries = entries_by_hotkey.get(hotkey, ())
+            for binding, entry in zip(bindings, new_entries):
+                binding.entry = entry
+            reused += min(len(bindings), len(new_entries))
+            surplus.extend(bindings[len(new_entries):])
+
+        for hotkey, new_entries in entries_by_hotkey.items():
+            registered_count = len(self._bindings.get(hotkey, ()))
+            for entry in new_entries[registered_count:]:
+                self._register(entry)
+                added += 1
+
+        # Removed only after new ones are added
+        for binding in surplus:
+            self._unregister(binding)
+            bindings = self._bindings[binding.entry.hotkey]
+            bindings.remove(binding)
+            if not bindings:
+                del self._bindings[binding.entry.hotkey]
+
+        logger.info(f"Hotkeys updated: {added} added, {len(surplus)} removed, {reused} kept.")
+        return added, len(surplus), reused
+
+    def clear(self):
+        self.set_entries([])
+
+    def __len__(self) -> int:
+        return sum(len(bindings) for bindings in self._bindings.values())
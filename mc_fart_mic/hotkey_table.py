@@ -0,0 +1,250 @@
+from functools import partial
+from typing import Any, Callable, List, Optional, Tuple
+
+from PyQt5 import QtCore
+from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtWidgets import QTableView, QHeaderView, QAbstractItemView
+
+from hotkey_entry import HotkeyEntry
+from profile_store import ProfileStore
+
+
+class HotkeyTableModel(QtCore.QAbstractTableModel):
+    """
+    Hotkey entries of loaded profile as table rows (hotkey, sound path), optionally filtered by search text.
+
+    Search is case insensitive substring search over hotkey and path. Results of the previous searches are kept while
+    search text is being typed: if new text contains previous one only previous results are searched, and deleting
+    characters goes back to results that were already found, so typing stays fast even with tens of thousands entries.
+
+    Entries of a profile are read from profile store a page at a time as the view scrolls to them (canFetchMore and
+    fetchMore), searching reads the rest of them as it has to look at every entry.
+    """
+    HEADERS = ("Hotkey", "Sound")
+    COLUMN_HOTKEY = 0
+    COLUMN_SOUND = 1
+    # Rows read from profile store at once, a few screens worth
+    PAGE_SIZE = 200
+
+    def __init__(self, parent: QtCore.QObject = None):
+        super().__init__(parent)
+        self._entries: List[HotkeyEntry] = []
+        self._search_keys: List[str] = []
+        # Row numbers of entries matching the filter, in order, None when there's no filter
+        self._visible_rows: Optional[List[int]] = None
+        # Previous searches as (text, matching rows) where each text contains the one before it
+        self._searches: List[Tuple[str, List[int]]] = []
+        self._filter_text = ""
+        # Reads page of entries after entry id, None once every entry of the profile is in the model
+        self._fetch_page: Optional[Callable[..., List[HotkeyEntry]]] = None
+        self._last_entry_id = 0
+        # Views can ask for more rows while a page is being inserted, that page is read only once
+        self._fetching = False
+
+    @classmethod
+    def _search_key(cls, entry: HotkeyEntry) -> str:
+        return f"{entry.hotkey}\n{entry.sound_path}".lower()
+
+    def set_entries(self, entries: List[HotkeyEntry]):
+        """Show entries that are already in memory."""
+        self.beginResetModel()
+        self._fetch_page = None
+        self._entries = list(entries)
+        self._search_keys = [self._search_key(entry) for entry in self._entries]
+        self._searches.clear()
+        self._visible_rows = self._search(self._filter_text)
+        self.endResetModel()
+
+    def set_profile(self, profile_store: ProfileStore, profile_name: str):
+        """Show entries of profile, they are read from profile store page by page as they are scrolled to."""
+        self.beginResetModel()
+        self._fetch_page = partial(profile_store.entries_page, profile_name, limit=self.PAGE_SIZE)
+        self._last_entry_id = 0
+        self._entries = []
+        self._search_keys = []
+        self._searches.clear()
+        if self._filter_text:
+            self._fetch_remaining()
+        self._visible_rows = self._search(self._filter_text)
+        self.endResetModel()
+
+    def _next_page(self) -> List[HotkeyEntry]:
+        page = self._fetch_page(after_id=self._last_entry_id)
+        if not page:
+            self._fetch_page = None
+        return page
+
+    def _add_page(self, page: List[HotkeyEntry]):
+        self._last_entry_id = page[-1].entry_id
+        self._entries.extend(page)
+        self._search_keys.extend(self._search_key(entry) for entry in page)
+
+    def _fetch_remaining(self):
+        """Read all entries that weren't read yet, without notifying views."""
+        while self._fetch_page is not None:
+            page = self._next_page()
+            if page:
+                self._add_page(page)
+
+    def canFetchMore(self, parent: QtCore.QModelIndex) -> bool:
+        return not parent.isValid() and self._fetch_page is not None and not self._fetching
+
+    def fetchMore(self, parent: QtCore.QModelIndex):
+        # Filtering reads every entry, so rows are only ever fetched unfiltered
+        if not self.canFetchMore(parent):
+            return
+        page = self._next_page()
+        if page:
+            first_row = len(self._entries)
+            self._fetching = True
+            try:
+                self.beginInsertRows(QtCore.QModelIndex(), first_row, first_row + len(page) - 1)
+                self._add_page(page)
+                self.endInsertRows()
+            finally:
+                self._fetching = False
+
+    def append_entry(self, entry: HotkeyEntry):
+        """Show entry just added to the profile."""
+        if self._fetch_page is not None:
+            # Entry was saved after every entry read so far, it comes with one of the next pages
+            return
+
+        entry_row = len(self._entries)
+        search_key = self._search_key(entry)
+        if self._visible_rows is None:
+            visible_row = entry_row
+        elif self._filter_text in search_key:
+            visible_row = len(self._visible_rows)
+        else:
+            visible_row = None
+
+        # Views are told about the row before the model changes, as Qt expects
+        if visible_row is not None:
+            self.beginInsertRows(QtCore.QModelIndex(), visible_row, visible_row)
+        self._entries.append(entry)
+        self._search_keys.append(search_key)
+        # Last search is the visible one, so filtered row is appended trough it
+        for text, rows in self._searches:
+            if text in search_key:
+                rows.append(entry_row)
+        if visible_row is not None:
+            self.endInsertRows()
+
+    def entry(self, row: int) -> HotkeyEntry:
+        return self._entries[row if self._visible_rows is None else self._visible_rows[row]]
+
+    @QtCore.pyqtSlot(str)
+    def set_filter(self, text: str):
+        text = text.strip().lower()
+        if text == self._filter_text:
+            return
+
+        self.beginResetModel()
+        self._filter_text = text
+        if text:
+            self._fetch_remaining()
+        self._visible_rows = self._search(text)
+        self.endResetModel()
+
+    def _search(self, text: str) -> Optional[List[int]]:
+        if not text:
+            self._searches.clear()
+            return None
+
+        # Drop searches the new text doesn't build upon, what remains is a chain of narrower and narrower results
+        while self._searches and self._searches[-1][0] not in text:
+            self._searches.pop()
+        if self._searches and self._searches[-1][0] == text:
+            return self._searches[-1][1]
+
+        candidates = self._searches[-1][1] if self._searches else range(len(self._search_keys))
+        search_keys = self._search_keys
+        rows = [row for row in candidates if text in search_keys[row]]
+        self._searches.append((text, rows))
+        return rows
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._entries) if self._visible_rows is None else len(self._visible_rows)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole) -> Any:
+        if role not in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole) or not index.isValid():
+            return None
+
+        entry = self.entry(index.row())
+        return entry.hotkey if index.column() == self.COLUMN_HOTKEY else entry.sound_path
+
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole) -> Any:
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+
+class HotkeyTableView(QTableView):
+    """
+    Table of hotkey entries, only visible rows are ever drawn so profile size doesn't matter.
+    Hovered cell is colored green, clicking on sound path emits left/right clicked signal with clicked entry.
+    Moving mouse onto another row emits entry hovered signal with entry of that row.
+    """
+    entry_left_clicked = QtCore.pyqtSignal(object)
+    entry_right_clicked = QtCore.pyqtSignal(object)
+    entry_hovered = QtCore.pyqtSignal(object)
+
+    ROW_HEIGHT = 22
+    HOTKEY_COLUMN_WIDTH = 150
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.setShowGrid(False)
+        self.setWordWrap(False)
+        self.setMouseTracking(True)
+        self.setStyleSheet("QTableView::item:hover { color: green; }")
+
+        font = self.font()
+        font.setPointSize(11)
+        self.setFont(font)
+
+        # Fixed row height and column widths, sizing to contents would have to look at every row
+        vertical_header = self.verticalHeader()
+        vertical_header.setVisible(False)
+        vertical_header.setSectionResizeMode(QHeaderView.Fixed)
+        vertical_header.setDefaultSectionSize(self.ROW_HEIGHT)
+        horizontal_header = self.horizontalHeader()
+        horizontal_header.setSectionResizeMode(QHeaderView.Interactive)
+        horizontal_header.setDefaultSectionSize(self.HOTKEY_COLUMN_WIDTH)
+        horizontal_header.setStretchLastSection(True)
+
+        # Mouse moves are reported many times per row, signal is emitted only when the row changes
+        self._hovered_row = -1
+
+    def mouseMoveEvent(self, event: QMouseEvent):
+        super().mouseMoveEvent(event)
+        row = self.indexAt(event.pos()).row()
+        if row != self._hovered_row:
+            self._hovered_row = row
+            if row >= 0:
+                self.entry_hovered.emit(self.model().entry(row))
+
+    def leaveEvent(self, event: QtCore.QEvent):
+        super().leaveEvent(event)
+        self._hovered_row = -1
+
+    def mouseReleaseEvent(self, event: QMouseEvent):
+        super().mouseReleaseEvent(event)
+        index = self.indexAt(event.pos())
+        if not index.isValid() or index.column() != HotkeyTableModel.COLUMN_SOUND:
+            return
+
+        entry = self.model().entry(index.row())
+        if event.button() == QtCore.Qt.LeftButton:
+            self.entry_left_clicked.emit(entry)
+        elif event.button() == QtCore.Qt.RightButton:
+            self.entry_right_clicked.emit(entry)
@@ -0,0 +1,245 @@
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+import keyboard
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_KEYWORD_LENGTH: int = 7
+MAX_MAX_KEYWORD_LENGTH: int = 20
+
+# Key names (as reported by keyboard library) that are typed as characters or edit the typed text
+_KEY_NAME_CHARACTERS = {"space": " "}
+_KEY_NAME_BACKSPACE = "backspace"
+# Keys that don't break the typed word, anything else that is not a character (enter, arrows...) resets the buffer
+_IGNORED_KEY_NAMES = {
+    "shift", "right shift", "left shift", "caps lock", "alt gr", "ctrl", "right ctrl", "left ctrl", "alt", "right alt",
+    "left alt"
+}
+
+
+class _TrieNode:
+    __slots__ = ("children", "payload")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.payload: Any = None
+
+
+class _CompiledAutomaton:
+    """
+    Read only snapshot of the keyword trie with Aho-Corasick failure links, used for matching.
+
+    Nodes are referenced by index, root is 0. Transitions that go trough failure links are memoized per node so after
+    the first time a (state, character) pair is seen a step is a single dict lookup no matter the number of keywords.
+    Matching runs on keyboard hook thread, the snapshot is only ever replaced as a whole so it needs no locking.
+    """
+    __slots__ = ("_goto", "_fail", "_outputs", "_delta")
+
+    def __init__(self, root: _TrieNode):
+        nodes = [root]
+        self._goto: List[Dict[str, int]] = []
+        for node in nodes:
+            goto = {}
+            for character, child in node.children.items():
+                goto[character] = len(nodes)
+                nodes.append(child)
+            self._goto.append(goto)
+
+        self._fail: List[int] = [0] * len(nodes)
+        # Payloads of all keywords that end in this node, including ones reachable trough failure links
+        self._outputs: List[Tuple[Any, ...]] = [()] * len(nodes)
+        self._delta: List[Dict[str, int]] = [{} for _ in nodes]
+
+        # Nodes are numbered breadth first and failure link always points to a shallower node, so it's already done
+        for state, goto in enumerate(self._goto):
+            for character, child in goto.items():
+                fail = 0
+                if state != 0:
+                    fail = self._fail[state]
+                    while character not in self._goto[fail] and fail != 0:
+                        fail = self._fail[fail]
+                    fail = self._goto[fail].get(character, 0)
+                self._fail[child] = fail
+                payload = nodes[child].payload
+                self._outputs[child] = ((payload,) if payload is not None else ()) + self._outputs[fail]
+
+    def step(self, state: int, character: str) -> int:
+        next_state = self._delta[state].get(character)
+        if next_state is not None:
+            return next_state
+
+        current = state
+        while True:
+            next_state = self._goto[current].get(character)
+            if next_state is not None or current == 0:
+                break
+            current = self._fail[current]
+        next_state = 0 if next_state is None else next_state
+        self._delta[state][character] = next_state
+        return next_state
+
+    def outputs(self, state: int) -> Tuple[Any, ...]:
+        return self._outputs[state]
+
+
+class KeywordMatcher:
+    """
+    Triggers callback when any of the keywords is typed, keywords are matched anywhere in typed text, case insensitive.
+
+    Keywords are kept in a trie which is updated incrementally, only keywords that were added or removed since last
+    set_keywords call touch the trie, and nothing is recompiled if keyword set didn't change. Matching uses
+    Aho-Corasick automaton compiled from the trie so cost per keystroke is constant.
+
+    Last max_keyword_length typed characters are kept in a rolling buffer, they are used to edit typed text with
+    backspace and to continue matching with a new automaton after keywords change. Keywords longer than the buffer
+    can never be matched so they are skipped, max length of 0 disables the feature.
+    """
+    def __init__(self, on_match: Callable[[Any], None], max_keyword_length: int = DEFAULT_MAX_KEYWORD_LENGTH):
+        self._on_match = on_match
+        self._lock = threading.Lock()
+        self._root = _TrieNode()
+        self._keywords: Dict[str, Any] = {}
+        self._active_keywords: Dict[str, Any] = {}
+        self._automaton = _CompiledAutomaton(self._root)
+        self._state = 0
+        self._buffer: Deque[str] = deque(maxlen=max_keyword_length)
+        self._hook = None
+
+    @property
+    def max_keyword_length(self) -> int:
+        return self._buffer.maxlen
+
+    @max_keyword_length.setter
+    def max_keyword_length(self, value: int):
+        if value == self._buffer.maxlen:
+            return
+
+        with self._lock:
+            self._buffer = deque(self._buffer, maxlen=value)
+        self.set_keywords(self._keywords)
+
+    @property
+    def keyword_count(self) -> int:
+        return len(self._active_keywords)
+
+    def set_keywords(self, keywords: Dict[str, Any]):
+        """
+        Set keywords to match, mapping keyword to payload that is passed to on_match callback.
+        :param keywords: dict keyword: payload, payload can't be None
+        """
+        self._keywords = {keyword.lower(): payload for keyword, payload in keywords.items() if keyword}
+        active_keywords = {
+            keyword: payload for keyword, payload in self._keywords.items() if len(keyword) <= self.max_keyword_length
+        }
+
+        changed = False
+        for keyword in self._active_keywords.keys() - active_keywords.keys():
+            self._remove(keyword)
+            changed = True
+        for keyword, payload in active_keywords.items():
+            if self._active_keywords.get(keyword) is not payload:
+                self._add(keyword, payload)
+                changed = True
+        self._active_keywords = active_keywords
+
+        if not changed:
+            return
+
+        automaton = _CompiledAutomaton(self._root)
+        with self._lock:
+            self._automaton = automaton
+            self._rewind()
+        logger.info(f"Keyword automaton compiled with {len(active_keywords)} keywords.")
+
+    def _add(self, keyword: str, payload: Any):
+        node = self._root
+        for character in keyword:
+            child = node.children.get(character)
+            if child is None:
+                child = node.children[character] = _TrieNode()
+            node = child
+        node.payload = payload
+
+    def _remove(self, keyword: str):
+        path = [self._root]
+        for character in keyword:
+            path.append(path[-1].children[character])
+        path[-1].payload = None
+
+        # Prune branch that no longer leads to any keyword
+        for depth in range(len(keyword), 0, -1):
+            node = path[depth]
+            if node.children or node.payload is not None:
+                break
+            del path[depth - 1].children[keyword[depth - 1]]
+
+    def _rewind(self):
+        """Recompute automaton state from the buffer, must be called with lock held."""
+        self._state = 0
+        for character in self._buffer:
+            self._state = self._automaton.step(self._state, character)
+
+    def feed(self, character: str) -> Tuple[Any, ...]:
+        """Feed single typed character, return payloads of all keywords that end with it."""
+        with self._lock:
+            self._buffer.append(character)
+            self._state = self._automaton.step(self._state, character)
+            return self._automaton.outputs(self._state)
+
+    def reset(self):
+        with self._lock:
+            self._buffer.clear()
+            self._state = 0
+
+    def on_key_event(self, event: keyboard.KeyboardEvent):
+        """Keyboard hook callback, called on keyboard hook thread for every key press."""
+        if not self._buffer.maxlen:
+            return
+
+        name = event.name or ""
+        if len(name) == 1:
+            character = name.lower()
+        elif name in _KEY_NAME_CHARACTERS:
+            character = _KEY_NAME_CHARACTERS[name]
+        elif name == _KEY_NAME_BACKSPACE:
+            with self._lock:
+                if self._buffer:
+                    self._buffer.pop()
+                self._rewind()
+            return
+        elif name in _IGNORED_KEY_NAMES:
+            return
+        else:
+            return self.reset()
+
+        for payload in self.feed(character):
+            self._on_match(payload)
+
+    def hook(self):
+        """Start listening to typed keys, does nothing if already listening or if there is nothing to match."""
+        if self._hook is None and self.keyword_count:
+            self._hook = keyboard.on_press(self.on_key_event)
+
+    def unhook(self):
+        """Stop listening to typed keys, also call this after keyboard.unhook_all as it removes this hook too."""
+        if self._hook is not None:
+            try:
+                keyboard.unhook(self._hook)
+            except (KeyError, ValueError):
+                # Already removed by keyboard.unhook_all
+                pass
+            self._hook = None
+        self.reset()
+
+    def find_all(self, text: str) -> List[Any]:
+        """Return payloads of all keywords found in text, does not touch typed buffer."""
+        automaton = self._automaton
+        state, found = 0, []
+        for character in text.lower():
+            state = automaton.step(state, character)
+            found.extend(automaton.outputs(state))
+        return found
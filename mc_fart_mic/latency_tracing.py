@@ -0,0 +1,145 @@
+import json
+import math
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Stages of a single trigger, in order they happen
+STAGE_KEY_EVENT = "key_event"
+STAGE_DISPATCH = "dispatch"
+STAGE_FILE_RESOLVED = "file_resolved"
+STAGE_MEDIA_LOADED = "media_loaded"
+STAGE_PLAYING = "playing"
+STAGES = (STAGE_KEY_EVENT, STAGE_DISPATCH, STAGE_FILE_RESOLVED, STAGE_MEDIA_LOADED, STAGE_PLAYING)
+
+# Each histogram bucket is 5% wider than previous one, so percentiles are accurate to 5%
+BUCKET_GROWTH: float = 1.05
+PERCENTILES = (50, 95, 99)
+LATENCY_STATS_PATH = Path("latency_stats.json")
+
+
+class LatencyHistogram:
+    """Sparse histogram of latencies with logarithmic buckets, memory use doesn't grow with number of samples."""
+    __slots__ = ("_buckets", "count", "max_us")
+
+    def __init__(self):
+        self._buckets: Dict[int, int] = {}
+        self.count = 0
+        self.max_us = 0
+
+    @classmethod
+    def _bucket(cls, latency_us: int) -> int:
+        return 0 if latency_us < 1 else int(math.log(latency_us, BUCKET_GROWTH)) + 1
+
+    @classmethod
+    def _bucket_upper_bound(cls, bucket: int) -> float:
+        return 0.0 if bucket == 0 else BUCKET_GROWTH ** bucket
+
+    def add(self, latency_us: int):
+        bucket = self._bucket(latency_us)
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.max_us = max(self.max_us, latency_us)
+
+    def percentile(self, percentile: float) -> float:
+        """Return latency in microseconds under which percentile % of samples are."""
+        if not self.count:
+            return 0.0
+
+        wanted = math.ceil(self.count * percentile / 100)
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= wanted:
+                return min(self._bucket_upper_bound(bucket), self.max_us)
+        return float(self.max_us)
+
+    def summary(self) -> dict:
+        summary = {"count": self.count}
+        for percentile in PERCENTILES:
+            summary[f"p{percentile}_ms"] = round(self.percentile(percentile) / 1000, 3)
+        summary["max_ms"] = round(self.max_us / 1000, 3)
+        return summary
+
+
+class TriggerTrace:
+    """
+    Timestamps of a single hotkey trigger.
+    Each stage is recorded as time elapsed since the key event, stages that happen per output device also record
+    the device.
+    """
+    __slots__ = ("_tracer", "hotkey", "started_ns")
+
+    def __init__(self, tracer: "LatencyTracer", hotkey: str):
+        self._tracer = tracer
+        self.hotkey = hotkey
+        self.started_ns = time.perf_counter_ns()
+
+    def mark(self, stage: str, device: str = None):
+        self._tracer.record(self, stage, (time.perf_counter_ns() - self.started_ns) // 1000, device)
+
+
+class LatencyTracer:
+    """
+    Collects end-to-end trigger latencies per hotkey and per output device.
+
+    When disabled start returns None and callers skip marking stages, so tracing costs a single attribute check.
+    Tracing spans threads (keyboard hook thread and Qt GUI thread) so recording is guarded with a lock.
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._hotkey_histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._device_histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def start(self, hotkey: str) -> Optional[TriggerTrace]:
+        """Start tracing a trigger, this should be called as soon as the key event is received."""
+        if not self.enabled:
+            return None
+
+        trace = TriggerTrace(self, hotkey)
+        trace.mark(STAGE_KEY_EVENT)
+        return trace
+
+    def record(self, trace: TriggerTrace, stage: str, latency_us: int, device: str = None):
+        with self._lock:
+            self._histogram(self._hotkey_histograms, (trace.hotkey, stage)).add(latency_us)
+            if device is not None:
+                self._histogram(self._device_histograms, (device, stage)).add(latency_us)
+
+    @classmethod
+    def _histogram(cls, histograms: Dict[Tuple[str, str], LatencyHistogram], key: Tuple[str, str]) -> LatencyHistogram:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = LatencyHistogram()
+        return histogram
+
+    def reset(self):
+        with self._lock:
+            self._hotkey_histograms.clear()
+            self._device_histograms.clear()
+
+    def summary(self) -> dict:
+        """Percentiles of each stage, grouped by hotkey and by device. Latencies are measured from the key event."""
+        with self._lock:
+            return {
+                "hotkeys": self._group_summary(self._hotkey_histograms),
+                "devices": self._group_summary(self._device_histograms)
+            }
+
+    @classmethod
+    def _group_summary(cls, histograms: Dict[Tuple[str, str], LatencyHistogram]) -> dict:
+        summary = {}
+        for name, stage in sorted(histograms, key=lambda key: (key[0], STAGES.index(key[1]))):
+            summary.setdefault(name, {})[stage] = histograms[name, stage].summary()
+        return summary
+
+    def dump(self, path: Path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+        logger.info(f"Latency stats saved to '{path}'.")
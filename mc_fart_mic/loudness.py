@@ -0,0 +1,435 @@
+import os
+import math
+import wave
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import numpy
+except ImportError:  # Loudness analysis is optional, without numpy sounds simply play unchanged
+    numpy = None
+
+from PyQt5 import QtCore
+
+from mixer import pcm_to_frames
+from constants import POSSIBLE_AUDIO_FORMATS
+from sound_cache import BackendDecode, DecodedSound, DecodeError
+
+
+logger = logging.getLogger(__name__)
+
+LOUDNESS_INDEX_PATH = Path("loudness_index.sqlite3")
+# Loudness all sounds are brought to, in LUFS (loudness units relative to full scale)
+TARGET_LOUDNESS_LUFS: float = -16.0
+MIN_GAIN_DB: float = -30.0
+MAX_GAIN_DB: float = 12.0
+# Gain never pushes peaks of a sound above this
+MAX_PEAK_DB: float = -1.0
+# Reported for digital silence instead of minus infinity
+SILENCE_DB: float = -120.0
+# Sound is audible from the first until the last sample louder than this
+AUDIBLE_THRESHOLD_DB: float = -50.0
+# Kept before the first and after the last audible sample so attacks and fade outs aren't cut
+AUDIBLE_PRE_ROLL_MS: int = 10
+AUDIBLE_POST_ROLL_MS: int = 50
+ANALYSIS_WORKERS: int = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# Integrated loudness as in ITU-R BS.1770: 400 ms blocks overlapping by 75%, absolute and relative gating
+_STEP_SECONDS = 0.1
+_STEPS_PER_BLOCK = 4
+_ABSOLUTE_GATE_LUFS = -70.0
+_RELATIVE_GATE_LU = -10.0
+# Steps transformed at once, bounds memory used for long files
+_STEPS_PER_CHUNK = 256
+# K-weighting filter of BS.1770 as (b, a) coefficients of its two biquads (high shelf, high pass) at 48 kHz
+_K_WEIGHTING_BIQUADS = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621))
+)
+
+_AUDIBLE_WINDOW_SECONDS = 0.005
+
+# RMS level (dBFS), sample peak (dBFS), integrated loudness (LUFS), audible start and end (ms, end is None if sound
+# doesn't end with silence)
+Measurement = Tuple[float, float, float, int, Optional[int]]
+
+
+def _to_db(power: float) -> float:
+    return 10 * math.log10(power) if power > 0 else SILENCE_DB
+
+
+def _loudness(power: float) -> float:
+    return -0.691 + _to_db(power) if power > 0 else SILENCE_DB
+
+
+def _k_weighting_power_response(frequencies: "numpy.ndarray") -> "numpy.ndarray":
+    """Squared magnitude response of K-weighting filter at frequencies in Hz."""
+    # Filter is defined at 48 kHz, there's nothing audible above its Nyquist frequency anyway
+    z = numpy.exp(-2j * numpy.pi * numpy.minimum(frequencies, 23999.0) / 48000)
+    response = numpy.ones_like(z)
+    for (b0, b1, b2), (a0, a1, a2) in _K_WEIGHTING_BIQUADS:
+        response *= (b0 + b1 * z + b2 * z * z) / (a0 + a1 * z + a2 * z * z)
+    return numpy.abs(response) ** 2
+
+
+def _weighted_step_powers(frames: "numpy.ndarray", step: int, sample_rate: int) -> "numpy.ndarray":
+    """
+    Mean square of K-weighted signal of each step of step frames, summed over channels.
+    Filtering is done in frequency domain per step (Parseval's theorem), which is vectorized unlike running the IIR
+    filter sample by sample, at the cost of ignoring filter state across step boundaries.
+    """
+    step_count = len(frames) // step
+    # Every rfft bin except DC and Nyquist stands for two bins of the full spectrum
+    bin_weights = numpy.full(step // 2 + 1, 2.0)
+    bin_weights[0] = 1.0
+    if step % 2 == 0:
+        bin_weights[-1] = 1.0
+    bin_weights *= _k_weighting_power_response(numpy.fft.rfftfreq(step, 1 / sample_rate)) / (step * step)
+
+    powers = numpy.empty(step_count)
+    for start in range(0, step_count, _STEPS_PER_CHUNK):
+        end = min(start + _STEPS_PER_CHUNK, step_count)
+        steps = frames[start * step:end * step].reshape(end - start, step, frames.shape[1])
+        bin_powers = numpy.abs(numpy.fft.rfft(steps, axis=1)) ** 2
+        powers[start:end] = bin_powers.sum(axis=2) @ bin_weights
+    return powers
+
+
+def measure_loudness(frames: "numpy.ndarray", sample_rate: int) -> Tuple[float, float, float]:
+    """
+    Measure float samples of shape (frames, channels).
+    :return: tuple of RMS level (dBFS), sample peak (dBFS) and integrated loudness (LUFS)
+    """
+    if not len(frames):
+        return SILENCE_DB, SILENCE_DB, SILENCE_DB
+
+    peak = float(numpy.abs(frames).max())
+    rms_db = _to_db(float(numpy.mean(numpy.square(frames, dtype=numpy.float64))))
+    peak_db = 20 * math.log10(peak) if peak > 0 else SILENCE_DB
+
+    step = max(1, int(sample_rate * _STEP_SECONDS))
+    if len(frames) < step * _STEPS_PER_BLOCK:
+        # Shorter than a single block, whole sound is the only block
+        block_powers = _weighted_step_powers(frames, len(frames), sample_rate)
+    else:
+        step_powers = _weighted_step_powers(frames, step, sample_rate)
+        block_powers = numpy.convolve(step_powers, numpy.full(_STEPS_PER_BLOCK, 1 / _STEPS_PER_BLOCK), "valid")
+
+    block_powers = block_powers[block_powers > 10 ** ((_ABSOLUTE_GATE_LUFS + 0.691) / 10)]
+    if not len(block_powers):
+        return rms_db, peak_db, SILENCE_DB
+
+    relative_gate = 10 ** ((_loudness(float(block_powers.mean())) + _RELATIVE_GATE_LU + 0.691) / 10)
+    return rms_db, peak_db, _loudness(float(block_powers[block_powers > relative_gate].mean()))
+
+
+def find_audible_range(frames: "numpy.ndarray", sample_rate: int) -> Tuple[int, Optional[int]]:
+    """
+    Find where sound becomes audible and where it goes silent, looking at peaks of short windows of samples.
+    :return: tuple of start and end in ms, end is None if sound is audible until its end, silent sound is all audible
+    """
+    window = max(1, int(sample_rate * _AUDIBLE_WINDOW_SECONDS))
+    frame_peaks = numpy.abs(frames).max(axis=1) if len(frames) else numpy.zeros(0, dtype=numpy.float32)
+    frame_peaks = numpy.pad(frame_peaks, (0, -len(frame_peaks) % window))
+    audible_windows = numpy.flatnonzero(frame_peaks.reshape(-1, window).max(axis=1) > 10 ** (AUDIBLE_THRESHOLD_DB / 20))
+    if not len(audible_windows):
+        return 0, None
+
+    duration_ms = len(frames) * 1000 // sample_rate
+    start_ms = max(0, int(audible_windows[0]) * window * 1000 // sample_rate - AUDIBLE_PRE_ROLL_MS)
+    end_ms = (int(audible_windows[-1]) + 1) * window * 1000 // sample_rate + AUDIBLE_POST_ROLL_MS
+    return start_ms, end_ms if end_ms < duration_ms else None
+
+
+def analyze_pcm(pcm: bytes, sample_rate: int, channel_count: int, sample_size: int) -> Measurement:
+    frames = pcm_to_frames(pcm, sample_size, channel_count)
+    return (*measure_loudness(frames, sample_rate), *find_audible_range(frames, sample_rate))
+
+
+def analyze_wav_file(path: str) -> Measurement:
+    """Measure PCM WAV file, runs in analysis worker process."""
+    with wave.open(path, "rb") as wav_file:
+        return analyze_pcm(
+            wav_file.readframes(wav_file.getnframes()),
+            wav_file.getframerate(), wav_file.getnchannels(), wav_file.getsampwidth() * 8
+        )
+
+
+def gain_db(loudness_lufs: float, peak_db: float, target_loudness_lufs: float = TARGET_LOUDNESS_LUFS) -> float:
+    """Gain that brings sound to target loudness, limited so that its peaks don't clip."""
+    if loudness_lufs <= SILENCE_DB:
+        return 0.0
+    gain = min(target_loudness_lufs - loudness_lufs, MAX_GAIN_DB, MAX_PEAK_DB - peak_db)
+    return max(gain, MIN_GAIN_DB)
+
+
+def normalized_path(sound_path: str) -> str:
+    """Absolute path of sound in the same form as local file path of the url the sound is played from."""
+    return QtCore.QUrl.fromLocalFile(QtCore.QDir.current().absoluteFilePath(sound_path)).toLocalFile()
+
+
+class LoudnessIndex:
+    """
+    Loudness measurements and audible range of sound files saved in a SQLite database, keyed by path, size and
+    modification time.
+
+    Gains and audible ranges of all measured files are kept in memory, so getting them at play time is a dict lookup.
+    """
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS loudness (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        rms_db REAL NOT NULL,
+        peak_db REAL NOT NULL,
+        loudness_lufs REAL NOT NULL,
+        audible_start_ms INTEGER,
+        audible_end_ms INTEGER
+    );
+    """
+    # Columns added after the first version, rows measured before have them NULL and are measured again
+    _ADDED_COLUMNS = {"audible_start_ms": "INTEGER", "audible_end_ms": "INTEGER"}
+
+    def __init__(self, path: Path, target_loudness_lufs: float = TARGET_LOUDNESS_LUFS):
+        self.target_loudness_lufs = target_loudness_lufs
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        with self._connection:
+            self._connection.executescript(self._SCHEMA)
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(loudness)")}
+            for column, column_type in self._ADDED_COLUMNS.items():
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE loudness ADD COLUMN {column} {column_type}")
+
+        self._file_keys: Dict[str, Tuple[int, int]] = {}
+        self._gains: Dict[str, float] = {}
+        self._audible_ranges: Dict[str, Tuple[int, Optional[int]]] = {}
+        rows = self._connection.execute(
+            "SELECT path, size, mtime_ns, peak_db, loudness_lufs, audible_start_ms, audible_end_ms FROM loudness "
+            "WHERE audible_start_ms IS NOT NULL"
+        )
+        for sound_path, size, mtime_ns, peak_db, loudness_lufs, audible_start_ms, audible_end_ms in rows:
+            self._file_keys[sound_path] = size, mtime_ns
+            self._gains[sound_path] = gain_db(loudness_lufs, peak_db, target_loudness_lufs)
+            self._audible_ranges[sound_path] = audible_start_ms, audible_end_ms
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return len(self._file_keys)
+
+    def gain_db(self, path: str) -> float:
+        """Gain of sound at path (see normalized_path), 0 if it wasn't measured."""
+        return self._gains.get(path, 0.0)
+
+    def audible_range_ms(self, path: str) -> Tuple[int, Optional[int]]:
+        """Start and end (None for the end of sound) of audible part of sound at path, whole sound if not measured."""
+        return self._audible_ranges.get(path, (0, None))
+
+    def file_keys(self) -> Dict[str, Tuple[int, int]]:
+        """Copy of (size, modification time) of each measured file, file is measured again when they change."""
+        return dict(self._file_keys)
+
+    def put(self, path: str, size: int, mtime_ns: int, measurement: Measurement):
+        rms_db, peak_db, loudness_lufs, audible_start_ms, audible_end_ms = measurement
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO loudness (path, size, mtime_ns, rms_db, peak_db, loudness_lufs, "
+                "audible_start_ms, audible_end_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, rms_db, peak_db, loudness_lufs, audible_start_ms, audible_end_ms)
+            )
+        self._file_keys[path] = size, mtime_ns
+        self._gains[path] = gain_db(loudness_lufs, peak_db, self.target_loudness_lufs)
+        self._audible_ranges[path] = audible_start_ms, audible_end_ms
+
+
+FileKey = Tuple[str, int, int]
+
+
+class LoudnessAnalyzer(QtCore.QObject):
+    """
+    Measures loudness and audible range of sound files in background and saves results to LoudnessIndex.
+
+    Finding files (directories are searched recursively) and checking which of them changed runs on a background
+    thread. WAV files are measured in a process pool so analysis uses multiple CPU cores without ever holding the GUI
+    thread. Other formats are first decoded by the multimedia backend, one file at a time, and their samples are
+    measured in the pool. Only files that are not in the index or changed since they were measured are analyzed.
+    Index is opened on first use.
+    """
+    analysis_finished = QtCore.pyqtSignal()
+    # Signals from background threads, delivered queued on the analyzer thread
+    _changed_files_found = QtCore.pyqtSignal(object, int)
+    _file_analyzed = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, index_path: Path = LOUDNESS_INDEX_PATH, max_workers: int = ANALYSIS_WORKERS):
+        super().__init__()
+        self._index_path = index_path
+        self._index: Optional[LoudnessIndex] = None
+        self._max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._futures: Set[Future] = set()
+        self._pending_paths: Set[str] = set()
+        self._decode_queue: Deque[FileKey] = deque()
+        self._decode: Optional[BackendDecode] = None
+        self._sound_paths: List[str] = []
+        self._enabled = False
+        self._changed_files_found.connect(self._on_changed_files_found)
+        self._file_analyzed.connect(self._on_file_analyzed)
+        self.stats = {"analyzed": 0, "failed": 0, "unchanged": 0}
+
+    @property
+    def index(self) -> LoudnessIndex:
+        if self._index is None:
+            self._index = LoudnessIndex(self._index_path)
+        return self._index
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool):
+        """Enabling analyzes sound paths passed to analyze while it was disabled."""
+        if enabled and numpy is None:
+            logger.warning("Loudness analysis needs numpy installed.")
+            enabled = False
+
+        was_enabled, self._enabled = self._enabled, enabled
+        if enabled and not was_enabled:
+            self.analyze(self._sound_paths)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending_paths)
+
+    def analyze(self, sound_paths: Iterable[str]):
+        """
+        Analyze new and changed files among sound_paths (files or directories) in background, sound_paths are
+        remembered so they are analyzed once analysis is enabled if it's disabled now.
+        """
+        self._sound_paths = list(sound_paths)
+        if not self._enabled:
+            return
+
+        threading.Thread(
+            target=self._find_changed_files, args=(self._sound_paths, self.index.file_keys(), set(self._pending_paths)),
+            name="loudness scan", daemon=True
+        ).start()
+
+    def _find_changed_files(self, sound_paths: List[str], file_keys: Dict[str, Tuple[int, int]], pending: Set[str]):
+        changed_files, unchanged_count = [], 0
+        for path in self._iter_sound_files(sound_paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            if file_keys.get(path) == (stat.st_size, stat.st_mtime_ns):
+                unchanged_count += 1
+            elif path not in pending:
+                changed_files.append((path, stat.st_size, stat.st_mtime_ns))
+        self._changed_files_found.emit(changed_files, unchanged_count)
+
+    @classmethod
+    def _iter_sound_files(cls, sound_paths: List[str]) -> Iterator[str]:
+        seen = set()
+        for sound_path in sound_paths:
+            if os.path.isdir(sound_path):
+                paths = (
+                    os.path.join(directory, name)
+                    for directory, _directories, names in os.walk(sound_path)
+                    for name in names if os.path.splitext(name)[1] in POSSIBLE_AUDIO_FORMATS
+                )
+            else:
+                paths = (sound_path,)
+
+            for path in paths:
+                path = normalized_path(path)
+                if path not in seen:
+                    seen.add(path)
+                    yield path
+
+    @QtCore.pyqtSlot(object, int)
+    def _on_changed_files_found(self, changed_files: List[FileKey], unchanged_count: int):
+        self.stats["unchanged"] += unchanged_count
+        for file_key in changed_files:
+            path = file_key[0]
+            if path in self._pending_paths:
+                continue
+
+            self._pending_paths.add(path)
+            if path.lower().endswith(".wav"):
+                self._submit(file_key, analyze_wav_file, path)
+            else:
+                self._decode_queue.append(file_key)
+
+        if changed_files:
+            logger.info(f"Analyzing loudness of {len(changed_files)} files, {unchanged_count} are unchanged.")
+        self._decode_next()
+        if not self._pending_paths:
+            self.analysis_finished.emit()
+
+    def _submit(self, file_key: FileKey, function: Callable[..., Measurement], *args):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self._max_workers)
+
+        future = self._executor.submit(function, *args)
+        self._futures.add(future)
+        future.add_done_callback(lambda done: self._file_analyzed.emit(file_key, done))
+
+    def _decode_next(self):
+        if self._decode is not None or not self._decode_queue:
+            return
+
+        file_key = self._decode_queue.popleft()
+        self._decode = BackendDecode(file_key[0], lambda result: self._on_decoded(file_key, result))
+
+    def _on_decoded(self, file_key: FileKey, result: object):
+        self._decode = None
+        if isinstance(result, DecodeError):
+            self._finish(file_key, None, result)
+        else:
+            sound: DecodedSound = result
+            self._submit(
+                file_key, analyze_pcm, bytes(sound.pcm), sound.sample_rate, sound.channel_count, sound.sample_size
+            )
+        self._decode_next()
+
+    @QtCore.pyqtSlot(object, object)
+    def _on_file_analyzed(self, file_key: FileKey, future: Future):
+        self._futures.discard(future)
+        if future.cancelled():
+            return self._pending_paths.discard(file_key[0])
+
+        error = future.exception()
+        self._finish(file_key, None if error else future.result(), error)
+
+    def _finish(self, file_key: FileKey, measurement: Optional[Measurement], error: Optional[BaseException]):
+        path, size, mtime_ns = file_key
+        self._pending_paths.discard(path)
+        if error is None:
+            self.index.put(path, size, mtime_ns, measurement)
+            self.stats["analyzed"] += 1
+        else:
+            self.stats["failed"] += 1
+            logger.info(f"Can't analyze loudness of '{path}': {error}")
+
+        if not self._pending_paths:
+            logger.info(f"Loudness analysis finished: {self.stats}")
+            self.analysis_finished.emit()
+
+    def shutdown(self):
+        """Cancel analysis that didn't start yet, files being analyzed right now are left to finish."""
+        for future in list(self._futures):
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._decode_queue.clear()
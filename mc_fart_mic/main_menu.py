@@ -1,25 +1,35 @@
+import time
+# Before any other import so startup profiling includes time spent importing modules
+IMPORTS_STARTED = time.perf_counter()
+
 import sys
-import json
-import random
+if __name__ == "__main__" and "--headless" in sys.argv[1:]:
+    # Before the imports below, headless mode never loads the widget stack
+    import headless
+    sys.exit(headless.main(IMPORTS_STARTED))
+
+import multiprocessing
 import logging
+import threading
 import traceback
 from typing import Type
 from pathlib import Path
 
 import keyboard
-from PyQt5 import uic, QtCore
-from PyQt5.QtWidgets import (
-    QMainWindow, QFormLayout, QGroupBox, qApp, QAction,
-    QApplication, QMenu, QVBoxLayout, QSystemTrayIcon, QStyle
-)
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QMainWindow, qApp, QAction, QApplication, QMenu, QSystemTrayIcon, QStyle
 
 import message_boxes
 from config import Config
 from settings import SettingsUi
+from ui_loader import load_ui
+from headless import argument_parser
+from sound_board import SoundBoard
+from startup_profiler import StartupProfiler
 from add_hotkey import AddHotkeyUI
-from labels import HoverEntryLabel
-from player_pool import PlayerPool, PlayerPoolManager
-from constants import GITHUB_REPO_LINK, PROGRAM_VERSION, POSSIBLE_AUDIO_FORMATS
+from hotkey_table import HotkeyTableModel
+from hotkey_entry import HotkeyEntry, DEFAULT_PRIORITY
+from constants import GITHUB_REPO_LINK, PROGRAM_VERSION
 
 
 logging.basicConfig(filename="log.txt", level=logging.INFO, format="%(asctime)s - %(levelname)s %(name)s - %(message)s")
@@ -28,35 +38,38 @@ logging.basicConfig(filename="log.txt", level=logging.INFO, format="%(asctime)s
 class HotkeyListenerThread(QtCore.QThread):
     """Qt friendly thread for listening keyboard events."""
     def run(self):
+        # Python only knows QThreads by the name it gives them, runtime profiler reports samples under this one
+        threading.current_thread().name = "hotkey listener"
         keyboard.wait("esc")
 
 
-class MainWindowUi(QMainWindow):
-    LAYOUTS_DIRECTORY = Path("layouts")
-    PROFILES_DIRECTORY = Path("profiles")
-    DEFAULT_PROFILE_NAME = "default"
-
-    def __init__(self):
+class MainWindowUi(QMainWindow, SoundBoard):
+    def __init__(self, startup_profiler: StartupProfiler = None, trigger_server_address: str = None):
         # Register exception handler, at the very beginning so it doesn't miss any exceptions if we register it later
         self._backup_excepthook = sys.excepthook
         sys.excepthook = self._exception_hook
+        startup_profiler = StartupProfiler() if startup_profiler is None else startup_profiler
 
         super(MainWindowUi, self).__init__()
-        uic.loadUi(self.LAYOUTS_DIRECTORY / "main_menu.ui", self)
+        load_ui("main_menu.ui", self)
         self.setFixedSize(self.size())
 
         self.application_icon = QStyle.SP_TitleBarMenuButton
         self.setWindowIcon(qApp.style().standardIcon(self.application_icon))
+        startup_profiler.mark("main window layout")
 
-        self.player_pool_manager = PlayerPoolManager(PlayerPool(), PlayerPool())
+        self.create_sound_board(startup_profiler)
 
-        self.settings_ui = SettingsUi(self.player_pool_manager)
-        self.add_hotkey_ui = AddHotkeyUI(self)
+        # Secondary windows are created the first time they are opened
+        self._settings_ui = None
+        self._add_hotkey_ui = None
 
-        self.menu_settings.triggered.connect(self.settings_ui.show)
+        self.menu_settings.triggered.connect(self.open_settings_window)
         self.menu_help.triggered.connect(self.on_menu_help_click)
         self.menu_about.triggered.connect(self.on_menu_about_click)
         self.menu_exit.triggered.connect(self.on_menu_exit_click)
+        self.menu_runtime_profiler.toggled.connect(self.on_menu_runtime_profiler_toggled)
+        self.menu_memory_snapshot.triggered.connect(self.on_menu_memory_snapshot_click)
         self.button_load_profile.clicked.connect(self.on_button_load_profile_click)
         self.button_create_profile.clicked.connect(self.on_button_create_profile_click)
         self.button_add_hotkey.clicked.connect(self.open_hot_key_entry_window)
@@ -64,80 +77,106 @@ class MainWindowUi(QMainWindow):
         self.populate_profiles_combo_box()
         Config.register_combobox(self.combo_box_profile)
         current_combo_box_profile = self.combo_box_profile.currentText()
-        self.profile = self.load_profile_json(current_combo_box_profile) if current_combo_box_profile else {}
-
-        self.hotkey_entries_area = QFormLayout()
-        self.initialize_scroll_area(self.hotkey_entries_area)
-
-        self.refresh_hotkeys()
+        if current_combo_box_profile:
+            self.profile = self.load_profile(current_combo_box_profile)
+        startup_profiler.mark("profile load")
+
+        self.hotkey_table_model = HotkeyTableModel(self)
+        if current_combo_box_profile:
+            # Table reads rows from profile store as they are scrolled to, it doesn't need the loaded profile
+            self.hotkey_table_model.set_profile(self.profile_store, current_combo_box_profile)
+        self.table_view_hotkeys.setModel(self.hotkey_table_model)
+        self.table_view_hotkeys.entry_left_clicked.connect(self.hotkey_entry_left_click)
+        self.table_view_hotkeys.entry_right_clicked.connect(self.hotkey_entry_right_click)
+        self.table_view_hotkeys.entry_hovered.connect(self.sound_preloader.hover)
+        self.line_edit_search.textChanged.connect(self.hotkey_table_model.set_filter)
+        startup_profiler.mark("hotkey table")
+
+        self.refresh_profile()
+        if trigger_server_address is not None:
+            self.start_trigger_server(trigger_server_address)
         self.hotkey_listener_worker = HotkeyListenerThread()
         self.hotkey_listener_worker.start()
+        startup_profiler.mark("hotkey registration")
 
         self.show()
 
         self.tray_icon = self.create_tray_icon()
         self.tray_icon.show()
+        startup_profiler.mark("show window")
+
+        # Needs device enumeration which is slow, so it's done once the window is up
+        QtCore.QTimer.singleShot(0, lambda: SettingsUi.apply_saved_devices(self.player_pool_manager))
+
+    @property
+    def settings_ui(self) -> SettingsUi:
+        if self._settings_ui is None:
+            self._settings_ui = SettingsUi(
+                self.player_pool_manager, self.latency_tracer, self.hotkey_dispatcher, self.keyword_matcher,
+                self.loudness_analyzer, self.sound_preloader
+            )
+            # Keywords that fit or no longer fit the new length can start or stop the keyword hook
+            self._settings_ui.slider_max_keyword_length.valueChanged.connect(self.refresh_keywords)
+        return self._settings_ui
+
+    @property
+    def add_hotkey_ui(self) -> AddHotkeyUI:
+        if self._add_hotkey_ui is None:
+            self._add_hotkey_ui = AddHotkeyUI(self)
+        return self._add_hotkey_ui
+
+    @QtCore.pyqtSlot()
+    def open_settings_window(self):
+        self.settings_ui.show()
 
     def changeEvent(self, event: QtCore.QEvent):
         """On minimize event we want to move it to tray, if it's enabled in options."""
         if event.type() == QtCore.QEvent.WindowStateChange:
-            if self.settings_ui.check_minimize_to_tray.isChecked() and QtCore.Qt.WindowMinimized:
+            if SettingsUi.saved_value("check_minimize_to_tray") and QtCore.Qt.WindowMinimized:
                 event.ignore()
                 self.hide()
                 self.send_tray_message()
 
     def closeEvent(self, event: QtCore.QEvent):
         """On close event we want to move it to tray, if it's enabled in options."""
-        if self.settings_ui.check_minimize_on_close.isChecked():
+        if SettingsUi.saved_value("check_minimize_on_close"):
             event.ignore()
             self.hide()
             self.send_tray_message()
 
     def send_tray_message(self):
         """Sends tray message about program being minimized to tray, if it's enabled in options."""
-        if self.settings_ui.check_show_try_msg_on_minimize.isChecked():
+        if SettingsUi.saved_value("check_show_try_msg_on_minimize"):
             self.tray_icon.showMessage(
                 self.windowTitle(), "Application was minimized to Tray", QSystemTrayIcon.Information, 1000
             )
 
     def populate_profiles_combo_box(self):
-        profile_names = [str(path.stem) for path in self.PROFILES_DIRECTORY.glob("**/*.json")]
+        profile_names = self.profile_store.profile_names()
         if not profile_names:
             self.combo_box_profile.addItem(self.DEFAULT_PROFILE_NAME)
         else:
             self.combo_box_profile.addItems(profile_names)
 
-    def load_profile_json(self, profile_name: str) -> dict:
-        """Load profile dataa from saved json."""
-        try:
-            with open(self.PROFILES_DIRECTORY / f"{profile_name}.json", "r") as file:
-                return json.load(file)
-        except Exception:  # noqa PyBroadException
-            if profile_name == self.DEFAULT_PROFILE_NAME:
-                # Hot-fix when app is initially opened there will be no profiles
-                return {}
-            else:
-                return message_boxes.show_simple_traceback_message(f"Can't load profile '{profile_name}'.")
-
-    def save_profile_json(self, profile_name: str) -> None:
-        """Save current profile data to json file."""
-        try:
-            with open(self.PROFILES_DIRECTORY / f"{profile_name}.json", "w") as file:
-                json.dump(self.profile, file, indent=4)
-        except Exception:  # noqa PyBroadException
-            return message_boxes.show_simple_traceback_message(f"Failed to save profile '{profile_name}'.")
-
     @QtCore.pyqtSlot()
     def on_button_load_profile_click(self):
-        self.player_pool_manager.stop_all_playback()
-
         selected_profile = self.combo_box_profile.currentText()
-        self.profile = self.load_profile_json(selected_profile)
-        self.clear_scroll_area()
-        self.populate_scroll_area()
-        self.refresh_hotkeys()
+        self.switch_profile(selected_profile)
         message_boxes.show_simple_success_message(f"Profile '{selected_profile}' loaded successfully.")
 
+    def switch_profile(self, profile_name: str):
+        super().switch_profile(profile_name)
+        self.hotkey_table_model.set_profile(self.profile_store, profile_name)
+
+    def select_profile(self, profile_name: str):
+        # Combo box is saved in config on change
+        self.combo_box_profile.setCurrentText(profile_name)
+        self.switch_profile(profile_name)
+
+    def report_error(self, message: str):
+        super().report_error(message)
+        message_boxes.show_simple_traceback_message(message)
+
     @QtCore.pyqtSlot()
     def on_button_create_profile_click(self):
         profile_name = self.line_edit_create_profile.text()
@@ -146,13 +185,15 @@ class MainWindowUi(QMainWindow):
 
         self.player_pool_manager.stop_all_playback()
 
-        self.profile = {}
+        if not self.profile_store.create_profile(profile_name):
+            return message_boxes.show_simple_warning_message(f"Profile '{profile_name}' already exists!")
+
+        self.profile = []
         self.combo_box_profile.insertItem(0, profile_name)
         self.combo_box_profile.setCurrentIndex(0)
 
-        self.clear_scroll_area()
-        self.refresh_hotkeys()
-        self.save_profile_json(profile_name)
+        self.hotkey_table_model.set_profile(self.profile_store, profile_name)
+        self.refresh_profile()
 
         message_boxes.show_simple_success_message(f"Profile '{profile_name}' created successfully.")
 
@@ -160,28 +201,14 @@ class MainWindowUi(QMainWindow):
     def open_hot_key_entry_window(self):
         self.add_hotkey_ui.show()
 
-    @QtCore.pyqtSlot()
-    def hotkey_entry_left_click(self, label: HoverEntryLabel):
-        self.play_sound(label.text())
+    @QtCore.pyqtSlot(object)
+    def hotkey_entry_left_click(self, entry: HotkeyEntry):
+        self.play_entry(entry)
 
-    @QtCore.pyqtSlot()
-    def hotkey_entry_right_click(self, _label: HoverEntryLabel):
+    @QtCore.pyqtSlot(object)
+    def hotkey_entry_right_click(self, _entry: HotkeyEntry):
         message_boxes.show_simple_info_message("Editing not yet implemented.")  # TODO
 
-    def play_sound(self, sound_path: str):
-        path = Path(sound_path)
-        if path.is_dir():
-            files = [file for file in path.rglob("**/*") if file.is_file() and file.suffix in POSSIBLE_AUDIO_FORMATS]
-            random_sound = str(random.choice(files))
-            url = QtCore.QUrl.fromLocalFile(QtCore.QDir.current().absoluteFilePath(random_sound))
-        else:
-            url = QtCore.QUrl.fromLocalFile(QtCore.QDir.current().absoluteFilePath(sound_path))
-
-        self.player_pool_manager.play(
-            url=url,
-            also_play_on_additional=self.settings_ui.check_enable_additional_playback_device.isChecked()
-        )
-
     @QtCore.pyqtSlot()
     def on_menu_help_click(self):
         help_msg = message_boxes.message_box_constructor(
@@ -209,42 +236,30 @@ class MainWindowUi(QMainWindow):
         )
         about_msg.exec_()
 
+    @QtCore.pyqtSlot(bool)
+    def on_menu_runtime_profiler_toggled(self, checked: bool):
+        self.menu_memory_snapshot.setEnabled(checked)
+        if checked:
+            return self.runtime_profiler.start()
+
+        paths = self.runtime_profiler.stop()
+        message_boxes.show_simple_success_message("Runtime profile saved to:\n" + "\n".join(map(str, paths)))
+
+    @QtCore.pyqtSlot()
+    def on_menu_memory_snapshot_click(self):
+        path = self.runtime_profiler.snapshot()
+        message_boxes.show_simple_success_message(f"Memory snapshot saved to:\n{path}")
+
     @QtCore.pyqtSlot()
     def on_menu_exit_click(self):
-        self.hotkey_listener_worker.terminate()
-        sys.exit()
-
-    def initialize_scroll_area(self, form_layout: QFormLayout):
-        """
-        Loads saved hotkey-sound values and populates scroll area with them.
-        This should be called once at program start.
-        """
-        group_box = QGroupBox()
-        self.populate_scroll_area()
-        group_box.setLayout(form_layout)
-        self.scroll_area_main.setWidget(group_box)
-        layout = QVBoxLayout(self)
-        layout.addWidget(self.scroll_area_main)
-
-    def populate_scroll_area(self):
-        """Populates scroll area with hotkey/sound labels based on currently loaded profile."""
-        for hotkey, sound_path in self.profile.items():
-            self.add_hotkey_to_scrollbar(f"{hotkey:<8}", sound_path)
-
-    def clear_scroll_area(self):
-        for _ in range(self.hotkey_entries_area.rowCount()):
-            self.hotkey_entries_area.removeRow(0)
-
-    def refresh_hotkeys(self):
-        """
-        Registers hotkeys based on currently loaded profile data.
-        Any existing hotkey listeners are cleared.
-        """
-        keyboard.unhook_all()
-        for hotkey, sound_path in self.profile.items():
-            keyboard.add_hotkey(hotkey, self.play_sound, args=(sound_path,))
-
-    def new_hotkey_entry(self, hotkey: str, sound_path: str):
+        # Same as exit from tray, sound board shuts down when the application is about to quit
+        qApp.quit()
+
+    def new_hotkey_entry(
+            self, hotkey: str, sound_path: str, *,
+            priority: int = DEFAULT_PRIORITY, choke_group: str = None, start_offset_ms: int = None,
+            keyword: str = None
+    ):
         continue_adding = True
         if self.check_duplicate_hotkey(hotkey):
             continue_adding = message_boxes.show_simple_confirmation_message(
@@ -262,36 +277,29 @@ class MainWindowUi(QMainWindow):
         if not continue_adding:
             return
 
-        self.add_hotkey_to_scrollbar(hotkey, sound_path)
-        self.profile[hotkey] = sound_path
-        keyboard.add_hotkey(hotkey, self.play_sound, args=(sound_path,))
-
-        # Auto save at end
-        current_profile = self.combo_box_profile.currentText()
-        self.save_profile_json(current_profile)
-
-    def add_hotkey_to_scrollbar(self, hotkey: str, sound_path: str):
-        """This only adds hotkey/path labels to scrollbar area. Aka it only deals with visual things."""
-        insert_row = 0
-        label_hotkey = HoverEntryLabel(hotkey, entry_row=insert_row)
-        label_sound_file = HoverEntryLabel(
-            sound_path, entry_row=insert_row,
-            left_click_action=self.hotkey_entry_left_click, right_click_action=self.hotkey_entry_right_click
+        entry = HotkeyEntry(
+            hotkey, sound_path, priority=priority, choke_group=choke_group, start_offset_ms=start_offset_ms,
+            keyword=keyword
         )
+        try:
+            # Auto save, only the new entry is written
+            self.profile_store.add_entry(self.combo_box_profile.currentText(), entry)
+        except Exception:  # noqa PyBroadException
+            return message_boxes.show_simple_traceback_message("Failed to save hotkey.")
 
-        # TODO migrate to class?
-        font = label_hotkey.font()
-        font.setPointSize(11)
-        label_hotkey.setFont(font)
-        label_sound_file.setFont(font)
-
-        self.hotkey_entries_area.addRow(label_hotkey, label_sound_file)
+        self.profile.append(entry)
+        self.hotkey_table_model.append_entry(entry)
+        self.hotkey_registry.add(entry)
+        self.refresh_keywords()
+        self.refresh_trigger_server()
+        self.refresh_loudness()
+        self.refresh_transcoded()
 
     def check_duplicate_hotkey(self, hotkey: str) -> bool:
-        return hotkey in self.profile
+        return any(entry.hotkey == hotkey for entry in self.profile)
 
     def check_duplicate_path(self, path: str) -> bool:
-        return path in self.profile.values()
+        return any(entry.sound_path == path for entry in self.profile)
 
     def create_tray_icon(self) -> QSystemTrayIcon:
         """Creates tray icon and available options when icon is right clicked."""
@@ -329,12 +337,33 @@ class MainWindowUi(QMainWindow):
 
 
 if __name__ == "__main__":
+    # Loudness analysis runs in worker processes, needed when packaged as executable
+    multiprocessing.freeze_support()
+    arguments, qt_arguments = argument_parser().parse_known_args()
+    startup = StartupProfiler(arguments.profile_startup, started=IMPORTS_STARTED)
+    startup.mark("imports")
+
     try:
         # Make directory in case of pyinstaller or similar.
         # Note that layouts should be packed in the bundle so we don't create that.
         Path(MainWindowUi.PROFILES_DIRECTORY).mkdir(exist_ok=True)
-        app = QApplication(sys.argv)
-        window = MainWindowUi()
+        app = QApplication(sys.argv[:1] + qt_arguments)
+        startup.mark("application")
+        window = MainWindowUi(startup, arguments.trigger_server)
+        # Same as turning it on from diagnostics menu, results are written when it's turned off or on exit
+        window.menu_runtime_profiler.setChecked(arguments.profile_runtime)
+
+        def on_first_event_loop_iteration():
+            # Window is shown and responds to input from here on
+            startup.mark("first event loop iteration")
+            if startup.enabled:
+                startup.log_report()
+            if arguments.exit_after_startup:
+                app.quit()
+
+        QtCore.QTimer.singleShot(0, on_first_event_loop_iteration)
         app.exec_()
+        window.hotkey_listener_worker.terminate()
+        window.hotkey_listener_worker.wait()
     except Exception as e:
         logging.error(e)
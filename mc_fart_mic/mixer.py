@@ -0,0 +1,540 @@
+import wave
+import logging
+import weakref
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    import numpy
+except ImportError:  # Mixer engine is optional, media player engine works without it
+    numpy = None
+
+from PyQt5.QtCore import QIODevice, QTimer, QUrl
+from PyQt5.QtMultimedia import QAudioDeviceInfo, QAudioFormat, QAudioOutput
+
+from sound_cache import DecodedSound, MappedSound, Sound, SoundCache
+from audio_devices import AudioDeviceRegistry, DEFAULT_DEVICE_NAME, enumerate_audio_outputs
+from hotkey_entry import DEFAULT_PRIORITY
+from latency_tracing import TriggerTrace, STAGE_MEDIA_LOADED, STAGE_PLAYING
+from player_pool import (
+    PlayerPoolManager, VOICE_STEALING_POLICIES, VOICE_STEALING_OLDEST, VOICE_STEALING_QUIETEST,
+    VOICE_STEALING_LOWEST_PRIORITY
+)
+
+
+logger = logging.getLogger(__name__)
+
+MIN_MAX_MIXER_VOICES: int = 1
+MAX_MAX_MIXER_VOICES: int = 64
+MIXER_SAMPLE_RATE: int = 48000
+MIXER_CHANNEL_COUNT: int = 2
+MIXER_BLOCK_FRAMES: int = 512
+# How fast limiter gain recovers towards 1 after a loud block, per block
+LIMITER_RELEASE: float = 0.05
+
+
+def is_mixer_available() -> bool:
+    return numpy is not None
+
+
+def pcm_to_frames(pcm: bytes, sample_size: int, channel_count: int) -> "numpy.ndarray":
+    """
+    Convert raw little endian PCM (8 bit unsigned, 16/24/32 bit signed) to float32 samples in range [-1, 1] with
+    shape (frames, channel_count), incomplete last frame is dropped.
+    """
+    sample_bytes = sample_size // 8
+    pcm = pcm[:len(pcm) - len(pcm) % (sample_bytes * channel_count)]
+
+    if sample_size == 8:
+        samples = (numpy.frombuffer(pcm, dtype=numpy.uint8).astype(numpy.float32) - 128) / 128
+    elif sample_size == 16:
+        samples = numpy.frombuffer(pcm, dtype="<i2").astype(numpy.float32) / 32768
+    elif sample_size == 24:
+        raw = numpy.frombuffer(pcm, dtype=numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+        # Shift into the top of int32 and back to sign extend
+        samples = ((raw[:, 0] << 8 | raw[:, 1] << 16 | raw[:, 2] << 24) >> 8).astype(numpy.float32) / 8388608
+    elif sample_size == 32:
+        samples = numpy.frombuffer(pcm, dtype="<i4").astype(numpy.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample size {sample_size}")
+
+    return samples.reshape(-1, channel_count)
+
+
+def _match_channels(frames: "numpy.ndarray", channel_count: int) -> "numpy.ndarray":
+    """Duplicate last channel or drop channels so frames have channel_count channels."""
+    if frames.shape[1] > channel_count:
+        return frames[:, :channel_count]
+    elif frames.shape[1] < channel_count:
+        missing = numpy.repeat(frames[:, -1:], channel_count - frames.shape[1], axis=1)
+        return numpy.concatenate((frames, missing), axis=1)
+    return frames
+
+
+def convert_to_mixer_format(sound: DecodedSound, sample_rate: int, channel_count: int) -> "numpy.ndarray":
+    """Convert decoded sound to float32 samples in range [-1, 1] with shape (frames, channel_count)."""
+    frames = pcm_to_frames(sound.pcm, sound.sample_size, sound.channel_count)
+    return convert_frames(frames, sound.sample_rate, sample_rate, channel_count)
+
+
+def convert_frames(
+        frames: "numpy.ndarray", source_sample_rate: int, sample_rate: int, channel_count: int
+) -> "numpy.ndarray":
+    """
+    Convert float frames to float32 frames with channel_count channels at sample_rate.
+    Channels are duplicated or dropped to match channel_count and sample rate is converted with linear interpolation.
+    """
+    frames = _match_channels(frames, channel_count)
+
+    if source_sample_rate != sample_rate and len(frames):
+        source_positions = numpy.arange(len(frames))
+        target_positions = numpy.arange(int(len(frames) * sample_rate / source_sample_rate)) * (
+            source_sample_rate / sample_rate
+        )
+        frames = numpy.stack(
+            [numpy.interp(target_positions, source_positions, frames[:, channel]) for channel in range(channel_count)],
+            axis=1
+        )
+
+    return numpy.ascontiguousarray(frames, dtype=numpy.float32)
+
+
+class StreamedSamples:
+    """
+    Samples of a mapped sound in mixer format, converted block by block while playing instead of all at once, so long
+    sounds take no memory. Has length and can be sliced like the array convert_to_mixer_format would return.
+    """
+    def __init__(self, sound: MappedSound, sample_rate: int, channel_count: int):
+        self._sound = sound
+        self._pcm = sound.pcm
+        self._channel_count = channel_count
+        self._frame_bytes = sound.channel_count * sound.sample_size // 8
+        # Source frames per mixer frame
+        self._step = sound.sample_rate / sample_rate
+        self._length = int(sound.frame_count * sample_rate / sound.sample_rate)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _read(self, start: int, stop: int) -> "numpy.ndarray":
+        frames = pcm_to_frames(
+            self._pcm[start * self._frame_bytes:stop * self._frame_bytes], self._sound.sample_size,
+            self._sound.channel_count
+        )
+        return _match_channels(frames, self._channel_count)
+
+    def __getitem__(self, frames: slice) -> "numpy.ndarray":
+        start, stop, _step = frames.indices(self._length)
+        if start >= stop:
+            return numpy.zeros((0, self._channel_count), dtype=numpy.float32)
+        elif self._step == 1:
+            return self._read(start, stop)
+
+        source_positions = numpy.arange(start, stop) * self._step
+        first = int(source_positions[0])
+        source = self._read(first, int(source_positions[-1]) + 2)
+        return numpy.stack([
+            numpy.interp(source_positions - first, numpy.arange(len(source)), source[:, channel])
+            for channel in range(self._channel_count)
+        ], axis=1).astype(numpy.float32)
+
+
+MixerSamples = Union["numpy.ndarray", StreamedSamples]
+
+
+class MixerVoice:
+    """Single sound playing in the mixer, from position until end."""
+    __slots__ = ("samples", "position", "end", "gain", "priority", "choke_group")
+
+    def __init__(
+            self, samples: MixerSamples, gain: float, priority: int, choke_group: Optional[str], *,
+            position: int = 0, end: int = None
+    ):
+        self.samples = samples
+        self.position = position
+        self.end = len(samples) if end is None else min(end, len(samples))
+        self.gain = gain
+        self.priority = priority
+        self.choke_group = choke_group
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= self.end
+
+
+class MixerEngine:
+    """
+    Software mixer that sums all active voices block by block into one stream.
+
+    Cost of mixing a block depends only on number of active voices and block size, all voices share one output stream
+    so there is no per voice backend pipeline or device handle.
+    Mixed signal goes trough a simple peak limiter so many loud voices at once don't clip.
+    """
+    def __init__(
+            self, *,
+            sample_rate: int = MIXER_SAMPLE_RATE,
+            channel_count: int = MIXER_CHANNEL_COUNT,
+            max_voices: int = MAX_MAX_MIXER_VOICES
+    ):
+        if numpy is None:
+            raise RuntimeError("Mixer engine needs numpy installed.")
+
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.max_voices = max_voices
+        self.voice_stealing_policy = VOICE_STEALING_OLDEST
+        # Ordered from oldest to newest
+        self._voices: List[MixerVoice] = []
+        # Sounds that weren't converted to current format when they were cached, e.g. after device format changed
+        self._converted = weakref.WeakKeyDictionary()
+        self._limiter_gain = 1.0
+
+    @property
+    def active_voice_count(self) -> int:
+        return len(self._voices)
+
+    def set_format(self, sample_rate: int, channel_count: int):
+        """Change output format, all playing voices are stopped."""
+        self.sample_rate, self.channel_count = sample_rate, channel_count
+        self._voices.clear()
+        self._converted = weakref.WeakKeyDictionary()
+
+    def add_voice(
+            self, sound: Sound, *,
+            gain: float = 1.0, priority: int = DEFAULT_PRIORITY, choke_group: str = None,
+            start_ms: int = 0, end_ms: int = None
+    ) -> Optional[MixerVoice]:
+        """
+        Start playing sound, if voice limit is reached a voice is stopped based on voice stealing policy.
+        Decoded sounds are normally converted to mixer format before they are cached (see MixerOutputManager), sound
+        in any other format is converted here once and kept as long as it's alive. Mapped sounds are converted while
+        they play.
+        :param start_ms: position to start playing from
+        :param end_ms: position to stop playing at, None to play until the end
+        :return: started MixerVoice or None if sound has lower priority than all playing voices
+        """
+        if choke_group is not None:
+            self._voices = [voice for voice in self._voices if voice.choke_group != choke_group]
+
+        while len(self._voices) >= self.max_voices:
+            stolen = self._steal_candidate()
+            if self.voice_stealing_policy == VOICE_STEALING_LOWEST_PRIORITY and stolen.priority > priority:
+                return None
+            self._voices.remove(stolen)
+
+        if isinstance(sound, MappedSound):
+            samples = StreamedSamples(sound, self.sample_rate, self.channel_count)
+        else:
+            samples = sound.converted.get((self.sample_rate, self.channel_count))
+            if samples is None:
+                samples = self._converted.get(sound)
+            if samples is None:
+                samples = self._converted[sound] = convert_to_mixer_format(sound, self.sample_rate, self.channel_count)
+
+        voice = MixerVoice(
+            samples, gain, priority, choke_group, position=start_ms * self.sample_rate // 1000,
+            end=None if end_ms is None else end_ms * self.sample_rate // 1000
+        )
+        self._voices.append(voice)
+        return voice
+
+    def _steal_candidate(self) -> MixerVoice:
+        # Voice count is capped to a few dozen, linear search over voices ordered by age is fine here
+        if self.voice_stealing_policy == VOICE_STEALING_QUIETEST:
+            return min(self._voices, key=lambda voice: voice.gain)
+        elif self.voice_stealing_policy == VOICE_STEALING_LOWEST_PRIORITY:
+            return min(self._voices, key=lambda voice: voice.priority)
+        return self._voices[0]
+
+    def stop_all(self):
+        self._voices.clear()
+
+    def mix(self, frame_count: int) -> "numpy.ndarray":
+        """
+        Mix next frame_count frames of all active voices.
+        :return: float32 array of shape (frame_count, channel_count) with values in range [-1, 1]
+        """
+        block = numpy.zeros((frame_count, self.channel_count), dtype=numpy.float32)
+        for voice in self._voices:
+            chunk = voice.samples[voice.position:min(voice.position + frame_count, voice.end)]
+            if voice.gain == 1.0:
+                block[:len(chunk)] += chunk
+            else:
+                block[:len(chunk)] += chunk * voice.gain
+            voice.position += len(chunk)
+
+        self._voices = [voice for voice in self._voices if not voice.finished]
+        self._limit(block)
+        return block
+
+    def _limit(self, block: "numpy.ndarray"):
+        """Instant attack, slow release peak limiter, gain is ramped over the block to avoid clicks."""
+        peak = float(numpy.abs(block).max()) if len(block) else 0.0
+        target_gain = 1.0 / peak if peak > 1.0 else 1.0
+        if target_gain >= self._limiter_gain:
+            target_gain = min(target_gain, self._limiter_gain + (1.0 - self._limiter_gain) * LIMITER_RELEASE)
+
+        if target_gain != 1.0 or self._limiter_gain != 1.0:
+            block *= numpy.linspace(self._limiter_gain, target_gain, len(block), dtype=numpy.float32)[:, None]
+        self._limiter_gain = target_gain
+        # Ramp start can still be above the limit
+        numpy.clip(block, -1.0, 1.0, out=block)
+
+    def render(self, frame_count: int) -> bytes:
+        """Mix next frame_count frames as interleaved signed 16 bit little endian PCM."""
+        return (self.mix(frame_count) * 32767).astype("<i2").tobytes()
+
+
+class MixerStream(QIODevice):
+    """Read-only endless device that pulls mixed PCM from the engine, used as source for QAudioOutput pull mode."""
+    def __init__(self, engine: MixerEngine):
+        super().__init__()
+        self._engine = engine
+
+    def readData(self, max_size: int) -> bytes:
+        frame_size = self._engine.channel_count * 2
+        frame_count = min(max_size // frame_size, MIXER_BLOCK_FRAMES)
+        return self._engine.render(frame_count) if frame_count else b""
+
+    def writeData(self, _data: bytes) -> int:
+        return -1
+
+    def bytesAvailable(self) -> int:
+        return MIXER_BLOCK_FRAMES * self._engine.channel_count * 2 + super().bytesAvailable()
+
+    def isSequential(self) -> bool:
+        return True
+
+
+class NullSink:
+    """
+    Sink that renders mixed audio and throws it away, for running the engine without a sound card.
+    Rendering is done either manually with pump or in real time with start.
+    """
+    def __init__(self, engine: MixerEngine):
+        self._engine = engine
+        self._timer = QTimer()
+        self._timer.timeout.connect(lambda: self.pump(self._engine.sample_rate * self._timer.interval() // 1000))
+        self.frames_written = 0
+
+    def pump(self, frame_count: int):
+        self.write(self._engine.render(frame_count))
+        self.frames_written += frame_count
+
+    def write(self, _data: bytes):
+        pass
+
+    def start(self, interval_ms: int = 10):
+        self._timer.start(interval_ms)
+
+    def stop(self):
+        self._timer.stop()
+
+
+class WaveFileSink(NullSink):
+    """Sink that writes mixed audio to a WAV file."""
+    def __init__(self, engine: MixerEngine, path: str):
+        super().__init__(engine)
+        self._wav_file = wave.open(path, "wb")
+        self._wav_file.setnchannels(engine.channel_count)
+        self._wav_file.setsampwidth(2)
+        self._wav_file.setframerate(engine.sample_rate)
+
+    def write(self, data: bytes):
+        self._wav_file.writeframes(data)
+
+    def close(self):
+        self.stop()
+        self._wav_file.close()
+
+
+class MixerOutput:
+    """
+    One output device fed with a single mixed stream, counterpart of PlayerPool for the mixer engine.
+    Output device is opened on first play or on device change, if selected device disappears stream is reopened on
+    default device and moved back once the device is available again.
+    """
+    def __init__(self, max_concurrent_sounds: int = 3, *, device_registry: AudioDeviceRegistry = None):
+        self.engine = MixerEngine()
+        self.max_concurrent_sounds = max_concurrent_sounds
+        self._device_registry = device_registry or AudioDeviceRegistry.shared(enumerate_audio_outputs)
+        self._device_registry.devices_changed.connect(self._on_devices_changed)
+        self._selected_device_name: Optional[str] = None
+        self._device_info: Optional[QAudioDeviceInfo] = None
+        self._audio_output: Optional[QAudioOutput] = None
+        self._stream: Optional[MixerStream] = None
+        self.device_name = DEFAULT_DEVICE_NAME
+        # Part of the PlayerPool interface, mixer voices cost nothing while idle so there is nothing to keep warm
+        self.warm_players = 0
+
+    @property
+    def max_concurrent_sounds(self) -> int:
+        return self.engine.max_voices
+
+    @max_concurrent_sounds.setter
+    def max_concurrent_sounds(self, new_max_concurrent_sounds: int):
+        """
+        Set how many concurrent sounds can play at the same time.
+        :raises ValueError: if new_max_concurrent_sounds is out of range
+        """
+        if not MIN_MAX_MIXER_VOICES <= new_max_concurrent_sounds <= MAX_MAX_MIXER_VOICES:
+            raise ValueError("Max concurrent sounds out of range.")
+
+        self.engine.max_voices = new_max_concurrent_sounds
+
+    @property
+    def voice_stealing_policy(self) -> str:
+        return self.engine.voice_stealing_policy
+
+    @voice_stealing_policy.setter
+    def voice_stealing_policy(self, new_voice_stealing_policy: str):
+        """
+        Set which voice gets stopped when a new sound needs to play and voice limit is reached.
+        :raises ValueError: if new_voice_stealing_policy is not one of VOICE_STEALING_POLICIES
+        """
+        if new_voice_stealing_policy not in VOICE_STEALING_POLICIES:
+            raise ValueError(f"Invalid voice stealing policy: {new_voice_stealing_policy}")
+
+        self.engine.voice_stealing_policy = new_voice_stealing_policy
+
+    @property
+    def currently_playing_count(self) -> int:
+        return self.engine.active_voice_count
+
+    @property
+    def device_registry(self) -> AudioDeviceRegistry:
+        return self._device_registry
+
+    def available_devices(self) -> Dict[str, str]:
+        """
+        Get a dict of all available audio output devices, devices are enumerated only once and cached.
+        :return: Dict where keys are friendly device names and values are device identifiers, for audio output devices
+                 those are the same.
+        """
+        return {device_name: device_name for device_name in self._device_registry.devices()}
+
+    def change_device(self, device_friendly_name: Optional[str]) -> bool:
+        """
+        Reopen mixed stream on audio output device based on passed device_friendly_name.
+        If the device isn't available default device is used until it becomes available.
+        :param device_friendly_name: str audio device name, None for default device
+        :return: bool whether stream now plays to the selected device
+        """
+        self._selected_device_name = device_friendly_name
+        return self._apply_device()
+
+    def _apply_device(self) -> bool:
+        device_info = self._device_registry.identifier(self._selected_device_name)
+        if device_info is None and self._selected_device_name is not None:
+            logger.warning(f"Device '{self._selected_device_name}' is not available, playing to default device.")
+
+        device_name = DEFAULT_DEVICE_NAME if device_info is None else self._selected_device_name
+        if device_name != self.device_name or self._audio_output is None:
+            self._open(QAudioDeviceInfo.defaultOutputDevice() if device_info is None else device_info)
+            self.device_name = device_name
+        return device_info is not None or self._selected_device_name is None
+
+    def _on_devices_changed(self):
+        # Output that was never opened is opened on the right device on first play anyway
+        if self._audio_output is not None:
+            self._apply_device()
+
+    def _open(self, device_info: QAudioDeviceInfo):
+        if self._audio_output is not None:
+            self._audio_output.stop()
+
+        audio_format = QAudioFormat()
+        audio_format.setSampleRate(MIXER_SAMPLE_RATE)
+        audio_format.setChannelCount(MIXER_CHANNEL_COUNT)
+        audio_format.setSampleSize(16)
+        audio_format.setCodec("audio/pcm")
+        audio_format.setByteOrder(QAudioFormat.LittleEndian)
+        audio_format.setSampleType(QAudioFormat.SignedInt)
+        if not device_info.isFormatSupported(audio_format):
+            nearest_format = device_info.nearestFormat(audio_format)
+            audio_format.setSampleRate(nearest_format.sampleRate())
+            audio_format.setChannelCount(nearest_format.channelCount())
+
+        sample_rate, channel_count = audio_format.sampleRate(), audio_format.channelCount()
+        if (sample_rate, channel_count) != (self.engine.sample_rate, self.engine.channel_count):
+            self.engine.set_format(sample_rate, channel_count)
+
+        self._device_info = device_info
+        self._stream = MixerStream(self.engine)
+        self._stream.open(QIODevice.ReadOnly)
+        self._audio_output = QAudioOutput(device_info, audio_format)
+        self._audio_output.start(self._stream)
+
+    def play(
+            self, sound: Sound, *,
+            gain: float = 1.0, priority: int = DEFAULT_PRIORITY, choke_group: str = None,
+            start_ms: int = 0, end_ms: int = None, trace: TriggerTrace = None
+    ) -> bool:
+        """
+        Mix sound into the output stream, device is opened on first play so unused outputs cost nothing.
+        :param start_ms: position to start playing from
+        :param end_ms: position to stop playing at, None to play until the end
+        :param trace: if passed media load and playback start are marked in it, voice is audible from the next
+                      mixed block so both are marked at the same time
+        :return: bool whether the sound is playing, it doesn't play if it has lower priority than all playing sounds
+        """
+        if self._audio_output is None:
+            self._apply_device()
+
+        voice = self.engine.add_voice(
+            sound, gain=gain, priority=priority, choke_group=choke_group, start_ms=start_ms, end_ms=end_ms
+        )
+        if trace is not None:
+            trace.mark(STAGE_MEDIA_LOADED, self.device_name)
+            trace.mark(STAGE_PLAYING, self.device_name)
+        return voice is not None
+
+    def output_format(self) -> Tuple[int, int]:
+        """Sample rate and channel count sounds are mixed in."""
+        return self.engine.sample_rate, self.engine.channel_count
+
+    def stop_all_playbacks(self):
+        self.engine.stop_all()
+
+
+class MixerOutputManager(PlayerPoolManager):
+    """
+    Plays sounds trough software mixer, one mixed stream per device.
+    Alternative to PlayerPoolManager with the same interface, sound is decoded once and fed to all enabled outputs.
+    Sounds are converted to mixer format on sound cache worker threads before they are cached, once per distinct
+    format of enabled outputs, and all outputs mix the same converted samples.
+    """
+    MIN_MAX_CONCURRENT_SOUNDS = MIN_MAX_MIXER_VOICES
+    MAX_MAX_CONCURRENT_SOUNDS = MAX_MAX_MIXER_VOICES
+
+    def __init__(self, main_output: MixerOutput, *additional_outputs: MixerOutput, sound_cache: SoundCache = None):
+        super().__init__(main_output, *additional_outputs, sound_cache=sound_cache)
+        self._sound_cache.prepare = self._convert_for_outputs
+
+    def _convert_for_outputs(self, sound: DecodedSound):
+        """Runs on a sound cache worker thread, before sound is cached."""
+        for output_format in {output.output_format() for output in list(self._enabled_player_pools)}:
+            sound.converted[output_format] = convert_to_mixer_format(sound, *output_format)
+
+    def play(
+            self, *, url: QUrl, priority: int = DEFAULT_PRIORITY, choke_group: str = None,
+            start_offset_ms: int = None, trace: TriggerTrace = None
+    ):
+        if not url.isLocalFile():
+            return logger.warning(f"Mixer can only play local files, can't play '{url.toString()}'.")
+
+        path = url.toLocalFile()
+        # Unlike media players the mixer can also make quiet sounds louder
+        gain = 10 ** (self.gain_db(path) / 20)
+        start_ms, end_ms = self.play_range_ms(path, start_offset_ms)
+
+        def play_decoded(sound: Optional[Sound]):
+            if sound is None:
+                return logger.warning(f"Can't play '{path}', it can't be decoded.")
+
+            for output in self._enabled_player_pools:
+                output.play(
+                    sound, gain=gain, priority=priority, choke_group=choke_group, start_ms=start_ms, end_ms=end_ms,
+                    trace=trace
+                )
+
+        self._sound_cache.load(self.playable_path(path), play_decoded)
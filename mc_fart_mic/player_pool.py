@@ -1,19 +1,178 @@
-from typing import Dict
+import time
+import heapq
+import logging
+import weakref
+from functools import partial
+from itertools import count
 from collections import deque
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaService, QAudioOutputSelectorControl, QMediaContent
+from PyQt5.QtCore import QUrl, QIODevice, QTimer
+from PyQt5.QtMultimedia import QMediaPlayer, QAudioOutputSelectorControl, QMediaContent, QAudioDeviceInfo
 
+from audio_devices import AudioDeviceRegistry, DEFAULT_DEVICE_NAME, enumerate_audio_outputs
+from hotkey_entry import DEFAULT_PRIORITY
+from latency_tracing import TriggerTrace, STAGE_MEDIA_LOADED, STAGE_PLAYING
+from sound_cache import SoundCache, Sound
+
+if TYPE_CHECKING:
+    from loudness import LoudnessIndex
+    from transcode_cache import TranscodeCache
+
+
+logger = logging.getLogger(__name__)
 
 AUDIO_OUTPUT_SELECTOR_CONTROL_STRING = "org.qt-project.qt.audiooutputselectorcontrol/5.0"
 MIN_MAX_CONCURRENT_SOUNDS: int = 1
 MAX_MAX_CONCURRENT_SOUNDS: int = 10
+# Cached sounds are played from memory as WAV, backends use the url only as a hint for the stream format
+CACHED_SOUND_URL_HINT = QUrl("cached_sound.wav")
+VOICE_STEALING_OLDEST = "Oldest"
+VOICE_STEALING_QUIETEST = "Quietest"
+VOICE_STEALING_LOWEST_PRIORITY = "Lowest priority"
+VOICE_STEALING_POLICIES = (VOICE_STEALING_OLDEST, VOICE_STEALING_QUIETEST, VOICE_STEALING_LOWEST_PRIORITY)
+# Players all pools can have together, each one holds a backend pipeline with its own buffers
+DEFAULT_MAX_TOTAL_PLAYERS: int = 16
+# Idle players kept ready in an enabled pool so the first sound doesn't wait for a player to be created
+WARM_PLAYERS: int = 1
+PLAYER_IDLE_TIMEOUT_MS: int = 30_000
+
+
+def enumerate_media_player_outputs() -> Dict[str, str]:
+    """
+    Audio outputs media players can play to, as friendly name -> output identifier.
+    Outputs are read from a new player as backends read the list of outputs when the player is created.
+    """
+    player = QMediaPlayer()
+    service = player.service()
+    selector = service.requestControl(AUDIO_OUTPUT_SELECTOR_CONTROL_STRING) if service is not None else None
+    if selector is None:
+        player.deleteLater()
+        return {}
+
+    try:
+        return {
+            selector.outputDescription(device_identifier): device_identifier
+            for device_identifier in selector.availableOutputs()
+        }
+    finally:
+        service.releaseControl(selector)
+        player.deleteLater()
+
+
+def gain_to_volume(gain_db: float) -> int:
+    """Player volume (linear, 0-100) for gain in dB, players can't play louder than the file so gain is capped at 0."""
+    return round(100 * 10 ** (min(gain_db, 0.0) / 20))
+
+
+class _Voice:
+    """Bookkeeping of a player that is currently allocated to a sound."""
+    __slots__ = ("sequence", "priority", "volume", "choke_group", "duration_ms")
+
+    def __init__(
+            self, sequence: int, priority: int, volume: int, choke_group: Optional[str], duration_ms: Optional[int]
+    ):
+        self.sequence = sequence
+        self.priority = priority
+        self.volume = volume
+        self.choke_group = choke_group
+        # Voice is stopped this long after it starts playing, None to play until the end of media
+        self.duration_ms = duration_ms
+
+
+class PlayerBudget:
+    """
+    Ceiling on the number of players all pools have together.
+    Pool that reaches it takes an idle player from another pool before it starts stealing its own voices.
+    """
+    _shared: Optional["PlayerBudget"] = None
+
+    def __init__(self, max_players: int = DEFAULT_MAX_TOTAL_PLAYERS):
+        self.max_players = max_players
+        self._player_pools = weakref.WeakSet()
+
+    @classmethod
+    def shared(cls) -> "PlayerBudget":
+        """Budget shared by all pools that don't get their own, created on first call."""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def register(self, player_pool: "PlayerPool"):
+        self._player_pools.add(player_pool)
+
+    @property
+    def player_count(self) -> int:
+        return sum(player_pool.player_count for player_pool in self._player_pools)
+
+    def try_acquire(self, player_pool: "PlayerPool") -> bool:
+        """
+        Check whether player_pool can create another player, reclaiming an idle player of another pool if needed.
+        :return: bool whether the player fits in the budget
+        """
+        if self.player_count < self.max_players:
+            return True
+
+        return any(
+            other_pool.remove_idle_player() for other_pool in list(self._player_pools) if other_pool is not player_pool
+        )
 
 
 class PlayerPool:
-    def __init__(self, max_concurrent_sounds: int = 3):
-        self._max_concurrent_sounds = self.max_concurrent_sounds = max_concurrent_sounds
-        self._players = deque()
-        self._add_players(self.max_concurrent_sounds)
+    """
+    Pool of players where each player plays one sound (voice) at a time.
+
+    Player state is tracked from player signals instead of polling: idle players are kept in a free list and active
+    ones in a heap ordered by voice stealing policy, so getting a player is O(1) when one is free and O(log n) when
+    an active voice has to be stolen.
+
+    Players are created on demand up to max concurrent sounds and the shared player budget, a spare one is created
+    right after so a burst of sounds doesn't wait on player creation. Players idle for longer than idle timeout are
+    removed, except the warm ones kept by enabled pools. Lowering max concurrent sounds removes idle players right
+    away and playing ones once their sound ends, playing sounds are never cut off by it.
+
+    Output device is looked up in the shared device registry and each player keeps its output selector control, so
+    switching device is a single pass over the players without enumerating devices. If selected device disappears
+    players fall back to default device and switch back once it's available again. Players are made again when that
+    happens, idle ones right away and playing ones once their sound ends, other device changes don't touch them.
+    """
+    def __init__(
+            self, max_concurrent_sounds: int = 3, voice_stealing_policy: str = VOICE_STEALING_OLDEST, *,
+            device_registry: AudioDeviceRegistry = None, player_budget: PlayerBudget = None,
+            idle_timeout_ms: int = PLAYER_IDLE_TIMEOUT_MS
+    ):
+        self._player_budget = player_budget or PlayerBudget.shared()
+        self._player_budget.register(self)
+        self._device_registry = device_registry or AudioDeviceRegistry.shared(enumerate_media_player_outputs)
+        self._device_registry.devices_changed.connect(self._on_devices_changed)
+        # Device selected by user, None for default device, and identifier of the one players currently output to
+        self._selected_device_name: Optional[str] = None
+        self._device_identifier: Optional[str] = None
+        self._output_selectors: Dict[QMediaPlayer, QAudioOutputSelectorControl] = {}
+        self._players: Set[QMediaPlayer] = set()
+        # Players that were playing when selected device appeared or disappeared, replaced once their sound ends
+        self._stale_players: Set[QMediaPlayer] = set()
+        # Most recently freed players last, players are reused from the end and reaped from the start
+        self._free_players = deque()
+        self._idle_since: Dict[QMediaPlayer, float] = {}
+        self._warm_players = 0
+        self._idle_timeout_ms = idle_timeout_ms
+        self._reap_timer = QTimer()
+        self._reap_timer.setInterval(idle_timeout_ms)
+        self._reap_timer.timeout.connect(self._reap_idle_players)
+        self._active_voices: Dict[QMediaPlayer, _Voice] = {}
+        self._steal_heap: List[Tuple[tuple, int, QMediaPlayer]] = []
+        self._choke_groups: Dict[str, Set[QMediaPlayer]] = {}
+        self._voice_sequence = count()
+        self._voice_stealing_policy = voice_stealing_policy
+        self._media_devices: Dict[QMediaPlayer, QIODevice] = {}
+        self._pending_traces: Dict[QMediaPlayer, TriggerTrace] = {}
+        self._max_concurrent_sounds = 0
+        # Sample rate and channel count of output device, looked up when first needed
+        self._output_format: Optional[Tuple[int, int]] = None
+        self.device_name = DEFAULT_DEVICE_NAME
+        self.stats = {"created": 0, "reaped": 0, "stolen": 0}
+        self.max_concurrent_sounds = max_concurrent_sounds
 
     @property
     def max_concurrent_sounds(self) -> int:
@@ -33,88 +192,411 @@ class PlayerPool:
         if not MIN_MAX_CONCURRENT_SOUNDS <= new_max_concurrent_sounds <= MAX_MAX_CONCURRENT_SOUNDS:
             raise ValueError("Max concurrent sounds out of range.")
 
-        difference = new_max_concurrent_sounds - self.max_concurrent_sounds
-        if difference > 0:
-            self._add_players(difference)
-        elif difference < 0:
-            self._pop_players(abs(difference))
-
         self._max_concurrent_sounds = new_max_concurrent_sounds
+        # Players are created when needed, only surplus idle ones are removed here
+        while len(self._players) > new_max_concurrent_sounds and self._free_players:
+            self._remove_player(self._free_players.popleft())
+
+    @property
+    def voice_stealing_policy(self) -> str:
+        return self._voice_stealing_policy
+
+    @voice_stealing_policy.setter
+    def voice_stealing_policy(self, new_voice_stealing_policy: str):
+        """
+        Set which voice gets stopped when a new sound needs to play and all players are busy.
+        :raises ValueError: if new_voice_stealing_policy is not one of VOICE_STEALING_POLICIES
+        """
+        if new_voice_stealing_policy not in VOICE_STEALING_POLICIES:
+            raise ValueError(f"Invalid voice stealing policy: {new_voice_stealing_policy}")
+
+        self._voice_stealing_policy = new_voice_stealing_policy
+        self._rebuild_steal_heap()
 
     @property
     def currently_playing_count(self) -> int:
-        return sum(1 for player in self._players if player.state() == QMediaPlayer.State.PlayingState)
+        return len(self._active_voices)
+
+    @property
+    def player_count(self) -> int:
+        """Number of players that exist right now, playing or idle."""
+        return len(self._players)
+
+    @property
+    def warm_players(self) -> int:
+        return self._warm_players
+
+    @warm_players.setter
+    def warm_players(self, warm_players: int):
+        """
+        Set how many idle players are kept ready instead of being reaped, missing ones are created once control
+        returns to the event loop.
+        """
+        self._warm_players = warm_players
+        if warm_players:
+            QTimer.singleShot(0, self._create_warm_players)
+        self._schedule_reaping()
+
+    def _create_warm_players(self):
+        while len(self._free_players) < min(self._warm_players, self._max_concurrent_sounds - len(self._active_voices)):
+            if not self._create_idle_player():
+                break
+
+    def _create_idle_player(self) -> bool:
+        """Create a player and park it as idle if pool and budget have room for it."""
+        if len(self._players) >= self._max_concurrent_sounds or not self._player_budget.try_acquire(self):
+            return False
+        self._park(self._create_player())
+        return True
+
+    def _create_player(self) -> QMediaPlayer:
+        player = QMediaPlayer()
+        player.stateChanged.connect(lambda _state, _player=player: self._on_player_state_changed(_player))
+        player.mediaStatusChanged.connect(
+            lambda status, _player=player: self._on_media_status_changed(_player, status)
+        )
+        self._players.add(player)
+        self.stats["created"] += 1
+
+        service = player.service()
+        selector = service.requestControl(AUDIO_OUTPUT_SELECTOR_CONTROL_STRING) if service is not None else None
+        if selector is not None:
+            self._output_selectors[player] = selector
+            if self._device_identifier is not None:
+                selector.setActiveOutput(self._device_identifier)
+        return player
+
+    def _remove_player(self, player: QMediaPlayer):
+        """Delete player that is not playing and is no longer in the free list."""
+        self._players.discard(player)
+        self._stale_players.discard(player)
+        self._idle_since.pop(player, None)
+        self._media_devices.pop(player, None)
+        selector = self._output_selectors.pop(player, None)
+        if selector is not None:
+            player.service().releaseControl(selector)
+        player.deleteLater()
+
+    def remove_idle_player(self) -> bool:
+        """
+        Remove the longest idle player to make room in the player budget for another pool.
+        :return: bool whether there was an idle player to remove
+        """
+        if not self._free_players:
+            return False
+        self._remove_player(self._free_players.popleft())
+        self.stats["reaped"] += 1
+        return True
+
+    def _park(self, player: QMediaPlayer):
+        """
+        Put player that stopped playing to the free list, or remove it if the pool has shrunk or the device changed
+        meanwhile.
+        """
+        if player in self._stale_players:
+            self._remove_player(player)
+            return self._create_warm_players()
+        if len(self._players) > self._max_concurrent_sounds:
+            return self._remove_player(player)
+
+        self._free_players.append(player)
+        self._idle_since[player] = time.monotonic()
+        self._schedule_reaping()
+
+    def _schedule_reaping(self):
+        if len(self._free_players) > self._warm_players:
+            if not self._reap_timer.isActive():
+                self._reap_timer.start()
+        else:
+            self._reap_timer.stop()
+
+    def _reap_idle_players(self):
+        """Remove players idle for longer than idle timeout, oldest first, keeping the warm ones."""
+        idle_before = time.monotonic() - self._idle_timeout_ms / 1000
+        while len(self._free_players) > self._warm_players and self._idle_since[self._free_players[0]] <= idle_before:
+            self.remove_idle_player()
+        self._schedule_reaping()
 
-    def _add_players(self, number: int):
+    def _on_player_state_changed(self, player: QMediaPlayer):
+        # Checking current state instead of the signal argument so late signals of a reused player are ignored
+        state = player.state()
+        if player in self._active_voices and state == QMediaPlayer.State.StoppedState:
+            self._release(player)
+        elif state == QMediaPlayer.State.PlayingState:
+            if self._pending_traces:
+                trace = self._pending_traces.pop(player, None)
+                if trace is not None:
+                    trace.mark(STAGE_PLAYING, self.device_name)
+            voice = self._active_voices.get(player)
+            if voice is not None and voice.duration_ms is not None:
+                QTimer.singleShot(voice.duration_ms, partial(self._end_voice, player, voice.sequence))
+                voice.duration_ms = None
+
+    def _on_media_status_changed(self, player: QMediaPlayer, status: QMediaPlayer.MediaStatus):
+        # Invalid media never starts playing so there is no state change to free the player
+        if player in self._active_voices and status == QMediaPlayer.MediaStatus.InvalidMedia:
+            self._release(player)
+
+    def _release(self, player: QMediaPlayer):
+        """Mark active player as free."""
+        self._forget_voice(player)
+        self._park(player)
+
+    def _forget_voice(self, player: QMediaPlayer):
+        voice = self._active_voices.pop(player)
+        self._pending_traces.pop(player, None)
+        if voice.choke_group is not None:
+            self._choke_groups[voice.choke_group].discard(player)
+
+    def _end_voice(self, player: QMediaPlayer, sequence: int):
+        """Stop player if it's still playing voice with sequence, player could have been stolen or reused meanwhile."""
+        voice = self._active_voices.get(player)
+        if voice is not None and voice.sequence == sequence:
+            self._release(player)
+            player.stop()
+
+    def _steal_key(self, voice: _Voice) -> tuple:
+        """Voices with smallest key get stolen first."""
+        if self._voice_stealing_policy == VOICE_STEALING_QUIETEST:
+            return voice.volume, voice.sequence
+        elif self._voice_stealing_policy == VOICE_STEALING_LOWEST_PRIORITY:
+            return voice.priority, voice.sequence
+        return (voice.sequence,)
+
+    def _rebuild_steal_heap(self):
+        self._steal_heap = [
+            (self._steal_key(voice), voice.sequence, player) for player, voice in self._active_voices.items()
+        ]
+        heapq.heapify(self._steal_heap)
+
+    def _peek_steal_candidate(self) -> Optional[Tuple[QMediaPlayer, _Voice]]:
+        """Return active voice that would be stolen next, dropping heap entries of voices that ended meanwhile."""
+        while self._steal_heap:
+            _key, sequence, player = self._steal_heap[0]
+            voice = self._active_voices.get(player)
+            if voice is not None and voice.sequence == sequence:
+                return player, voice
+            heapq.heappop(self._steal_heap)
+        return None
+
+    def _steal_voice(self) -> QMediaPlayer:
+        """Remove voice with highest stealing precedence from active voices and return its player, still playing."""
+        player, _voice = self._peek_steal_candidate()
+        heapq.heappop(self._steal_heap)
+        self._forget_voice(player)
+        self.stats["stolen"] += 1
+        return player
+
+    def get_player(self, priority: int = DEFAULT_PRIORITY) -> Optional[QMediaPlayer]:
         """
-        Initialize and add number of players to cache.
-        We need multiple of them to be able to easily play multiple concurrent sounds.
+        Returns a player that isn't playing currently, a new one if the pool can still grow or, if all are playing,
+        stops the voice selected by voice stealing policy and returns its player.
+        :param priority: priority of sound that will play, with lowest priority policy a voice is stolen only if it
+                         has lower or same priority as the new sound
+        :return: QMediaPlayer or None if no voice can be stolen for sound of this priority
         """
-        for _ in range(number):
-            self._players.append(QMediaPlayer())
+        if self._free_players:
+            player = self._free_players.pop()
+            del self._idle_since[player]
+            return player
+
+        if len(self._players) < self._max_concurrent_sounds and self._player_budget.try_acquire(self):
+            # Next sound of a burst likely follows right away, its player is made while this one starts
+            QTimer.singleShot(0, self._create_spare_player)
+            return self._create_player()
 
-    def _pop_players(self, number: int):
-        """Remove number of players from cache."""
-        for _ in range(number):
-            self._players.pop()
+        candidate = self._peek_steal_candidate()
+        if candidate is None:
+            # Budget is taken by other pools' playing voices and this pool has none to steal
+            return None
+        elif self._voice_stealing_policy == VOICE_STEALING_LOWEST_PRIORITY and candidate[1].priority > priority:
+            return None
 
-    def get_player(self) -> QMediaPlayer:
+        player = self._steal_voice()
+        player.stop()
+        if player in self._stale_players:
+            # Its place in the budget goes to a player made for the current device
+            self._remove_player(player)
+            return self._create_player()
+        return player
+
+    def _create_spare_player(self):
+        if not self._free_players:
+            self._create_idle_player()
+
+    def choke(self, choke_group: str):
+        """Stop all voices playing in choke group."""
+        for player in list(self._choke_groups.get(choke_group, ())):
+            self._release(player)
+            player.stop()
+
+    def set_media(self, player: QMediaPlayer, url: QUrl, sound: Optional[Sound] = None):
+        """
+        Load media to player from decoded (or mapped) sound if one is passed, otherwise from url.
+        Players playing from memory don't touch the file at all, mapped sounds are read straight from the mapping.
         """
-        Returns first available player that isn't playing currently or, if all are playing,
-        returns the oldest player (that is playing for longest).
-        :return: QMediaPlayer
+        if sound is None:
+            player.setMedia(QMediaContent(url))
+            self._media_devices.pop(player, None)
+            return
+
+        # Device is a read-only view of shared sound data, it needs to live as long as the player uses it
+        device = sound.open_device()
+        player.setMedia(QMediaContent(CACHED_SOUND_URL_HINT), device)
+        self._media_devices[player] = device
+
+    def play(
+            self, url: QUrl, sound: Optional[Sound] = None, *,
+            priority: int = DEFAULT_PRIORITY, choke_group: str = None, volume: int = 100,
+            start_ms: int = 0, end_ms: int = None, trace: TriggerTrace = None
+    ) -> bool:
         """
-        for player in self._players:
-            if player.state() == QMediaPlayer.State.StoppedState:
-                return player
+        Play url (or already decoded sound of it) on first available player.
+        :param priority: priority of the sound, used by lowest priority voice stealing policy
+        :param choke_group: if passed all voices from the same choke group are stopped before playing
+        :param volume: player volume in range 0-100
+        :param start_ms: position to start playing from
+        :param end_ms: position to stop playing at, None to play until the end
+        :param trace: if passed media load and playback start are marked in it
+        :return: bool whether the sound is playing, it doesn't play if it has lower priority than all playing sounds
+        """
+        if choke_group is not None:
+            self.choke(choke_group)
+
+        player = self.get_player(priority)
+        if player is None:
+            return False
+
+        self.set_media(player, url, sound)
+        player.setVolume(volume)
+        if start_ms:
+            player.setPosition(start_ms)
+        if trace is not None:
+            trace.mark(STAGE_MEDIA_LOADED, self.device_name)
+            self._pending_traces[player] = trace
+        player.play()
 
-        oldest = sorted(self._players, key=lambda _player: _player.duration() - _player.position(), reverse=True)[0]
-        return oldest
+        duration_ms = end_ms - start_ms if end_ms is not None else None
+        voice = _Voice(next(self._voice_sequence), priority, volume, choke_group, duration_ms)
+        self._active_voices[player] = voice
+        if choke_group is not None:
+            self._choke_groups.setdefault(choke_group, set()).add(player)
+        heapq.heappush(self._steal_heap, (self._steal_key(voice), voice.sequence, player))
+        self._compact_steal_heap()
+        return True
+
+    def _compact_steal_heap(self):
+        """Heap entries of ended voices are removed lazily, rebuild it once they pile up."""
+        if len(self._steal_heap) > 2 * len(self._players):
+            self._rebuild_steal_heap()
+
+    @property
+    def device_registry(self) -> AudioDeviceRegistry:
+        return self._device_registry
 
     def available_devices(self) -> Dict[str, str]:
         """
-        Get a dict of all available audio output devices.
-        :return: Dict where keys are strings representing available audio output device identifier and values represent
-        friendly name string of said device identifier. Example:
+        Get a dict of all available audio output devices, devices are enumerated only once and cached.
+        :return: Dict where keys are strings representing friendly name of audio output device and values represent
+        device identifier of said friendly name. Example:
         {'Default Device': '@device:cm:{E0F118E1-CB14-11D0-BD4E-11A0C900CE97}\\Default Device'}
         """
-        # When changing device output the change is propagated across all cached players,
-        # so getting available outputs from any of them should always be the same, thus selecting first player
-        # as at least one player will exist at all times.
-        selector = self._players[0].service().requestControl(AUDIO_OUTPUT_SELECTOR_CONTROL_STRING)
-        available_devices = {}
-        for device_identifier in selector.availableOutputs():
-            friendly_device_name = selector.outputDescription(device_identifier)
-            available_devices[friendly_device_name] = device_identifier
+        return dict(self._device_registry.devices())
 
-        return available_devices
-
-    def change_device(self, device_friendly_name: str):
+    def change_device(self, device_friendly_name: Optional[str]) -> bool:
         """
         Change all cached players to play to specific audio output device based on passed device_friendly_name.
-        :param device_friendly_name: str audio device description (friendly name for device identifier)
-        :raises ValueError: if device_friendly_name is not one of available devices
+        If the device isn't available players play to default device until it becomes available.
+        :param device_friendly_name: str audio device description (friendly name for device identifier), None for
+                                     default device
+        :return: bool whether players now play to the selected device
         """
-        try:
-            device_identifier = self.available_devices()[device_friendly_name]
-        except KeyError as e:
-            raise ValueError(f"Invalid device selected: {e}")
+        self._selected_device_name = device_friendly_name
+        return self._apply_device()
+
+    def _apply_device(self) -> bool:
+        device_identifier = self._device_registry.identifier(self._selected_device_name)
+        if device_identifier is None and self._selected_device_name is not None:
+            logger.warning(f"Device '{self._selected_device_name}' is not available, playing to default device.")
+
+        if device_identifier != self._device_identifier:
+            for player, selector in self._output_selectors.items():
+                # Stale players keep playing where they started until they are replaced
+                if player in self._stale_players:
+                    continue
+                selector.setActiveOutput(selector.defaultOutput() if device_identifier is None else device_identifier)
+            self._device_identifier = device_identifier
+            self.device_name = DEFAULT_DEVICE_NAME if device_identifier is None else self._selected_device_name
+            self._output_format = None
+        return device_identifier is not None or self._selected_device_name is None
 
-        for player in self._players:
-            scv: QMediaService = player.service()
-            out: QAudioOutputSelectorControl = scv.requestControl(AUDIO_OUTPUT_SELECTOR_CONTROL_STRING)
-            out.setActiveOutput(device_identifier)
-            scv.releaseControl(out)
+    def _on_devices_changed(self):
+        # Nothing to do unless selected device appeared or disappeared, e.g. a headset plugged in to another port
+        if self._device_registry.identifier(self._selected_device_name) == self._device_identifier:
+            return
+
+        # Backends read available outputs when the player is created, so players made before the change can't switch
+        # to a newly added device. Devices change rarely, players are simply made again. Idle ones are replaced right
+        # away, playing ones finish their sound first.
+        self._stale_players.update(self._active_voices)
+        while self._free_players:
+            self._remove_player(self._free_players.popleft())
+        self._apply_device()
+        self._create_warm_players()
+
+    def output_format(self) -> Tuple[int, int]:
+        """
+        Preferred format of output device, sounds in it play without the backend converting them.
+        :return: tuple of sample rate and channel count
+        """
+        if self._output_format is None:
+            device_name = None if self.device_name == DEFAULT_DEVICE_NAME else self.device_name
+            # Media player outputs have the same names as audio outputs, but the identifiers differ
+            device_info = AudioDeviceRegistry.shared(enumerate_audio_outputs).identifier(device_name)
+            if device_info is None:
+                device_info = QAudioDeviceInfo.defaultOutputDevice()
+            preferred_format = device_info.preferredFormat()
+            self._output_format = preferred_format.sampleRate(), preferred_format.channelCount()
+        return self._output_format
 
     def stop_all_playbacks(self):
-        for player in self._players:
+        for player in list(self._active_voices):
+            self._release(player)
             player.stop()
 
 
 class PlayerPoolManager:
-    """Manages having PLayerPool for multiple devices."""
-    def __init__(self, main_player_pool: PlayerPool, additional_player_pool: PlayerPool):
-        self._player_pools = (main_player_pool, additional_player_pool)
+    """
+    Manages having PlayerPool for multiple devices.
+
+    First pool is the main one (virtual audio device) and is always enabled, any number of additional pools can be
+    added and enabled/disabled. Sound is looked up in the cache once and the same decoded data is fed to every enabled
+    pool, disabled pools are skipped entirely.
+    If loudness index is set sounds can be played with gain and without leading and trailing silence from it, all
+    measured ahead of time by LoudnessAnalyzer.
+    If transcode cache is set sounds in formats that don't play on every backend are played from their transcoded
+    copies once those are ready.
+    """
+    MIN_MAX_CONCURRENT_SOUNDS = MIN_MAX_CONCURRENT_SOUNDS
+    MAX_MAX_CONCURRENT_SOUNDS = MAX_MAX_CONCURRENT_SOUNDS
+
+    def __init__(
+            self, main_player_pool: PlayerPool, *additional_player_pools: PlayerPool, sound_cache: SoundCache = None
+    ):
+        self._player_pools: List[PlayerPool] = []
+        self._enabled_player_pools: List[PlayerPool] = []
+        self._sound_cache = SoundCache() if sound_cache is None else sound_cache
+        self.loudness_index: Optional["LoudnessIndex"] = None
+        self.transcode_cache: Optional["TranscodeCache"] = None
+        self.normalize_loudness = False
+        self.skip_leading_silence = False
+        self.trim_trailing_silence = False
+        # Decoded sound -> (start ms, end ms, decoded sound of just that part), only the last played part is kept
+        self._sound_sections = weakref.WeakKeyDictionary()
+
+        self.add_player_pool(main_player_pool, enabled=True)
+        for additional_player_pool in additional_player_pools:
+            self.add_player_pool(additional_player_pool, enabled=False)
 
     @property
     def main_player_pool(self) -> PlayerPool:
@@ -124,19 +606,108 @@ class PlayerPoolManager:
     def additional_player_pool(self) -> PlayerPool:
         return self._player_pools[1]
 
-    def play(self, *, url: str, also_play_on_additional: bool):
-        main_content = QMediaContent(url)
-        main_player = self.main_player_pool.get_player()
-        main_player.setMedia(main_content)
-        main_player.play()
+    @property
+    def player_pools(self) -> Tuple[PlayerPool, ...]:
+        return tuple(self._player_pools)
+
+    @property
+    def sound_cache(self) -> SoundCache:
+        return self._sound_cache
+
+    def add_player_pool(self, player_pool: PlayerPool, *, enabled: bool = True) -> int:
+        """
+        Add pool for another output device.
+        :return: int index of added pool, used for enabling/disabling it
+        """
+        self._player_pools.append(player_pool)
+        self.set_player_pool_enabled(len(self._player_pools) - 1, enabled)
+        return len(self._player_pools) - 1
+
+    def set_player_pool_enabled(self, index: int, enabled: bool):
+        """Enable or disable playing to pool at index, disabling it also stops everything playing in it."""
+        player_pool = self._player_pools[index]
+        if enabled and player_pool not in self._enabled_player_pools:
+            self._enabled_player_pools.append(player_pool)
+            player_pool.warm_players = WARM_PLAYERS
+        elif not enabled and player_pool in self._enabled_player_pools:
+            self._enabled_player_pools.remove(player_pool)
+            player_pool.stop_all_playbacks()
+            player_pool.warm_players = 0
+
+    def set_voice_stealing_policy(self, voice_stealing_policy: str):
+        for player_pool in self._player_pools:
+            player_pool.voice_stealing_policy = voice_stealing_policy
 
-        additional_content = QMediaContent(url)
-        additional_player = self.additional_player_pool.get_player()
-        additional_player.setMedia(additional_content)
+    def output_format(self) -> Tuple[int, int]:
+        """Sample rate and channel count of the main output device, sounds are transcoded to it."""
+        return self.main_player_pool.output_format()
 
-        main_player.play()
-        if also_play_on_additional:
-            additional_player.play()
+    def playable_path(self, path: str) -> str:
+        """Path of transcoded copy of sound at path if there is one, otherwise path itself."""
+        if self.transcode_cache is None:
+            return path
+        return self.transcode_cache.get(path, self.output_format()) or path
+
+    def gain_db(self, path: str) -> float:
+        """Gain to play sound at path with, 0 unless loudness normalization is enabled."""
+        if self.loudness_index is None or not self.normalize_loudness:
+            return 0.0
+        return self.loudness_index.gain_db(path)
+
+    def play_range_ms(self, path: str, start_offset_ms: Optional[int] = None) -> Tuple[int, Optional[int]]:
+        """
+        Part of sound at path to play, without leading and trailing silence if those are enabled.
+        :param start_offset_ms: if passed sound starts from it instead of from the end of leading silence
+        :return: tuple of start and end in ms, end is None to play until the end of sound
+        """
+        start_ms, end_ms = 0, None
+        if self.loudness_index is not None:
+            audible_start_ms, audible_end_ms = self.loudness_index.audible_range_ms(path)
+            if self.skip_leading_silence:
+                start_ms = audible_start_ms
+            if self.trim_trailing_silence:
+                end_ms = audible_end_ms
+        if start_offset_ms is not None:
+            start_ms = start_offset_ms
+        if end_ms is not None and end_ms <= start_ms:
+            end_ms = None
+        return start_ms, end_ms
+
+    def _sound_section(self, sound: Sound, start_ms: int, end_ms: Optional[int]) -> Sound:
+        """Sound of part of sound, decoded sound is copied once and reused while the same part is played."""
+        if not start_ms and end_ms is None:
+            return sound
+
+        section = self._sound_sections.get(sound)
+        if section is None or section[:2] != (start_ms, end_ms):
+            section = self._sound_sections[sound] = start_ms, end_ms, sound.section(start_ms, end_ms)
+        return section[2]
+
+    def play(
+            self, *, url: QUrl, priority: int = DEFAULT_PRIORITY, choke_group: str = None,
+            start_offset_ms: int = None, trace: TriggerTrace = None
+    ):
+        """
+        Play url on all enabled pools.
+        :param start_offset_ms: if passed sound starts from it instead of from the end of leading silence
+        """
+        path = url.toLocalFile() if url.isLocalFile() else None
+        playable_path = self.playable_path(path) if path else None
+        if playable_path != path:
+            url = QUrl.fromLocalFile(playable_path)
+        sound = self._sound_cache.get(playable_path) if path else None
+        # Gain and audible range are measured on the original file
+        volume = gain_to_volume(self.gain_db(path)) if path else 100
+        start_ms, end_ms = self.play_range_ms(path, start_offset_ms) if path else (start_offset_ms or 0, None)
+        if sound is not None:
+            # Cached sound is cut in memory so players start right at the audible part instead of seeking
+            sound = self._sound_section(sound, start_ms, end_ms)
+            start_ms, end_ms = 0, None
+        for player_pool in self._enabled_player_pools:
+            player_pool.play(
+                url, sound, priority=priority, choke_group=choke_group, volume=volume, start_ms=start_ms,
+                end_ms=end_ms, trace=trace
+            )
 
     def stop_all_playback(self):
         for player_pool in self._player_pools:
@@ -0,0 +1,243 @@
+import json
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from hotkey_entry import HotkeyEntry
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE: int = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    hotkey TEXT NOT NULL,
+    sound_path TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    choke_group TEXT,
+    cooldown_ms INTEGER,
+    keyword TEXT,
+    start_offset_ms INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_profile_id ON entries (profile_id, id);
+CREATE INDEX IF NOT EXISTS entries_profile_hotkey ON entries (profile_id, hotkey);
+CREATE TABLE IF NOT EXISTS entry_usage (
+    entry_id INTEGER PRIMARY KEY REFERENCES entries(id) ON DELETE CASCADE,
+    score REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# Columns added after the first version of the schema, added to existing databases on open
+_ADDED_ENTRY_COLUMNS = {"start_offset_ms": "INTEGER"}
+
+_ENTRY_COLUMNS = "id, hotkey, sound_path, priority, choke_group, cooldown_ms, keyword, start_offset_ms"
+# SQLite limits number of query parameters, ids are looked up in chunks of this many
+_ID_CHUNK_SIZE: int = 500
+
+# Entry id -> (usage score, time.time() it was last updated)
+EntryUsage = Dict[int, Tuple[float, float]]
+
+
+class ProfileStoreError(Exception):
+    pass
+
+
+class ProfileStore:
+    """
+    Profiles and their hotkey entries saved in a SQLite database.
+
+    Each change is its own small transaction so adding, updating or deleting an entry costs the same no matter how big
+    the profile is, and a crash can't leave a half written profile behind (database runs in WAL journal mode).
+    Unlike json profiles a hotkey can have any number of entries, each entry gets a unique entry_id once saved.
+    Entries are read in pages ordered by the order they were added.
+    """
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(entries)")}
+            for column, column_type in _ADDED_ENTRY_COLUMNS.items():
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE entries ADD COLUMN {column} {column_type}")
+
+    def close(self):
+        self._connection.close()
+
+    def profile_names(self) -> List[str]:
+        return [name for name, in self._connection.execute("SELECT name FROM profiles ORDER BY id")]
+
+    def has_profile(self, name: str) -> bool:
+        return self._profile_id(name) is not None
+
+    def _profile_id(self, name: str) -> Optional[int]:
+        row = self._connection.execute("SELECT id FROM profiles WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _existing_profile_id(self, name: str) -> int:
+        profile_id = self._profile_id(name)
+        if profile_id is None:
+            raise ProfileStoreError(f"Profile '{name}' doesn't exist.")
+        return profile_id
+
+    def create_profile(self, name: str) -> bool:
+        """Create empty profile, return False if profile with that name already exists."""
+        with self._connection:
+            cursor = self._connection.execute("INSERT OR IGNORE INTO profiles (name) VALUES (?)", (name,))
+        return cursor.rowcount == 1
+
+    def delete_profile(self, name: str):
+        with self._connection:
+            self._connection.execute("DELETE FROM profiles WHERE name = ?", (name,))
+
+    def entry_count(self, profile_name: str) -> int:
+        profile_id = self._existing_profile_id(profile_name)
+        query = "SELECT COUNT(*) FROM entries WHERE profile_id = ?"
+        return self._connection.execute(query, (profile_id,)).fetchone()[0]
+
+    def add_entry(self, profile_name: str, entry: HotkeyEntry) -> HotkeyEntry:
+        """Save new entry to profile, entry_id of the entry is set to its id in the store."""
+        self.add_entries(profile_name, [entry])
+        return entry
+
+    def add_entries(self, profile_name: str, entries: List[HotkeyEntry]):
+        """Save many new entries in a single transaction."""
+        profile_id = self._existing_profile_id(profile_name)
+        with self._connection:
+            self._insert_entries(profile_id, entries)
+
+    def _insert_entries(self, profile_id: int, entries: List[HotkeyEntry]):
+        for entry in entries:
+            cursor = self._connection.execute(
+                f"INSERT INTO entries (profile_id, {_ENTRY_COLUMNS}) VALUES (?, NULL, ?, ?, ?, ?, ?, ?, ?)",
+                (profile_id, *self._entry_values(entry))
+            )
+            entry.entry_id = cursor.lastrowid
+
+    def update_entry(self, entry: HotkeyEntry):
+        if entry.entry_id is None:
+            raise ProfileStoreError(f"Entry for hotkey '{entry.hotkey}' was never saved.")
+
+        with self._connection:
+            self._connection.execute(
+                "UPDATE entries SET hotkey = ?, sound_path = ?, priority = ?, choke_group = ?, cooldown_ms = ?, "
+                "keyword = ?, start_offset_ms = ? WHERE id = ?",
+                (*self._entry_values(entry), entry.entry_id)
+            )
+
+    def delete_entry(self, entry: HotkeyEntry):
+        with self._connection:
+            self._connection.execute("DELETE FROM entries WHERE id = ?", (entry.entry_id,))
+        entry.entry_id = None
+
+    @classmethod
+    def _entry_values(cls, entry: HotkeyEntry) -> tuple:
+        return (
+            entry.hotkey, entry.sound_path, entry.priority, entry.choke_group, entry.cooldown_ms, entry.keyword,
+            entry.start_offset_ms
+        )
+
+    @classmethod
+    def _entry_from_row(cls, row: tuple) -> HotkeyEntry:
+        entry_id, hotkey, sound_path, priority, choke_group, cooldown_ms, keyword, start_offset_ms = row
+        return HotkeyEntry(
+            hotkey, sound_path, priority=priority, choke_group=choke_group, cooldown_ms=cooldown_ms,
+            start_offset_ms=start_offset_ms, keyword=keyword, entry_id=entry_id
+        )
+
+    def entries_page(
+            self, profile_name: str, *, after_id: int = 0, limit: int = DEFAULT_PAGE_SIZE
+    ) -> List[HotkeyEntry]:
+        """
+        Return up to limit entries added after entry with after_id.
+        Pages are found trough index by entry id so reading any page is equally fast, unlike with offset.
+        """
+        profile_id = self._existing_profile_id(profile_name)
+        rows = self._connection.execute(
+            f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE profile_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (profile_id, after_id, limit)
+        )
+        return [self._entry_from_row(row) for row in rows]
+
+    def iter_entries(self, profile_name: str, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[List[HotkeyEntry]]:
+        """Iterate over all entries of profile page by page."""
+        after_id = 0
+        while True:
+            page = self.entries_page(profile_name, after_id=after_id, limit=page_size)
+            if not page:
+                return
+            yield page
+            after_id = page[-1].entry_id
+
+    def entries(self, profile_name: str) -> List[HotkeyEntry]:
+        return [entry for page in self.iter_entries(profile_name) for entry in page]
+
+    def entry_usage(self, entry_ids: Iterable[int]) -> EntryUsage:
+        """Saved usage of entries, entries that were never used are left out."""
+        entry_ids = [entry_id for entry_id in entry_ids if entry_id is not None]
+        usage = {}
+        for start in range(0, len(entry_ids), _ID_CHUNK_SIZE):
+            chunk = entry_ids[start:start + _ID_CHUNK_SIZE]
+            rows = self._connection.execute(
+                f"SELECT entry_id, score, updated FROM entry_usage WHERE entry_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            usage.update((entry_id, (score, updated)) for entry_id, score, updated in rows)
+        return usage
+
+    def save_entry_usage(self, usage: EntryUsage):
+        """Save usage of entries in a single transaction, usage of entries deleted in the meantime is skipped."""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entry_usage (entry_id, score, updated) "
+                "SELECT id, ?, ? FROM entries WHERE id = ?",
+                ((score, updated, entry_id) for entry_id, (score, updated) in usage.items())
+            )
+
+    def import_json(self, path: Path, profile_name: str = None) -> int:
+        """
+        Import old json profile (hotkey: entry), profile is named after the file unless profile_name is given.
+        Return number of imported entries, nothing is imported if profile with that name already exists.
+        Profile is created together with its entries in a single transaction so it's never imported only partially.
+        """
+        profile_name = profile_name or path.stem
+        with open(path) as f:
+            entries = [HotkeyEntry.from_json(hotkey, value) for hotkey, value in json.load(f).items()]
+
+        with self._connection:
+            cursor = self._connection.execute("INSERT OR IGNORE INTO profiles (name) VALUES (?)", (profile_name,))
+            if cursor.rowcount != 1:
+                logger.info(f"Not importing '{path}', profile '{profile_name}' already exists.")
+                return 0
+            self._insert_entries(cursor.lastrowid, entries)
+        logger.info(f"Imported {len(entries)} entries from '{path}' to profile '{profile_name}'.")
+        return len(entries)
+
+    def import_json_directory(self, directory: Path):
+        """Import all json profiles from directory which don't have a profile with the same name yet."""
+        for path in sorted(directory.glob("**/*.json")):
+            if self.has_profile(path.stem):
+                continue
+            try:
+                self.import_json(path)
+            except Exception as e:  # noqa PyBroadException one broken file shouldn't stop importing others
+                logger.warning(f"Can't import profile '{path}': {e}")
+
+    def export_json(self, profile_name: str, path: Path):
+        """Export profile to json, hotkeys with multiple entries keep only the last one as json can't hold more."""
+        data = {entry.hotkey: entry.to_json() for entry in self.entries(profile_name)}
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+
@@ -0,0 +1,189 @@
+"""
+Sampling profiler for finding where time goes while the program runs, in every thread at once: GUI thread (play_sound,
+player pools, Qt), hotkey listener and keyboard hook threads. Memory is tracked with tracemalloc at the same time.
+
+Nothing runs while profiler is stopped, no thread, no hooks and no allocation tracing. Results are written to
+timestamped files in the working directory, next to log.txt:
+    runtime_profile_<time>.txt          samples per thread, functions by self and total time, memory growth
+    runtime_profile_<time>.folded       sampled stacks in collapsed format, for flamegraph.pl or speedscope
+    runtime_profile_<time>_memory_<n>.txt   memory snapshots taken while profiling, diffed against previous one
+"""
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from pathlib import Path
+from collections import Counter
+from types import CodeType
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL_MS: float = 5
+# Frames closest to the thread start are cut off from deeper stacks
+MAX_STACK_DEPTH: int = 64
+# Allocation traceback depth, 1 groups allocations by line and keeps tracing overhead lowest
+TRACEMALLOC_FRAMES: int = 1
+TOP_FUNCTIONS: int = 25
+TOP_ALLOCATIONS: int = 25
+
+# Thread name followed by code objects from thread start to the sampled frame
+Stack = Tuple[str, Tuple[CodeType, ...]]
+
+
+def _function_name(code: CodeType) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class RuntimeProfiler:
+    """
+    Samples stacks of all Python threads from a background thread every few milliseconds while running.
+    Start and stop from the GUI thread, snapshot can be taken any time while running.
+    """
+    def __init__(self, output_directory: Path = Path("."), interval_ms: float = SAMPLE_INTERVAL_MS):
+        self.output_directory = output_directory
+        self.interval_ms = interval_ms
+        self._thread: Optional[threading.Thread] = None
+        self._stop_sampling = threading.Event()
+        self._stacks: Dict[Stack, int] = Counter()
+        self._sample_count = 0
+        self._started = 0.0
+        self._file_stem = ""
+        self._started_tracemalloc = False
+        self._first_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_count = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Start sampling and tracing allocations, does nothing if already running."""
+        if self.running:
+            return
+
+        self._stacks = Counter()
+        self._sample_count = 0
+        self._snapshot_count = 0
+        self._file_stem = f"runtime_profile_{time.strftime('%Y%m%d-%H%M%S')}"
+        # Someone else (PYTHONTRACEMALLOC) may be tracing already, it's left running then
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._first_snapshot = self._last_snapshot = tracemalloc.take_snapshot()
+
+        self._stop_sampling.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name="runtime profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Runtime profiler started, sampling every {self.interval_ms} ms.")
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        interval = self.interval_ms / 1000
+        while not self._stop_sampling.wait(interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                codes = []
+                while frame is not None and len(codes) < MAX_STACK_DEPTH:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                self._stacks[thread_names.get(ident, f"thread {ident}"), tuple(codes)] += 1
+            self._sample_count += 1
+
+    def snapshot(self) -> Path:
+        """
+        Write memory allocated since previous snapshot (or start) by line, while running.
+        :return: Path of written file
+        """
+        if not self.running:
+            raise RuntimeError("Memory snapshots are taken only while runtime profiler runs.")
+
+        snapshot = tracemalloc.take_snapshot()
+        self._snapshot_count += 1
+        path = self.output_directory / f"{self._file_stem}_memory_{self._snapshot_count}.txt"
+        with open(path, "w") as f:
+            f.write(self._memory_report(snapshot, self._last_snapshot, "since previous snapshot"))
+        self._last_snapshot = snapshot
+        logger.info(f"Memory snapshot written to {path}")
+        return path
+
+    def stop(self) -> List[Path]:
+        """
+        Stop sampling and tracing allocations and write results.
+        :return: list of Paths of written files, empty if profiler wasn't running
+        """
+        if not self.running:
+            return []
+
+        self._stop_sampling.set()
+        self._thread.join()
+        self._thread = None
+        duration = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        summary_path = self.output_directory / f"{self._file_stem}.txt"
+        with open(summary_path, "w") as f:
+            f.write(self._summary(duration))
+            f.write("\n")
+            f.write(self._memory_report(snapshot, self._first_snapshot, "since profiler started"))
+        folded_path = self.output_directory / f"{self._file_stem}.folded"
+        with open(folded_path, "w") as f:
+            for (thread_name, codes), count in self._stacks.items():
+                f.write(";".join((thread_name, *map(_function_name, codes))))
+                f.write(f" {count}\n")
+
+        self._first_snapshot = self._last_snapshot = None
+        logger.info(f"Runtime profiler stopped after {duration:.1f} s, results written to {summary_path}")
+        return [summary_path, folded_path]
+
+    def _summary(self, duration: float) -> str:
+        samples_by_thread: Dict[str, int] = Counter()
+        self_samples: Dict[str, Counter] = {}
+        total_samples: Dict[str, Counter] = {}
+        for (thread_name, codes), count in self._stacks.items():
+            samples_by_thread[thread_name] += count
+            if codes:
+                self_samples.setdefault(thread_name, Counter())[codes[-1]] += count
+            # Recursive functions count once per sample
+            for code in set(codes):
+                total_samples.setdefault(thread_name, Counter())[code] += count
+
+        lines = [
+            f"Runtime profile: {duration:.1f} s, {self._sample_count} samples every {self.interval_ms} ms",
+            "Idle threads are sampled too, waiting shows up as time in the function that waits (event loop, locks)."
+        ]
+        for thread_name, thread_samples in sorted(samples_by_thread.items(), key=lambda item: -item[1]):
+            lines.append("")
+            lines.append(f"Thread '{thread_name}', {thread_samples} samples")
+            lines.append(f"    {'self %':>7} {'total %':>8}  function")
+            for code, count in self_samples.get(thread_name, Counter()).most_common(TOP_FUNCTIONS):
+                total = total_samples[thread_name][code]
+                lines.append(
+                    f"    {count / thread_samples:>7.1%} {total / thread_samples:>8.1%}  {_function_name(code)}"
+                )
+            lines.append(f"    {'':>7} {'total %':>8}  function, by total")
+            for code, total in total_samples.get(thread_name, Counter()).most_common(TOP_FUNCTIONS):
+                lines.append(f"    {'':>7} {total / thread_samples:>8.1%}  {_function_name(code)}")
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def _memory_report(cls, snapshot: tracemalloc.Snapshot, previous: tracemalloc.Snapshot, title: str) -> str:
+        # Profiler's own sample counts would show up as growth too
+        own_allocations = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        statistics = snapshot.filter_traces(own_allocations).compare_to(
+            previous.filter_traces(own_allocations), "lineno"
+        )
+        growth = sum(statistic.size_diff for statistic in statistics)
+        lines = [f"Memory allocated {title}, by line ({growth / 1024:+.1f} KiB in total)"]
+        for statistic in statistics[:TOP_ALLOCATIONS]:
+            lines.append(f"    {statistic}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,112 @@
+from typing import Any
+
+from config import Config
+from sound_cache import MEGABYTE
+from player_pool import PlayerPoolManager, VOICE_STEALING_POLICIES
+from latency_tracing import LatencyTracer
+from hotkey_dispatcher import HotkeyDispatcher
+from keyword_matcher import KeywordMatcher
+from loudness import LoudnessAnalyzer
+from sound_preloader import SoundPreloader, DEFAULT_PRELOAD_COUNT, DEFAULT_PRELOAD_BUDGET
+
+
+class SavedSettings:
+    """
+    Settings as saved by settings window, applied without creating any widgets.
+    Settings window applies each change as it's made, headless mode only ever uses these.
+    """
+    # Values settings widgets have in the layout, in effect until they are changed for the first time
+    DEFAULTS = {
+        "check_minimize_to_tray": True,
+        "check_minimize_on_close": True,
+        "check_show_try_msg_on_minimize": True,
+        "check_enable_additional_playback_device": False,
+        "slider_max_concurrent_sounds": 1,
+        "slider_max_keyword_length": 7,
+        "slider_sound_cache_size": 128,
+        "check_no_repeat_directory_sounds": False,
+        "check_trace_latency": False,
+        "spin_box_hotkey_repeat_window": 150,
+        "spin_box_hotkey_cooldown": 0,
+        "spin_box_hotkey_rate_limit": 0,
+        "check_normalize_loudness": False,
+        "check_skip_leading_silence": False,
+        "check_trim_trailing_silence": False,
+        "check_transcode_sounds": False,
+        "spin_box_preload_sounds": DEFAULT_PRELOAD_COUNT,
+        "spin_box_preload_budget": DEFAULT_PRELOAD_BUDGET // MEGABYTE
+    }
+
+    @classmethod
+    def saved_value(cls, name: str) -> Any:
+        """Value of setting widget with objectName name, as saved in config or default one if it was never changed."""
+        return Config.get(name, cls.DEFAULTS.get(name))
+
+    @classmethod
+    def apply_saved_settings(
+            cls, player_pool_manager: PlayerPoolManager, latency_tracer: LatencyTracer,
+            hotkey_dispatcher: HotkeyDispatcher, keyword_matcher: KeywordMatcher, loudness_analyzer: LoudnessAnalyzer
+    ):
+        """
+        Apply saved settings without creating settings window, window is created only when it's opened.
+        Output devices are not changed here as that needs device enumeration, see apply_saved_devices.
+        """
+        player_pool_manager.set_max_concurrent_sounds(cls.saved_max_concurrent_sounds(player_pool_manager))
+        player_pool_manager.sound_cache.budget_bytes = cls.saved_value("slider_sound_cache_size") * MEGABYTE
+        player_pool_manager.set_player_pool_enabled(1, cls.saved_value("check_enable_additional_playback_device"))
+        voice_stealing_policy = cls.saved_value("combo_box_voice_stealing_policy")
+        if voice_stealing_policy in VOICE_STEALING_POLICIES:
+            player_pool_manager.set_voice_stealing_policy(voice_stealing_policy)
+        keyword_matcher.max_keyword_length = cls.saved_value("slider_max_keyword_length")
+        latency_tracer.enabled = cls.saved_value("check_trace_latency")
+        hotkey_dispatcher.repeat_window_ms = cls.saved_value("spin_box_hotkey_repeat_window")
+        hotkey_dispatcher.cooldown_ms = cls.saved_value("spin_box_hotkey_cooldown")
+        hotkey_dispatcher.rate_limit_per_second = cls.saved_value("spin_box_hotkey_rate_limit")
+        cls._set_loudness_analysis(
+            player_pool_manager, loudness_analyzer, normalize_loudness=cls.saved_value("check_normalize_loudness"),
+            skip_leading_silence=cls.saved_value("check_skip_leading_silence"),
+            trim_trailing_silence=cls.saved_value("check_trim_trailing_silence")
+        )
+        if player_pool_manager.transcode_cache is not None:
+            player_pool_manager.transcode_cache.enabled = cls.saved_value("check_transcode_sounds")
+
+    @classmethod
+    def saved_max_concurrent_sounds(cls, player_pool_manager: PlayerPoolManager) -> int:
+        """
+        Saved max concurrent sounds, clamped to what the playback engine supports like the slider clamps it.
+        Value saved with the other engine (or with software mixer on a system without numpy) may be out of range.
+        """
+        return min(
+            max(cls.saved_value("slider_max_concurrent_sounds"), player_pool_manager.MIN_MAX_CONCURRENT_SOUNDS),
+            player_pool_manager.MAX_MAX_CONCURRENT_SOUNDS
+        )
+
+    @classmethod
+    def apply_saved_preloading(cls, sound_preloader: SoundPreloader):
+        """Preloader is created once profiles are opened, after other saved settings were applied."""
+        sound_preloader.preload_count = cls.saved_value("spin_box_preload_sounds")
+        sound_preloader.budget_bytes = cls.saved_value("spin_box_preload_budget") * MEGABYTE
+
+    @classmethod
+    def _set_loudness_analysis(
+            cls, player_pool_manager: PlayerPoolManager, loudness_analyzer: LoudnessAnalyzer, *,
+            normalize_loudness: bool, skip_leading_silence: bool, trim_trailing_silence: bool
+    ):
+        """Sounds are analyzed in background as long as any option that uses the measurements is enabled."""
+        loudness_analyzer.enabled = normalize_loudness or skip_leading_silence or trim_trailing_silence
+        # Analyzer stays disabled if numpy is missing
+        player_pool_manager.loudness_index = loudness_analyzer.index if loudness_analyzer.enabled else None
+        player_pool_manager.normalize_loudness = normalize_loudness
+        player_pool_manager.skip_leading_silence = skip_leading_silence
+        player_pool_manager.trim_trailing_silence = trim_trailing_silence
+
+    @classmethod
+    def apply_saved_devices(cls, player_pool_manager: PlayerPoolManager):
+        """Switch player pools to saved output devices, if any were saved."""
+        for player_pool, name in (
+                (player_pool_manager.main_player_pool, "combo_box_virtual_device"),
+                (player_pool_manager.additional_player_pool, "combo_box_additional_playback_device")
+        ):
+            device_name = cls.saved_value(name)
+            if device_name is not None and device_name != player_pool.device_name:
+                player_pool.change_device(device_name)
@@ -1,41 +1,102 @@
-from PyQt5 import uic
 from PyQt5.QtCore import pyqtSlot
-from PyQt5.QtWidgets import QWidget, qApp, QStyle
+from PyQt5.QtWidgets import QWidget, QComboBox, qApp, QStyle
 
 from config import Config
-from message_boxes import show_simple_info_message
-from player_pool import PlayerPoolManager, MIN_MAX_CONCURRENT_SOUNDS, MAX_MAX_CONCURRENT_SOUNDS
+from ui_loader import load_ui
+from message_boxes import show_simple_info_message, show_simple_success_message
+from sound_cache import MEGABYTE
+from player_pool import PlayerPool, PlayerPoolManager, VOICE_STEALING_POLICIES
+from constants import PLAYBACK_ENGINES
+from latency_tracing import LatencyTracer, LATENCY_STATS_PATH
+from hotkey_dispatcher import HotkeyDispatcher
+from keyword_matcher import KeywordMatcher, MAX_MAX_KEYWORD_LENGTH
+from loudness import LoudnessAnalyzer, TARGET_LOUDNESS_LUFS
+from sound_preloader import SoundPreloader
+from saved_settings import SavedSettings
 
 
-class SettingsUi(QWidget):
-    def __init__(self, player_pool_manager: PlayerPoolManager):
+class SettingsUi(QWidget, SavedSettings):
+    def __init__(
+            self, player_pool_manager: PlayerPoolManager, latency_tracer: LatencyTracer,
+            hotkey_dispatcher: HotkeyDispatcher, keyword_matcher: KeywordMatcher, loudness_analyzer: LoudnessAnalyzer,
+            sound_preloader: SoundPreloader
+    ):
         super(SettingsUi, self).__init__()
-        uic.loadUi("layouts/settings.ui", self)
+        load_ui("settings.ui", self)
         self.setFixedSize(self.size())
 
         self._player_pool_manager_ref = player_pool_manager
+        self._latency_tracer_ref = latency_tracer
+        self._hotkey_dispatcher_ref = hotkey_dispatcher
+        self._keyword_matcher_ref = keyword_matcher
+        self._loudness_analyzer_ref = loudness_analyzer
+        self._sound_preloader_ref = sound_preloader
 
-        self.combo_box_virtual_device.addItems(self._player_pool_manager_ref.main_player_pool.available_devices())
+        self.populate_device_combo_boxes()
+        # All pools play trough the same backend so they share one device registry
+        self._player_pool_manager_ref.main_player_pool.device_registry.devices_changed.connect(
+            self.populate_device_combo_boxes
+        )
         self.combo_box_virtual_device.currentTextChanged.connect(self.on_virtual_device_combobox_changed)
         self.help_virtual_audio_device.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
         self.help_virtual_audio_device.clicked.connect(self.show_help_virtual_audio_device)
 
         self.check_enable_additional_playback_device.stateChanged.connect(self.check_enable_additional_playback_device_changed)
-        self.combo_box_additional_playback_device.addItems(self._player_pool_manager_ref.additional_player_pool.available_devices())
         self.combo_box_additional_playback_device.currentTextChanged.connect(self.on_additional_playback_device_combobox_changed)
         self.help_additional_playback_device.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
         self.help_additional_playback_device.clicked.connect(self.show_help_additional_playback_device)
 
+        self.slider_max_concurrent_sounds.setMaximum(self._player_pool_manager_ref.MAX_MAX_CONCURRENT_SOUNDS)
         self.label_max_concurrent_sounds_value.setText(str(self._slider_meta_value()))
         self.slider_max_concurrent_sounds.valueChanged.connect(self.slider_max_concurrent_sounds_changed)
         self.help_max_concurrent_sounds.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
         self.help_max_concurrent_sounds.clicked.connect(self.show_help_max_concurrent_sounds)
 
-        # self.label_max_keyword_length_value.setText(str(self._slider_meta_value()))
+        self.slider_max_keyword_length.setMaximum(MAX_MAX_KEYWORD_LENGTH)
+        self.label_max_keyword_length_value.setText(str(self.slider_max_keyword_length.value()))
         self.slider_max_keyword_length.valueChanged.connect(self.slider_max_keyword_length_changed)
         self.help_maximum_keyword_length.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
         self.help_maximum_keyword_length.clicked.connect(self.show_help_maximum_keyword_length)
 
+        self.slider_sound_cache_size.valueChanged.connect(self.slider_sound_cache_size_changed)
+        self.help_sound_cache_size.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_sound_cache_size.clicked.connect(self.show_help_sound_cache_size)
+
+        self.combo_box_playback_engine.addItems(PLAYBACK_ENGINES)
+        self.help_playback_engine.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_playback_engine.clicked.connect(self.show_help_playback_engine)
+
+        self.combo_box_voice_stealing_policy.addItems(VOICE_STEALING_POLICIES)
+        self.combo_box_voice_stealing_policy.currentTextChanged.connect(self.on_voice_stealing_policy_combobox_changed)
+        self.help_voice_stealing_policy.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_voice_stealing_policy.clicked.connect(self.show_help_voice_stealing_policy)
+
+        self.check_trace_latency.stateChanged.connect(self.check_trace_latency_changed)
+        self.button_export_latency_stats.clicked.connect(self.export_latency_stats)
+        self.help_trace_latency.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_trace_latency.clicked.connect(self.show_help_trace_latency)
+
+        self.spin_box_hotkey_repeat_window.valueChanged.connect(self.spin_box_hotkey_repeat_window_changed)
+        self.spin_box_hotkey_cooldown.valueChanged.connect(self.spin_box_hotkey_cooldown_changed)
+        self.spin_box_hotkey_rate_limit.valueChanged.connect(self.spin_box_hotkey_rate_limit_changed)
+        self.help_hotkey_dispatch.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_hotkey_dispatch.clicked.connect(self.show_help_hotkey_dispatch)
+
+        self.check_normalize_loudness.stateChanged.connect(self.check_loudness_analysis_changed)
+        self.help_normalize_loudness.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_normalize_loudness.clicked.connect(self.show_help_normalize_loudness)
+        self.check_skip_leading_silence.stateChanged.connect(self.check_loudness_analysis_changed)
+        self.check_trim_trailing_silence.stateChanged.connect(self.check_loudness_analysis_changed)
+        self.help_trim_silence.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_trim_silence.clicked.connect(self.show_help_trim_silence)
+        self.check_transcode_sounds.stateChanged.connect(self.check_transcode_sounds_changed)
+        self.help_transcode_sounds.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_transcode_sounds.clicked.connect(self.show_help_transcode_sounds)
+        self.spin_box_preload_sounds.valueChanged.connect(self.spin_box_preload_sounds_changed)
+        self.spin_box_preload_budget.valueChanged.connect(self.spin_box_preload_budget_changed)
+        self.help_preload_sounds.setIcon(qApp.style().standardIcon(QStyle.SP_MessageBoxQuestion))
+        self.help_preload_sounds.clicked.connect(self.show_help_preload_sounds)
+
         # Load states from previous run
         Config.register_combobox(self.combo_box_virtual_device)
         Config.register_checkbox(self.check_enable_additional_playback_device)
@@ -43,10 +104,48 @@ class SettingsUi(QWidget):
         Config.register_slider(self.slider_max_concurrent_sounds)
         self._player_pool_manager_ref.set_max_concurrent_sounds(int(self.slider_max_concurrent_sounds.value()))
         Config.register_slider(self.slider_max_keyword_length)
-        # todo add values based on above
+        self.slider_max_keyword_length_changed()
+        Config.register_slider(self.slider_sound_cache_size)
+        self.slider_sound_cache_size_changed()
         Config.register_checkbox(self.check_minimize_to_tray)
         Config.register_checkbox(self.check_show_try_msg_on_minimize)
         Config.register_checkbox(self.check_minimize_on_close)
+        Config.register_checkbox(self.check_no_repeat_directory_sounds)
+        Config.register_combobox(self.combo_box_playback_engine)
+        Config.register_combobox(self.combo_box_voice_stealing_policy)
+        Config.register_checkbox(self.check_trace_latency)
+        Config.register_spinbox(self.spin_box_hotkey_repeat_window)
+        self.spin_box_hotkey_repeat_window_changed(self.spin_box_hotkey_repeat_window.value())
+        Config.register_spinbox(self.spin_box_hotkey_cooldown)
+        self.spin_box_hotkey_cooldown_changed(self.spin_box_hotkey_cooldown.value())
+        Config.register_spinbox(self.spin_box_hotkey_rate_limit)
+        self.spin_box_hotkey_rate_limit_changed(self.spin_box_hotkey_rate_limit.value())
+        Config.register_checkbox(self.check_normalize_loudness)
+        Config.register_checkbox(self.check_skip_leading_silence)
+        Config.register_checkbox(self.check_trim_trailing_silence)
+        Config.register_checkbox(self.check_transcode_sounds)
+        Config.register_spinbox(self.spin_box_preload_sounds)
+        self.spin_box_preload_sounds_changed(self.spin_box_preload_sounds.value())
+        Config.register_spinbox(self.spin_box_preload_budget)
+        self.spin_box_preload_budget_changed(self.spin_box_preload_budget.value())
+
+    @pyqtSlot()
+    def populate_device_combo_boxes(self):
+        """Fill device combo boxes with currently available devices, keeping device of each pool selected."""
+        for combo_box, player_pool in (
+                (self.combo_box_virtual_device, self._player_pool_manager_ref.main_player_pool),
+                (self.combo_box_additional_playback_device, self._player_pool_manager_ref.additional_player_pool)
+        ):
+            self._populate_device_combo_box(combo_box, player_pool)
+
+    @classmethod
+    def _populate_device_combo_box(cls, combo_box: QComboBox, player_pool: PlayerPool):
+        # Refilling is not a selection made by the user, it shouldn't switch the device or be saved to config
+        combo_box.blockSignals(True)
+        combo_box.clear()
+        combo_box.addItems(player_pool.available_devices())
+        combo_box.setCurrentText(player_pool.device_name)
+        combo_box.blockSignals(False)
 
     @pyqtSlot(str)
     def on_virtual_device_combobox_changed(self, value: str):
@@ -54,15 +153,62 @@ class SettingsUi(QWidget):
 
     @pyqtSlot(int)
     def check_enable_additional_playback_device_changed(self, _value: int):
-        if self.check_enable_additional_playback_device.isChecked():
-            self.combo_box_additional_playback_device.setEnabled(True)
-        else:
-            self.combo_box_additional_playback_device.setEnabled(False)
+        enabled = self.check_enable_additional_playback_device.isChecked()
+        self.combo_box_additional_playback_device.setEnabled(enabled)
+        self._player_pool_manager_ref.set_player_pool_enabled(1, enabled)
 
     @pyqtSlot(str)
     def on_additional_playback_device_combobox_changed(self, value: str):
         self._player_pool_manager_ref.additional_player_pool.change_device(value)
 
+    @pyqtSlot(str)
+    def on_voice_stealing_policy_combobox_changed(self, value: str):
+        self._player_pool_manager_ref.set_voice_stealing_policy(value)
+
+    @pyqtSlot(int)
+    def check_trace_latency_changed(self, _value: int):
+        self._latency_tracer_ref.enabled = self.check_trace_latency.isChecked()
+
+    @pyqtSlot(int)
+    def spin_box_hotkey_repeat_window_changed(self, value: int):
+        self._hotkey_dispatcher_ref.repeat_window_ms = value
+
+    @pyqtSlot(int)
+    def spin_box_hotkey_cooldown_changed(self, value: int):
+        self._hotkey_dispatcher_ref.cooldown_ms = value
+
+    @pyqtSlot(int)
+    def spin_box_hotkey_rate_limit_changed(self, value: int):
+        self._hotkey_dispatcher_ref.rate_limit_per_second = value
+
+    @pyqtSlot(int)
+    def check_loudness_analysis_changed(self, _value: int):
+        self._set_loudness_analysis(
+            self._player_pool_manager_ref, self._loudness_analyzer_ref,
+            normalize_loudness=self.check_normalize_loudness.isChecked(),
+            skip_leading_silence=self.check_skip_leading_silence.isChecked(),
+            trim_trailing_silence=self.check_trim_trailing_silence.isChecked()
+        )
+
+    @pyqtSlot(int)
+    def check_transcode_sounds_changed(self, _value: int):
+        transcode_cache = self._player_pool_manager_ref.transcode_cache
+        if transcode_cache is not None:
+            transcode_cache.enabled = self.check_transcode_sounds.isChecked()
+
+    @pyqtSlot(int)
+    def spin_box_preload_sounds_changed(self, value: int):
+        self._sound_preloader_ref.preload_count = value
+
+    @pyqtSlot(int)
+    def spin_box_preload_budget_changed(self, value: int):
+        self._sound_preloader_ref.budget_bytes = value * MEGABYTE
+
+    @pyqtSlot()
+    def export_latency_stats(self):
+        self._latency_tracer_ref.dump(LATENCY_STATS_PATH)
+        show_simple_success_message(f"Latency stats saved to '{LATENCY_STATS_PATH.resolve()}'.")
+
     def _slider_meta_value(self) -> int:
         """
         Instead of getting raw slider value get the value that current slider represents (the two might not be the same
@@ -70,9 +216,10 @@ class SettingsUi(QWidget):
         This is dynamic and is made so it's easy to change ranges in the future.
         """
         slider_range = self.slider_max_concurrent_sounds.maximum() - self.slider_max_concurrent_sounds.minimum()
-        value_rage = MAX_MAX_CONCURRENT_SOUNDS - MIN_MAX_CONCURRENT_SOUNDS
+        min_value = self._player_pool_manager_ref.MIN_MAX_CONCURRENT_SOUNDS
+        value_rage = self._player_pool_manager_ref.MAX_MAX_CONCURRENT_SOUNDS - min_value
         step_value = (self.slider_max_concurrent_sounds.value() - 1) / slider_range
-        return int(MIN_MAX_CONCURRENT_SOUNDS + value_rage * step_value)
+        return int(min_value + value_rage * step_value)
 
     @pyqtSlot()
     def slider_max_concurrent_sounds_changed(self):
@@ -82,9 +229,15 @@ class SettingsUi(QWidget):
 
     @pyqtSlot()
     def slider_max_keyword_length_changed(self):
-        new_value = self._slider_meta_value()
+        new_value = self.slider_max_keyword_length.value()
         self.label_max_keyword_length_value.setText(str(new_value))
-        raise NotImplemented()
+        self._keyword_matcher_ref.max_keyword_length = new_value
+
+    @pyqtSlot()
+    def slider_sound_cache_size_changed(self):
+        new_value = self.slider_sound_cache_size.value()
+        self.label_sound_cache_size_value.setText(str(new_value))
+        self._player_pool_manager_ref.sound_cache.budget_bytes = new_value * MEGABYTE
 
     @pyqtSlot()
     def show_help_virtual_audio_device(self):
@@ -107,8 +260,8 @@ class SettingsUi(QWidget):
     def show_help_max_concurrent_sounds(self):
         show_simple_info_message(
             "Maximum number of sounds that can play at the same time.\n\n"
-            "Once this limit is exceeded the oldest currently playing sound will stop playing "
-            "and new sound will play instead."
+            "Once this limit is exceeded one of currently playing sounds, selected by voice stealing setting, "
+            "will stop playing and new sound will play instead."
         )
 
     @pyqtSlot()
@@ -119,3 +272,114 @@ class SettingsUi(QWidget):
             "For example if you type DESPACITO it can trigger playing despacito file if it's set with that keyword.\n\n"
             "Setting this value to 0 will disable this feature."
         )
+
+    @pyqtSlot()
+    def show_help_sound_cache_size(self):
+        stats = self._player_pool_manager_ref.sound_cache.stats
+        show_simple_info_message(
+            "Memory used to keep recently played sounds decoded so they start playing faster next time.\n\n"
+            "Once this limit is exceeded the least recently played sound is removed from memory.\n"
+            "Setting this value to 0 will disable this feature.\n\n"
+            f"Currently cached: {stats['entries']} sounds, {stats['size_bytes'] / MEGABYTE:.1f} MB\n"
+            f"Hits: {stats['hits']}, misses: {stats['misses']}, evictions: {stats['evictions']}"
+        )
+
+    @pyqtSlot()
+    def show_help_playback_engine(self):
+        show_simple_info_message(
+            "How sounds are played, change takes effect after restarting the program.\n\n"
+            f"{PLAYBACK_ENGINES[0]}: every playing sound uses its own system media player.\n\n"
+            f"{PLAYBACK_ENGINES[1]}: all playing sounds are mixed into a single stream per device, this allows many "
+            "more sounds to play at the same time but needs numpy installed."
+        )
+
+    @pyqtSlot()
+    def show_help_voice_stealing_policy(self):
+        show_simple_info_message(
+            "Which playing sound is stopped when maximum number of concurrent sounds is reached:\n\n"
+            "Oldest: the sound that started playing first.\n"
+            "Quietest: the sound with lowest volume.\n"
+            "Lowest priority: the sound with lowest hotkey priority, new sound doesn't play at all if all playing "
+            "sounds have higher priority than it."
+        )
+
+    @pyqtSlot()
+    def show_help_trace_latency(self):
+        show_simple_info_message(
+            "Measure how long it takes from pressing a hotkey until the sound starts playing.\n\n"
+            "Each stage (key event, dispatch, file resolution, media load, playback start) is measured per hotkey and "
+            "per output device and summarized as p50/p95/p99 latencies.\n\n"
+            f"Stats can be exported here and are also saved to '{LATENCY_STATS_PATH}' on exit while tracing is enabled."
+        )
+
+    @pyqtSlot()
+    def show_help_hotkey_dispatch(self):
+        stats = self._hotkey_dispatcher_ref.stats
+        show_simple_info_message(
+            "Limits how often a hotkey can trigger its sound.\n\n"
+            "Repeat window: presses of the same hotkey that come faster than this are treated as a key being held "
+            "down and are ignored, so holding a key plays the sound only once.\n"
+            "Cooldown: minimum time between two sounds of the same hotkey, 0 disables it.\n"
+            "Rate limit: maximum number of sounds per second for each hotkey, 0 means unlimited.\n\n"
+            f"Triggers: {stats['submitted']}, played: {stats['dispatched']}, repeats ignored: {stats['coalesced']}, "
+            f"cooldown: {stats['cooldown']}, rate limited: {stats['rate_limited']}, dropped: {stats['dropped']}"
+        )
+
+    @pyqtSlot()
+    def show_help_normalize_loudness(self):
+        stats = self._loudness_analyzer_ref.stats
+        show_simple_info_message(
+            "Play all sounds at about the same loudness, without editing the files.\n\n"
+            "Loudness of every sound in the loaded profile (including sounds in directories) is measured in background "
+            f"once, and again only when the file changes. Sounds are then played at {TARGET_LOUDNESS_LUFS:g} LUFS.\n"
+            "Media player engine can only make loud sounds quieter, software mixer also makes quiet sounds louder.\n"
+            "Needs numpy installed.\n\n"
+            f"Analyzed: {stats['analyzed']}, unchanged: {stats['unchanged']}, failed: {stats['failed']}, "
+            f"in progress: {self._loudness_analyzer_ref.pending_count}"
+        )
+
+    @pyqtSlot()
+    def show_help_trim_silence(self):
+        stats = self._loudness_analyzer_ref.stats
+        show_simple_info_message(
+            "Start sounds right where they become audible and stop them once they go silent, without editing the "
+            "files.\n\n"
+            "Silence at the start and end of every sound in the loaded profile is measured in background together "
+            "with its loudness. Skipping leading silence makes sounds audible sooner after the hotkey is pressed, "
+            "trimming trailing silence frees up voices sooner.\n"
+            "Start of a single hotkey can be set when adding it, or with `start_offset_ms` in profile json where 0 "
+            "plays it from the start.\n"
+            "Needs numpy installed.\n\n"
+            f"Analyzed: {stats['analyzed']}, unchanged: {stats['unchanged']}, failed: {stats['failed']}, "
+            f"in progress: {self._loudness_analyzer_ref.pending_count}"
+        )
+
+    @pyqtSlot()
+    def show_help_transcode_sounds(self):
+        transcode_cache = self._player_pool_manager_ref.transcode_cache
+        stats = transcode_cache.stats if transcode_cache is not None else {}
+        show_simple_info_message(
+            "Convert sounds in formats that don't play on every system (anything but WAV and MP3) to WAV in "
+            "background, in the sample rate and channels of the output device.\n\n"
+            "Converted sounds play trough the same fast path as WAV files, until a sound is converted it plays from "
+            "the original file. Converted files are kept in the 'transcoded' directory and reused across runs, least "
+            "recently played ones are removed once it gets too big.\n"
+            "Needs numpy installed, soundfile makes converting faster.\n\n"
+            f"Played converted: {stats.get('hits', 0)}, converted: {stats.get('transcoded', 0)}, "
+            f"reused: {stats.get('reused', 0)}, failed: {stats.get('failed', 0)}, removed: {stats.get('evicted', 0)}"
+        )
+
+    @pyqtSlot()
+    def show_help_preload_sounds(self):
+        stats = self._sound_preloader_ref.stats
+        hit_rates = self._sound_preloader_ref.hit_rates
+        show_simple_info_message(
+            "Decode sounds of the most played hotkeys as soon as a profile is loaded, so even their first play "
+            "starts right away. Sound of a hotkey the mouse rests on in the table is decoded too.\n\n"
+            "Every play counts towards its hotkey, older plays count less and less (half after a week). Counts are "
+            "saved with the profile. Preloading stops at the number of sounds or memory set here, whichever comes "
+            "first, preloaded sounds also count towards sound cache size. 0 disables it.\n\n"
+            f"Preloaded: {stats['preloaded']} sounds, {self._sound_preloader_ref.preloaded_bytes / MEGABYTE:.1f} MB\n"
+            f"Played from memory: {hit_rates['hit_rate']:.0%} (preloaded {hit_rates['preloaded_hit_rate']:.0%}, "
+            f"hovered {hit_rates['hovered_hit_rate']:.0%}), plays: {stats['plays']}, misses: {stats['misses']}"
+        )
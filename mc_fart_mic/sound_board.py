@@ -0,0 +1,289 @@
+import logging
+from pathlib import Path
+from functools import partial
+from typing import List, Optional
+
+from PyQt5 import QtCore
+
+from config import Config
+from startup_profiler import StartupProfiler
+from saved_settings import SavedSettings
+from hotkey_entry import HotkeyEntry, DEFAULT_PRIORITY, MIN_PRIORITY, MAX_PRIORITY
+from latency_tracing import LatencyTracer, TriggerTrace, STAGE_FILE_RESOLVED, LATENCY_STATS_PATH
+from hotkey_dispatcher import HotkeyDispatcher
+from keyword_matcher import KeywordMatcher
+from hotkey_registry import HotkeyRegistry
+from loudness import LoudnessAnalyzer
+from profile_store import ProfileStore
+from directory_index import DirectoryIndexCache
+from sound_library import SoundLibrary
+from transcode_cache import TranscodeCache
+from trigger_server import TriggerServer, TriggerRequestError
+from runtime_profiler import RuntimeProfiler
+from sound_preloader import SoundPreloader
+from player_pool import PlayerPool, PlayerPoolManager
+from mixer import MixerOutput, MixerOutputManager, is_mixer_available
+from constants import PLAYBACK_ENGINES
+
+
+logger = logging.getLogger(__name__)
+
+
+def _request_int(
+        request: dict, key: str, default: Optional[int], min_value: int, max_value: int = None
+) -> Optional[int]:
+    """
+    Integer field of trigger request, checked before it gets anywhere near playback.
+    :raises TriggerRequestError: if field is set to something else than a whole number in range
+    """
+    value = request.get(key)
+    if value is None:
+        return default
+    # bool is an int too, but true isn't a priority
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise TriggerRequestError(f"'{key}' has to be a whole number.")
+    if value < min_value or (max_value is not None and value > max_value):
+        in_range = f"from {min_value} to {max_value}" if max_value is not None else f"at least {min_value}"
+        raise TriggerRequestError(f"'{key}' has to be {in_range}.")
+    return value
+
+
+class SoundBoard:
+    """
+    Everything that plays sounds, without any widgets: playback engine, hotkeys and keywords, loaded profile,
+    background analysis of sounds and trigger server.
+    Main window builds its widgets on top of it and overrides the hooks that have a visible side, headless mode runs
+    it on its own.
+    """
+    PROFILES_DIRECTORY = Path("profiles")
+    PROFILE_STORE_PATH = PROFILES_DIRECTORY / "profiles.sqlite3"
+    DEFAULT_PROFILE_NAME = "default"
+    # Config key of loaded profile, name of the profile combo box in main window
+    ACTIVE_PROFILE_KEY = "combo_box_profile"
+
+    player_pool_manager: PlayerPoolManager
+    profile: List[HotkeyEntry]
+    profile_store: ProfileStore
+    trigger_server: Optional[TriggerServer]
+
+    def create_sound_board(self, startup_profiler: StartupProfiler):
+        """Create playback engine and everything that feeds it, with saved settings applied."""
+        self.player_pool_manager = self.create_player_pool_manager()
+        self.sound_library = SoundLibrary()
+        self.directory_indexes = DirectoryIndexCache(self.sound_library)
+        self.latency_tracer = LatencyTracer()
+        self.hotkey_dispatcher = HotkeyDispatcher(self.play_entry, latency_tracer=self.latency_tracer)
+        self.keyword_matcher = KeywordMatcher(self.hotkey_dispatcher.submit)
+        self.hotkey_registry = HotkeyRegistry(self.hotkey_dispatcher.submit)
+        self.loudness_analyzer = LoudnessAnalyzer()
+        self.transcode_cache = TranscodeCache()
+        # Started only on request, from diagnostics menu or --profile-runtime
+        self.runtime_profiler = RuntimeProfiler()
+        self.player_pool_manager.transcode_cache = self.transcode_cache
+        SavedSettings.apply_saved_settings(
+            self.player_pool_manager, self.latency_tracer, self.hotkey_dispatcher, self.keyword_matcher,
+            self.loudness_analyzer
+        )
+        self.trigger_server = None
+        startup_profiler.mark("playback engine and settings")
+
+        self.profile_store = ProfileStore(self.PROFILE_STORE_PATH)
+        # Profiles used to be saved as json files, import them the first time program sees them
+        self.profile_store.import_json_directory(self.PROFILES_DIRECTORY)
+        self.profile = []
+        self.sound_preloader = SoundPreloader(self.player_pool_manager, self.profile_store)
+        SavedSettings.apply_saved_preloading(self.sound_preloader)
+        # However the program is quit (menu, tray, signal) usage, stats and workers are taken care of
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self.shutdown)
+
+    @classmethod
+    def create_player_pool_manager(cls):
+        """Create manager for playback engine selected in settings, engine can't be changed while program is running."""
+        if Config.get("combo_box_playback_engine") == PLAYBACK_ENGINES[1]:
+            if is_mixer_available():
+                return MixerOutputManager(MixerOutput(), MixerOutput())
+            logging.warning("Software mixer needs numpy installed, falling back to media player engine.")
+
+        return PlayerPoolManager(PlayerPool(), PlayerPool())
+
+    def saved_profile_name(self) -> str:
+        """Name of profile that was loaded last, first profile if it doesn't exist anymore."""
+        profile_names = self.profile_store.profile_names()
+        profile_name = Config.get(self.ACTIVE_PROFILE_KEY)
+        if profile_name in profile_names:
+            return profile_name
+        return profile_names[0] if profile_names else self.DEFAULT_PROFILE_NAME
+
+    def load_profile(self, profile_name: str) -> List[HotkeyEntry]:
+        """Load all entries of profile from profile store."""
+        if profile_name == self.DEFAULT_PROFILE_NAME:
+            # Hot-fix when app is initially opened there will be no profiles
+            self.profile_store.create_profile(profile_name)
+
+        try:
+            return self.profile_store.entries(profile_name)
+        except Exception:  # noqa PyBroadException
+            self.report_error(f"Can't load profile '{profile_name}'.")
+            return []
+
+    def report_error(self, message: str):
+        """Report error while handling an exception, main window also shows it in a message box."""
+        logger.exception(message)
+
+    def select_profile(self, profile_name: str):
+        """Load profile_name and remember it as the profile to load on the next start."""
+        Config.set(self.ACTIVE_PROFILE_KEY, profile_name)
+        self.switch_profile(profile_name)
+
+    def switch_profile(self, profile_name: str):
+        """Stop all sounds and replace loaded profile with profile_name."""
+        self.player_pool_manager.stop_all_playback()
+
+        self.profile = self.load_profile(profile_name)
+        self.directory_indexes.clear()
+        self.hotkey_dispatcher.reset()
+        self.refresh_profile()
+
+    def refresh_profile(self):
+        """Register hotkeys and start background work for sounds of currently loaded profile."""
+        self.refresh_hotkeys()
+        self.refresh_loudness()
+        self.refresh_transcoded()
+        self.sound_preloader.set_entries(self.profile)
+
+    def play_entry(self, entry: HotkeyEntry, trace: TriggerTrace = None):
+        """Play hotkey entry, called on GUI thread by hotkey dispatcher."""
+        self.sound_preloader.record_play(entry)
+        self.play_sound(
+            entry.sound_path, priority=entry.priority, choke_group=entry.choke_group,
+            start_offset_ms=entry.start_offset_ms, trace=trace
+        )
+
+    def play_sound(
+            self, sound_path: str, *,
+            priority: int = DEFAULT_PRIORITY, choke_group: str = None, start_offset_ms: int = None,
+            trace: TriggerTrace = None
+    ):
+        path = Path(sound_path)
+        if path.is_dir():
+            random_sound = self.directory_indexes.random_file(
+                sound_path, no_repeat=SavedSettings.saved_value("check_no_repeat_directory_sounds")
+            )
+            if random_sound is None:
+                return logging.warning(f"No sound files found in directory '{sound_path}'.")
+            url = QtCore.QUrl.fromLocalFile(QtCore.QDir.current().absoluteFilePath(random_sound))
+        else:
+            url = QtCore.QUrl.fromLocalFile(QtCore.QDir.current().absoluteFilePath(sound_path))
+
+        if trace is not None:
+            trace.mark(STAGE_FILE_RESOLVED)
+        self.player_pool_manager.play(
+            url=url, priority=priority, choke_group=choke_group, start_offset_ms=start_offset_ms, trace=trace
+        )
+
+    def refresh_hotkeys(self):
+        """
+        Registers hotkeys based on currently loaded profile data.
+        Only hotkeys that differ from the previously loaded profile are registered or removed.
+        """
+        self.hotkey_registry.set_entries(self.profile)
+        self.refresh_keywords()
+        self.refresh_trigger_server()
+
+    def refresh_keywords(self):
+        """Update typed keywords matcher with keywords from currently loaded profile."""
+        self.keyword_matcher.set_keywords({entry.keyword: entry for entry in self.profile if entry.keyword})
+        # Without keywords typed keys don't have to go trough the hook at all
+        if self.keyword_matcher.keyword_count > 0:
+            self.keyword_matcher.hook()
+        else:
+            self.keyword_matcher.unhook()
+
+    def refresh_trigger_server(self):
+        """Update hotkeys trigger server can play with hotkeys from currently loaded profile."""
+        if self.trigger_server is not None:
+            self.trigger_server.set_entries(self.profile)
+
+    def refresh_loudness(self):
+        """Measure loudness of sounds from currently loaded profile that weren't measured yet, in background."""
+        self.loudness_analyzer.analyze(entry.sound_path for entry in self.profile)
+
+    def refresh_transcoded(self):
+        """Transcode sounds from currently loaded profile that don't play on every backend, in background."""
+        self.transcode_cache.prepare(
+            (entry.sound_path for entry in self.profile), self.player_pool_manager.output_format
+        )
+
+    def start_trigger_server(self, address: str) -> bool:
+        """
+        Start local socket API scripts can trigger sounds with, see TriggerServer for the protocol.
+        :return: bool whether server is listening
+        """
+        try:
+            self.trigger_server = TriggerServer(
+                address, submit=partial(self.hotkey_dispatcher.submit, coalesce_repeats=False),
+                commands={
+                    "play": self.on_trigger_play, "stop": self.on_trigger_stop,
+                    "load_profile": self.on_trigger_load_profile
+                }
+            )
+            self.trigger_server.start()
+        except (ValueError, OSError) as e:
+            self.trigger_server = None
+            logging.error(f"Can't start trigger server on '{address}': {e}")
+            return False
+
+        self.refresh_trigger_server()
+        return True
+
+    def on_trigger_play(self, request: dict):
+        sound_path = request.get("sound")
+        if not isinstance(sound_path, str):
+            raise TriggerRequestError("Play needs a 'hotkey' or a 'sound' path.")
+        elif not Path(sound_path).exists():
+            raise TriggerRequestError(f"Sound '{sound_path}' doesn't exist.")
+
+        priority = _request_int(request, "priority", DEFAULT_PRIORITY, MIN_PRIORITY, MAX_PRIORITY)
+        start_offset_ms = _request_int(request, "start_offset_ms", None, 0)
+        choke_group = request.get("choke_group")
+        if choke_group is not None and not isinstance(choke_group, str):
+            raise TriggerRequestError("'choke_group' has to be a string.")
+
+        self.play_sound(
+            sound_path, priority=priority, choke_group=choke_group or None, start_offset_ms=start_offset_ms
+        )
+
+    def on_trigger_stop(self, _request: dict):
+        self.player_pool_manager.stop_all_playback()
+
+    def on_trigger_load_profile(self, request: dict):
+        profile_name = request.get("name")
+        if profile_name not in self.profile_store.profile_names():
+            raise TriggerRequestError(f"No profile named '{profile_name}'.")
+
+        # Saved like a profile loaded by hand, so it's also loaded on the next start
+        self.select_profile(profile_name)
+        return {"hotkeys": len(self.profile)}
+
+    def shutdown(self):
+        """
+        Save config and stop background work, logging stats of everything that keeps them.
+        Called once when the application is about to quit.
+        """
+        self.runtime_profiler.stop()
+        self.sound_preloader.save_usage()
+        logging.info(f"Preload stats: {self.sound_preloader.stats}, {self.sound_preloader.hit_rates}")
+        logging.info(f"Sound cache stats: {self.player_pool_manager.sound_cache.stats}")
+        self.player_pool_manager.sound_cache.shutdown()
+        self.player_pool_manager.sound_cache.clear()
+        logging.info(f"Hotkey dispatch stats: {self.hotkey_dispatcher.stats}")
+        Config.flush()
+        logging.info(f"Config stats: {Config.metrics()}")
+        self.loudness_analyzer.shutdown()
+        if self.trigger_server is not None:
+            logging.info(f"Trigger server stats: {self.trigger_server.stats}")
+            self.trigger_server.stop()
+        logging.info(f"Transcode cache stats: {self.transcode_cache.stats}")
+        self.transcode_cache.shutdown()
+        if self.latency_tracer.enabled:
+            self.latency_tracer.dump(LATENCY_STATS_PATH)
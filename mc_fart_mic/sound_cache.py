@@ -0,0 +1,620 @@
+import os
+import mmap
+import wave
+import struct
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Optional, Tuple, Callable, Union
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QObject, pyqtSignal
+from PyQt5.QtMultimedia import QAudioDecoder, QAudioFormat
+
+
+logger = logging.getLogger(__name__)
+
+MEGABYTE: int = 1024 * 1024
+DEFAULT_SOUND_CACHE_BUDGET: int = 128 * MEGABYTE
+# WAV files at least this big are memory mapped and streamed instead of loaded to memory
+STREAMING_THRESHOLD: int = 16 * MEGABYTE
+# Every mapping keeps the file open, least recently played ones are closed above this many
+MAX_MAPPED_SOUNDS: int = 32
+# WAV files are read and sounds converted for playback engine on this many worker threads, so a slow disk or a long
+# sound doesn't hold up the GUI thread and other plays
+DECODE_WORKERS: int = 2
+WAV_HEADER_SIZE: int = 44
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+CacheKey = Tuple[str, int]
+Sound = Union["DecodedSound", "MappedSound"]
+LoadCallback = Callable[[Optional[Sound]], None]
+
+
+class DecodeError(Exception):
+    """Raised when sound file can't be decoded to PCM that we know how to play from memory."""
+
+
+def wav_header(pcm_size: int, sample_rate: int, channel_count: int, sample_size: int) -> bytes:
+    """Header of PCM WAV file with pcm_size bytes of samples."""
+    block_align = channel_count * sample_size // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + pcm_size, b"WAVE",
+        b"fmt ", 16, _WAVE_FORMAT_PCM, channel_count, sample_rate, sample_rate * block_align, block_align, sample_size,
+        b"data", pcm_size
+    )
+
+
+class DecodedSound:
+    """
+    Decoded PCM samples of a sound file, kept as a complete in-memory WAV file.
+
+    Data is stored in a QByteArray so multiple players can be fed from it without copying it (QByteArray is implicitly
+    shared), raw PCM samples are exposed as zero-copy memoryview for anything that wants to process them.
+    """
+    __slots__ = ("wav_data", "sample_rate", "channel_count", "sample_size", "converted", "__weakref__")
+
+    def __init__(self, pcm: bytes, *, sample_rate: int, channel_count: int, sample_size: int):
+        """
+        :param pcm: raw interleaved PCM samples, little endian
+        :param sample_rate: frames per second
+        :param channel_count: number of interleaved channels
+        :param sample_size: size of single sample in bits (8 bit samples are unsigned, others are signed)
+        """
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.sample_size = sample_size
+        self.wav_data = QByteArray(wav_header(len(pcm), sample_rate, channel_count, sample_size) + pcm)
+        # Samples converted for playback engine by (sample rate, channel count), filled before the sound is cached
+        self.converted: Dict[Tuple[int, int], object] = {}
+
+    @property
+    def pcm(self) -> memoryview:
+        return memoryview(self.wav_data)[WAV_HEADER_SIZE:]
+
+    def open_device(self) -> QIODevice:
+        """Open read-only device with the sound as WAV file, it's a view of sound data so it doesn't copy it."""
+        buffer = QBuffer()
+        buffer.setData(self.wav_data)
+        buffer.open(QIODevice.ReadOnly)
+        return buffer
+
+    def section(self, start_ms: int, end_ms: Optional[int] = None) -> "DecodedSound":
+        """
+        Copy of part of the sound.
+        :param start_ms: int start of the part
+        :param end_ms: int end of the part, None for the end of the sound
+        """
+        block_align = self.channel_count * self.sample_size // 8
+        start = start_ms * self.sample_rate // 1000 * block_align
+        end = None if end_ms is None else end_ms * self.sample_rate // 1000 * block_align
+        return DecodedSound(
+            self.pcm[start:end], sample_rate=self.sample_rate, channel_count=self.channel_count,
+            sample_size=self.sample_size
+        )
+
+    @property
+    def size_bytes(self) -> int:
+        return self.wav_data.size()
+
+    @property
+    def memory_bytes(self) -> int:
+        """Size of the sound together with its converted samples, what it takes in sound cache."""
+        return self.size_bytes + sum(getattr(samples, "nbytes", 0) for samples in self.converted.values())
+
+    @property
+    def frame_count(self) -> int:
+        return (self.size_bytes - WAV_HEADER_SIZE) // (self.channel_count * self.sample_size // 8)
+
+    @property
+    def duration_ms(self) -> int:
+        return self.frame_count * 1000 // self.sample_rate
+
+
+def decode_wav_file(path: str) -> DecodedSound:
+    """
+    Decode uncompressed WAV file without going trough multimedia backend.
+    :raises DecodeError: if file is not a PCM WAV file
+    """
+    try:
+        with wave.open(path, "rb") as wav_file:
+            return DecodedSound(
+                wav_file.readframes(wav_file.getnframes()),
+                sample_rate=wav_file.getframerate(),
+                channel_count=wav_file.getnchannels(),
+                sample_size=wav_file.getsampwidth() * 8
+            )
+    except (wave.Error, EOFError, OSError) as e:
+        raise DecodeError(f"Can't decode '{path}': {e}")
+
+
+class MappedSound:
+    """
+    PCM samples of an uncompressed WAV file, memory mapped instead of loaded.
+
+    Samples are read straight from the mapping, so the sound takes no memory of its own, only OS page cache which can
+    be dropped at any time. Any number of players and mixer voices can play from one mapping, sections of the sound
+    are views of the same mapping. Has the same format attributes and pcm view as DecodedSound.
+    """
+    __slots__ = ("sample_rate", "channel_count", "sample_size", "_mapping", "_data_offset", "_data_size", "__weakref__")
+
+    def __init__(
+            self, mapping: mmap.mmap, data_offset: int, data_size: int, *,
+            sample_rate: int, channel_count: int, sample_size: int
+    ):
+        """
+        :param mapping: read-only mapping of the whole file
+        :param data_offset: offset of the first sample in the mapping
+        :param data_size: size of samples in bytes
+        """
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.sample_size = sample_size
+        self._mapping = mapping
+        self._data_offset = data_offset
+        self._data_size = data_size
+
+    @property
+    def pcm(self) -> memoryview:
+        return memoryview(self._mapping)[self._data_offset:self._data_offset + self._data_size]
+
+    def wav_header(self) -> bytes:
+        return wav_header(self._data_size, self.sample_rate, self.channel_count, self.sample_size)
+
+    def open_device(self) -> QIODevice:
+        device = MappedSoundDevice(self)
+        device.open(QIODevice.ReadOnly | QIODevice.Unbuffered)
+        return device
+
+    def section(self, start_ms: int, end_ms: Optional[int] = None) -> "MappedSound":
+        """View of part of the sound, nothing is copied."""
+        block_align = self.channel_count * self.sample_size // 8
+        start = min(start_ms * self.sample_rate // 1000 * block_align, self._data_size)
+        end = self._data_size
+        if end_ms is not None:
+            end = min(end_ms * self.sample_rate // 1000 * block_align, end)
+        return MappedSound(
+            self._mapping, self._data_offset + start, max(0, end - start),
+            sample_rate=self.sample_rate, channel_count=self.channel_count, sample_size=self.sample_size
+        )
+
+    @property
+    def frame_count(self) -> int:
+        return self._data_size // (self.channel_count * self.sample_size // 8)
+
+    @property
+    def duration_ms(self) -> int:
+        return self.frame_count * 1000 // self.sample_rate
+
+    def close(self) -> bool:
+        """
+        Unmap the file and close it, unless a player or mixer voice still reads from it. Such mapping is closed
+        once the last sound and device using it are gone.
+        :return: bool whether the mapping was closed right away
+        """
+        try:
+            self._mapping.close()
+        except BufferError:
+            return False
+        return True
+
+
+class MappedSoundDevice(QIODevice):
+    """
+    Random access read-only device that serves mapped sound as a WAV file to a media player.
+    Header is generated and samples are sliced straight from the mapping on each read. Every player needs its own
+    device as the device keeps read position, devices of the same sound share the mapping.
+    """
+    def __init__(self, sound: MappedSound):
+        super().__init__()
+        self._header = sound.wav_header()
+        self._pcm = sound.pcm
+        self._size = len(self._header) + len(self._pcm)
+        # Own position, device is unbuffered so it always matches pos() seen by the reader
+        self._position = 0
+
+    def readData(self, max_size: int) -> bytes:
+        start, end = self._position, min(self._size, self._position + max_size)
+        if start >= end:
+            return b""
+
+        header_size = len(self._header)
+        if start >= header_size:
+            data = self._pcm[start - header_size:end - header_size].tobytes()
+        else:
+            data = self._header[start:end] + self._pcm[:max(0, end - header_size)].tobytes()
+        self._position = end
+        return data
+
+    def writeData(self, _data: bytes) -> int:
+        return -1
+
+    def seek(self, position: int) -> bool:
+        if not 0 <= position <= self._size:
+            return False
+        self._position = position
+        return super().seek(position)
+
+    def size(self) -> int:
+        return self._size
+
+    def bytesAvailable(self) -> int:
+        return self._size - self._position + super().bytesAvailable()
+
+    def isSequential(self) -> bool:
+        return False
+
+
+def _parse_wav_chunks(data: mmap.mmap) -> Tuple[Tuple[int, int, int, int, int, int], int, int]:
+    """
+    Find format and samples of PCM WAV file.
+    :return: tuple of format chunk fields, offset of samples and size of samples
+    :raises DecodeError: if it's not a PCM WAV file
+    """
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise DecodeError("not a WAV file")
+
+    audio_format, data_offset, data_size = None, None, 0
+    chunk_offset = 12
+    while chunk_offset + 8 <= len(data) and (audio_format is None or data_offset is None):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, chunk_offset)
+        if chunk_id == b"fmt " and chunk_size >= 16:
+            audio_format = struct.unpack_from("<HHIIHH", data, chunk_offset + 8)
+            if audio_format[0] == _WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # Actual format is the first field of sub format GUID
+                audio_format = (struct.unpack_from("<H", data, chunk_offset + 32)[0], *audio_format[1:])
+        elif chunk_id == b"data":
+            data_offset, data_size = chunk_offset + 8, min(chunk_size, len(data) - chunk_offset - 8)
+        # Chunks are word aligned
+        chunk_offset += 8 + chunk_size + chunk_size % 2
+
+    if audio_format is None or data_offset is None:
+        raise DecodeError("missing format or data chunk")
+    format_tag, channel_count, sample_rate, _byte_rate, _block_align, sample_size = audio_format
+    if format_tag != _WAVE_FORMAT_PCM or sample_size not in (8, 16, 24, 32) or not channel_count or not sample_rate:
+        raise DecodeError("not a PCM WAV file")
+    return audio_format, data_offset, data_size
+
+
+def map_wav_file(path: str) -> MappedSound:
+    """
+    Memory map PCM WAV file, only the header is read.
+    :raises DecodeError: if file is not a PCM WAV file
+    """
+    try:
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise DecodeError(f"Can't map '{path}': {e}")
+
+    try:
+        audio_format, data_offset, data_size = _parse_wav_chunks(mapping)
+    except (DecodeError, struct.error) as e:
+        mapping.close()
+        raise DecodeError(f"Can't map '{path}': {e}")
+
+    format_tag, channel_count, sample_rate, _byte_rate, _block_align, sample_size = audio_format
+    return MappedSound(
+        mapping, data_offset, data_size - data_size % (channel_count * sample_size // 8),
+        sample_rate=sample_rate, channel_count=channel_count, sample_size=sample_size
+    )
+
+
+class BackendDecode:
+    """
+    Asynchronously decode any file the multimedia backend supports using QAudioDecoder.
+    Callback is called with DecodedSound on success or with DecodeError on failure.
+    """
+    def __init__(self, path: str, callback: Callable[[object], None]):
+        self._callback = callback
+        self._chunks = []
+        self._audio_format: Optional[QAudioFormat] = None
+
+        self._decoder = QAudioDecoder()
+        self._decoder.bufferReady.connect(self._on_buffer_ready)
+        self._decoder.finished.connect(self._on_finished)
+        self._decoder.error.connect(self._on_error)
+        self._decoder.setSourceFilename(path)
+        self._decoder.start()
+
+    def _on_buffer_ready(self):
+        buffer = self._decoder.read()
+        self._audio_format = buffer.format()
+        self._chunks.append(buffer.constData().asstring(buffer.byteCount()))
+
+    def _on_finished(self):
+        audio_format = self._audio_format
+        if audio_format is None:
+            return self._callback(DecodeError(f"No audio decoded from '{self._decoder.sourceFilename()}'"))
+
+        # Only formats that WAV container can describe as is, anything else would need converting
+        playable = audio_format.byteOrder() == QAudioFormat.LittleEndian and (
+            (audio_format.sampleSize() == 8 and audio_format.sampleType() == QAudioFormat.UnSignedInt)
+            or (audio_format.sampleSize() in (16, 24, 32) and audio_format.sampleType() == QAudioFormat.SignedInt)
+        )
+        if not playable:
+            return self._callback(DecodeError(f"Unsupported decoded format for '{self._decoder.sourceFilename()}'"))
+
+        self._callback(DecodedSound(
+            b"".join(self._chunks),
+            sample_rate=audio_format.sampleRate(),
+            channel_count=audio_format.channelCount(),
+            sample_size=audio_format.sampleSize()
+        ))
+
+    def _on_error(self, _error: QAudioDecoder.Error):
+        self._decoder.stop()
+        self._callback(DecodeError(f"Can't decode '{self._decoder.sourceFilename()}': {self._decoder.errorString()}"))
+
+
+class SoundCache(QObject):
+    """
+    LRU cache of decoded sounds limited by total byte size.
+
+    Entries are keyed by file path and file modification time so changed files are decoded again.
+    On a miss the sound is decoded in background (the caller plays it the usual way in the meantime) so the next
+    play of the same sound skips file I/O and decoding completely. WAV files are read on worker threads, other
+    formats are decoded by the multimedia backend. If prepare is set it's called with every decoded sound on a worker
+    thread before the sound is cached, so playback engine can convert it once instead of on every play.
+    WAV files of at least streaming threshold size are memory mapped right away instead of loaded, mapped sounds don't
+    count towards the budget as they take no memory of their own. Up to MAX_MAPPED_SOUNDS mappings are kept, least
+    recently played first to go, mapping of a file that changed or disappeared is dropped once it's noticed. Other
+    large files are left for players to stream.
+    """
+    # Decoded sound or DecodeError from a worker thread, delivered queued on the cache thread
+    _decoded = pyqtSignal(object, object)
+
+    def __init__(self, budget_bytes: int = DEFAULT_SOUND_CACHE_BUDGET, streaming_threshold: int = STREAMING_THRESHOLD):
+        super().__init__()
+        self._entries: "OrderedDict[CacheKey, DecodedSound]" = OrderedDict()
+        # Path to modification time and size of mapped file, and its mapped sound, least recently played first
+        self._mapped: "OrderedDict[str, Tuple[int, int, MappedSound]]" = OrderedDict()
+        self._pending: Dict[CacheKey, Union[BackendDecode, Future]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._decoded.connect(self._on_decoded)
+        self.prepare: Optional[Callable[[DecodedSound], None]] = None
+        self._waiters: Dict[CacheKey, List[LoadCallback]] = {}
+        self._size_bytes = 0
+        self._budget_bytes = budget_bytes
+        self.streaming_threshold = streaming_threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def budget_bytes(self) -> int:
+        return self._budget_bytes
+
+    @budget_bytes.setter
+    def budget_bytes(self, new_budget_bytes: int):
+        """Set maximum size of all cached sounds, setting it to 0 disables the cache."""
+        self._budget_bytes = max(0, new_budget_bytes)
+        self._evict_to_budget()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Counters useful for sizing the budget, a lot of evictions with low hit count means budget is too small."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "mapped": len(self._mapped),
+            "size_bytes": self._size_bytes,
+            "budget_bytes": self._budget_bytes
+        }
+
+    @classmethod
+    def _stat(cls, path: str) -> Optional[os.stat_result]:
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def _is_streamed(self, path: str, stat: os.stat_result) -> bool:
+        return stat.st_size >= self.streaming_threshold and path.lower().endswith(".wav")
+
+    def _mapped_sound(self, path: str, stat: os.stat_result) -> Optional[MappedSound]:
+        """Mapped sound of WAV file, mapped on first use and again if file changed, None if file can't be mapped."""
+        mapped = self._mapped.get(path)
+        if mapped is not None:
+            mtime_ns, size, sound = mapped
+            if (mtime_ns, size) == (stat.st_mtime_ns, stat.st_size):
+                self._mapped.move_to_end(path)
+                return sound
+            self._unmap(path)
+
+        try:
+            sound = map_wav_file(path)
+        except DecodeError as e:
+            logger.info(f"Sound will not be streamed: {e}")
+            return None
+
+        self._mapped[path] = stat.st_mtime_ns, stat.st_size, sound
+        while len(self._mapped) > MAX_MAPPED_SOUNDS:
+            self._unmap(next(iter(self._mapped)))
+        return sound
+
+    def _unmap(self, path: str):
+        mapped = self._mapped.pop(path, None)
+        if mapped is not None:
+            mapped[2].close()
+
+    def get(self, path: str) -> Optional[Sound]:
+        """
+        Return decoded (or mapped, for large WAV files) sound for path if it's cached, otherwise schedule decoding it
+        in background and return None.
+        :param path: absolute local file path
+        """
+        stat = self._stat(path)
+        if stat is None:
+            self._unmap(path)
+            return None
+
+        key = path, stat.st_mtime_ns
+        if self._is_streamed(path, stat):
+            return self._mapped_sound(path, stat)
+        elif path in self._mapped:
+            # File was replaced by one that isn't streamed
+            self._unmap(path)
+
+        if not self._budget_bytes or stat.st_size >= self.streaming_threshold:
+            return None
+
+        sound = self._entries.get(key)
+        if sound is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sound
+
+        self.misses += 1
+        self._load(key)
+        return None
+
+    def is_cached(self, path: str) -> bool:
+        """Whether sound for path would play from memory right now, without counting it as a hit or a miss."""
+        stat = self._stat(path)
+        if stat is None:
+            return False
+
+        mapped = self._mapped.get(path)
+        if mapped is not None and mapped[:2] == (stat.st_mtime_ns, stat.st_size):
+            return True
+        return (path, stat.st_mtime_ns) in self._entries
+
+    def load(self, path: str, callback: LoadCallback, *, prefetch: bool = False):
+        """
+        Call callback with decoded sound as soon as it's available, decoding it first if it's not cached.
+        Sound is decoded even if cache is disabled, it's just not kept afterwards.
+        :param path: absolute local file path
+        :param callback: called with DecodedSound (MappedSound for large WAV files) or with None if file can't be
+                         decoded
+        :param prefetch: sound is loaded ahead of playing it, not counted as a hit or a miss
+        """
+        stat = self._stat(path)
+        if stat is None:
+            self._unmap(path)
+            return callback(None)
+
+        key = path, stat.st_mtime_ns
+        if self._is_streamed(path, stat):
+            sound = self._mapped_sound(path, stat)
+            if sound is not None:
+                return callback(sound)
+        elif path in self._mapped:
+            self._unmap(path)
+
+        sound = self._entries.get(key)
+        if sound is not None:
+            self._entries.move_to_end(key)
+            self.hits += not prefetch
+            return callback(sound)
+
+        self.misses += not prefetch
+        self._waiters.setdefault(key, []).append(callback)
+        self._load(key)
+
+    def _load(self, key: CacheKey):
+        if key in self._pending:
+            return
+
+        path = key[0]
+        if path.lower().endswith(".wav"):
+            # Reading up to streaming threshold from a slow disk would hold up everything else on the GUI thread
+            self._submit(key, self._decode_wav_or_error, path)
+        else:
+            self._pending[key] = BackendDecode(path, lambda result: self._on_backend_decoded(key, result))
+
+    def _submit(self, key: CacheKey, function: Callable[..., object], *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(DECODE_WORKERS, thread_name_prefix="sound decode")
+        future = self._pending[key] = self._executor.submit(function, *args)
+        future.add_done_callback(lambda done: self._emit_decoded(key, done))
+
+    def _emit_decoded(self, key: CacheKey, future: Future):
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:  # noqa PyBroadException reported on the cache thread
+            result = DecodeError(f"Can't decode '{key[0]}': {e}")
+        self._decoded.emit(key, result)
+
+    def _decode_wav_or_error(self, path: str) -> object:
+        """Runs on a worker thread."""
+        try:
+            sound = decode_wav_file(path)
+        except DecodeError as e:
+            return e
+        return self._prepared(sound)
+
+    def _prepared(self, sound: DecodedSound) -> DecodedSound:
+        """Runs on a worker thread."""
+        prepare = self.prepare
+        if prepare is not None:
+            try:
+                prepare(sound)
+            except Exception as e:  # noqa PyBroadException sound still plays, it's just converted when played
+                logger.warning(f"Can't prepare sound for playback: {e}")
+        return sound
+
+    def _on_backend_decoded(self, key: CacheKey, result: object):
+        if self.prepare is not None and isinstance(result, DecodedSound):
+            self._submit(key, self._prepared, result)
+        else:
+            self._on_decoded(key, result)
+
+    def _on_decoded(self, key: CacheKey, result: object):
+        self._pending.pop(key, None)
+        waiters = self._waiters.pop(key, ())
+        if isinstance(result, DecodeError):
+            logger.info(f"Sound will not be cached: {result}")
+            result = None
+        else:
+            self.put(key, result)
+
+        for callback in waiters:
+            callback(result)
+
+    def put(self, key: CacheKey, sound: DecodedSound):
+        if sound.memory_bytes > self._budget_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size_bytes -= previous.memory_bytes
+
+        # Stale entries of the same path (file was changed) are useless from now on
+        for stale_key in [cached_key for cached_key in self._entries if cached_key[0] == key[0]]:
+            self._size_bytes -= self._entries.pop(stale_key).memory_bytes
+
+        self._entries[key] = sound
+        self._size_bytes += sound.memory_bytes
+        self._evict_to_budget()
+
+    def _evict_to_budget(self):
+        while self._size_bytes > self._budget_bytes and self._entries:
+            _key, sound = self._entries.popitem(last=False)
+            self._size_bytes -= sound.memory_bytes
+            self.evictions += 1
+
+    def shutdown(self):
+        """Stop decoding in background, sounds being read are dropped once read."""
+        for key, pending in list(self._pending.items()):
+            if isinstance(pending, Future) and pending.cancel():
+                del self._pending[key]
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def clear(self):
+        """Drop all cached sounds and close mapped files, mappings that still play are closed once they end."""
+        self._entries.clear()
+        for path in list(self._mapped):
+            self._unmap(path)
+        self._size_bytes = 0
@@ -0,0 +1,427 @@
+import os
+import time
+import wave
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from PyQt5 import QtCore
+
+from constants import POSSIBLE_AUDIO_FORMATS
+
+
+logger = logging.getLogger(__name__)
+
+SOUND_CATALOG_PATH = Path("sound_catalog.sqlite3")
+# Stat calls and file reads mostly wait on the disk, so there are more threads than cores
+SCAN_WORKERS: int = min(32, (os.cpu_count() or 1) * 4)
+# Partial hash covers this much from the start and from the end of file, smaller files are hashed whole by it
+PARTIAL_HASH_CHUNK_SIZE: int = 64 * 1024
+_FULL_HASH_BLOCK_SIZE = 1024 * 1024
+_HASH_DIGEST_SIZE = 16
+
+# Magic bytes at the start of file -> format, checked in order
+_FORMAT_SIGNATURES = (
+    (b"ID3", "mp3"),
+    (b"OggS", "ogg"),
+    (b"fLaC", "flac"),
+    (b"MAC ", "ape"),
+    (b"MPCK", "mpc"),
+    (b"MP+", "mpc"),
+    (b".snd", "au"),
+    (b"\x1aE\xdf\xa3", "webm"),
+    (b"0&\xb2u\x8ef\xcf\x11", "wma"),
+)
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """Format of audio file from its first 12 bytes, None if it's not recognized."""
+    if header[:4] == b"RIFF":
+        return {b"WAVE": "wav", b"AVI ": "avi"}.get(header[8:12])
+    elif header[:4] == b"FORM" and header[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    elif header[4:8] == b"ftyp":
+        return "mp4"
+    elif len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        # MPEG audio frame sync, layer bits are 0 for ADTS AAC
+        return "aac" if header[1] & 0x06 == 0 else "mp3"
+
+    for signature, audio_format in _FORMAT_SIGNATURES:
+        if header.startswith(signature):
+            return audio_format
+    return None
+
+
+def read_metadata(path: str) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Format and duration of audio file, read from its header.
+    :return: tuple of format (extension if header isn't recognized) and duration in ms (None for formats other than
+             WAV, those would have to be decoded), both are None if the file can't be read
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(12)
+    except OSError as e:
+        logger.warning(f"Can't read '{path}': {e}")
+        return None, None
+
+    audio_format = sniff_format(header) or os.path.splitext(path)[1][1:].lower()
+    duration_ms = None
+    if audio_format == "wav":
+        try:
+            with wave.open(path, "rb") as wav_file:
+                duration_ms = wav_file.getnframes() * 1000 // wav_file.getframerate()
+        except (wave.Error, EOFError, OSError, ZeroDivisionError):
+            pass
+    return audio_format, duration_ms
+
+
+def partial_hash(path: str, size: int) -> Optional[bytes]:
+    """Hash of start and end of file, for files up to two chunks it's a hash of the whole file. None on error."""
+    digest = hashlib.blake2b(size.to_bytes(8, "little"), digest_size=_HASH_DIGEST_SIZE)
+    try:
+        with open(path, "rb") as f:
+            digest.update(f.read(PARTIAL_HASH_CHUNK_SIZE))
+            if size > 2 * PARTIAL_HASH_CHUNK_SIZE:
+                f.seek(-PARTIAL_HASH_CHUNK_SIZE, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_CHUNK_SIZE))
+    except OSError as e:
+        logger.warning(f"Can't hash '{path}': {e}")
+        return None
+    return digest.digest()
+
+
+def content_hash(path: str) -> Optional[bytes]:
+    """Hash of whole file, None on error."""
+    digest = hashlib.blake2b(digest_size=_HASH_DIGEST_SIZE)
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(_FULL_HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    except OSError as e:
+        logger.warning(f"Can't hash '{path}': {e}")
+        return None
+    return digest.digest()
+
+
+def _list_directory(directory: str) -> Tuple[List[str], List[Tuple[str, int, int]]]:
+    """Sub directories and audio files (as path, size, modification time) directly in directory."""
+    directories, files = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif os.path.splitext(entry.name)[1] in POSSIBLE_AUDIO_FORMATS and entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    except OSError as e:
+        logger.warning(f"Can't scan directory '{directory}': {e}")
+    return directories, files
+
+
+class CatalogEntry:
+    """
+    Sound file in the catalog.
+    Hashes are computed only when needed to tell duplicates apart, so they are None for files with unique size.
+    """
+    __slots__ = ("path", "size", "mtime_ns", "format", "duration_ms", "partial_hash", "content_hash")
+
+    def __init__(
+            self, path: str, size: int, mtime_ns: int, *,
+            audio_format: str = None, duration_ms: int = None, partial_hash: bytes = None, content_hash: bytes = None
+    ):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.format: Optional[str] = audio_format
+        self.duration_ms: Optional[int] = duration_ms
+        self.partial_hash: Optional[bytes] = partial_hash
+        self.content_hash: Optional[bytes] = content_hash
+
+
+class SoundCatalog:
+    """
+    Sound files with their format, duration and content hashes saved in a SQLite database, keyed by absolute path.
+    Connection can be used from any thread, but only from one at a time.
+    """
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        format TEXT,
+        duration_ms INTEGER,
+        partial_hash BLOB,
+        content_hash BLOB
+    );
+    """
+    _COLUMNS = "path, size, mtime_ns, format, duration_ms, partial_hash, content_hash"
+
+    def __init__(self, path: Path = SOUND_CATALOG_PATH):
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        with self._connection:
+            self._connection.executescript(self._SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    @classmethod
+    def _entry_from_row(cls, row: tuple) -> CatalogEntry:
+        path, size, mtime_ns, audio_format, duration_ms, partial_hash_, content_hash_ = row
+        return CatalogEntry(
+            path, size, mtime_ns, audio_format=audio_format, duration_ms=duration_ms, partial_hash=partial_hash_,
+            content_hash=content_hash_
+        )
+
+    def entry(self, path: str) -> Optional[CatalogEntry]:
+        row = self._connection.execute(f"SELECT {self._COLUMNS} FROM files WHERE path = ?", (path,)).fetchone()
+        return self._entry_from_row(row) if row is not None else None
+
+    def entries(self, directory: str) -> Dict[str, CatalogEntry]:
+        """All files in directory and its sub directories, as path -> CatalogEntry."""
+        prefix = os.path.join(directory, "")
+        # Every path that starts with prefix sorts between prefix and prefix with its last character incremented
+        rows = self._connection.execute(
+            f"SELECT {self._COLUMNS} FROM files WHERE path >= ? AND path < ?",
+            (prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+        )
+        return {row[0]: self._entry_from_row(row) for row in rows}
+
+    def update(self, entries: Iterable[CatalogEntry], removed_paths: Iterable[str]):
+        """Save new and changed entries and remove paths of deleted files, in a single transaction."""
+        with self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO files ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        entry.path, entry.size, entry.mtime_ns, entry.format, entry.duration_ms, entry.partial_hash,
+                        entry.content_hash
+                    )
+                    for entry in entries
+                )
+            )
+            self._connection.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed_paths))
+
+
+class ScanResult:
+    """Outcome of scanning one directory tree, paths are as found under the scanned directory."""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files: List[str] = []
+        # Every file with the same content as another file, except the first one of them in path order
+        self.duplicates: Set[str] = set()
+        self.directory_count = 0
+        self.changed_count = 0
+        self.removed_count = 0
+        self.hashed_count = 0
+        self.duration_s = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"ScanResult('{self.directory}', files={len(self.files)}, directories={self.directory_count}, "
+            f"changed={self.changed_count}, removed={self.removed_count}, hashed={self.hashed_count}, "
+            f"duplicates={len(self.duplicates)}, duration_s={self.duration_s:.3f})"
+        )
+
+
+class LibraryScanner:
+    """
+    Scans sound directory trees into the sound catalog and finds duplicate files.
+
+    Directories are listed and files are stat-ed, read and hashed on a thread pool, so scanning isn't limited by the
+    latency of a single disk request. Rescans are incremental: files are compared to the catalog by size and
+    modification time and only new or changed files are read.
+    Duplicates are found in steps that read as little as possible: only files with the same size can be duplicates,
+    those get a partial hash (start and end of the file), and only files whose partial hashes match get a full hash.
+    """
+    def __init__(self, catalog: SoundCatalog, max_workers: int = SCAN_WORKERS):
+        self.catalog = catalog
+        self.max_workers = max_workers
+
+    def scan(self, directory: str) -> ScanResult:
+        started = time.perf_counter()
+        result = ScanResult(directory)
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix="sound library scan") as executor:
+            files = self._walk(directory, executor, result)
+            result.files = list(files)
+
+            # Catalog is keyed by absolute paths, scanned paths keep the form of the directory that was passed
+            catalog_directory = os.path.abspath(directory)
+            known = self.catalog.entries(catalog_directory)
+            entries: Dict[str, CatalogEntry] = {}
+            updated: List[CatalogEntry] = []
+            for path, (size, mtime_ns) in files.items():
+                catalog_path = catalog_directory + path[len(directory):]
+                entry = known.pop(catalog_path, None)
+                if entry is None or entry.size != size or entry.mtime_ns != mtime_ns:
+                    entry = CatalogEntry(catalog_path, size, mtime_ns)
+                    updated.append(entry)
+                entries[path] = entry
+            result.changed_count = len(updated)
+            result.removed_count = len(known)
+
+            for entry, (audio_format, duration_ms) in zip(
+                    updated, executor.map(read_metadata, [entry.path for entry in updated])
+            ):
+                entry.format, entry.duration_ms = audio_format, duration_ms
+
+            hashed = self._find_duplicates(entries, executor, result)
+
+        self.catalog.update({*updated, *hashed}, known)
+        result.duration_s = time.perf_counter() - started
+        return result
+
+    @classmethod
+    def _walk(cls, directory: str, executor: ThreadPoolExecutor, result: ScanResult) -> Dict[str, Tuple[int, int]]:
+        """Audio files in directory tree as path -> (size, modification time), directories are listed in parallel."""
+        files = {}
+        pending = {executor.submit(_list_directory, directory)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directories, directory_files = future.result()
+                result.directory_count += 1
+                for path, size, mtime_ns in directory_files:
+                    files[path] = size, mtime_ns
+                pending.update(executor.submit(_list_directory, sub_directory) for sub_directory in directories)
+        return files
+
+    @classmethod
+    def _find_duplicates(
+            cls, entries: Dict[str, CatalogEntry], executor: ThreadPoolExecutor, result: ScanResult
+    ) -> List[CatalogEntry]:
+        """
+        Fill result.duplicates, hashes are computed only for files that can still be duplicates.
+        :return: list of entries that got new hashes
+        """
+        hashed = []
+        by_size: Dict[int, List[Tuple[str, CatalogEntry]]] = {}
+        for path, entry in entries.items():
+            by_size.setdefault(entry.size, []).append((path, entry))
+        same_size = [group for group in by_size.values() if len(group) > 1]
+
+        to_hash = [entry for group in same_size for _path, entry in group if entry.partial_hash is None]
+        digests = executor.map(partial_hash, [entry.path for entry in to_hash], [entry.size for entry in to_hash])
+        for entry, digest in zip(to_hash, digests):
+            entry.partial_hash = digest
+            # Partial hash of small files already covers the whole file
+            if entry.size <= 2 * PARTIAL_HASH_CHUNK_SIZE:
+                entry.content_hash = digest
+        hashed.extend(to_hash)
+
+        by_partial_hash: Dict[Tuple[int, bytes], List[Tuple[str, CatalogEntry]]] = {}
+        for group in same_size:
+            for path, entry in group:
+                if entry.partial_hash is not None:
+                    by_partial_hash.setdefault((entry.size, entry.partial_hash), []).append((path, entry))
+        same_partial_hash = [group for group in by_partial_hash.values() if len(group) > 1]
+
+        to_hash = [entry for group in same_partial_hash for _path, entry in group if entry.content_hash is None]
+        for entry, digest in zip(to_hash, executor.map(content_hash, [entry.path for entry in to_hash])):
+            entry.content_hash = digest
+        hashed.extend(to_hash)
+        result.hashed_count = len(hashed)
+
+        by_content_hash: Dict[Tuple[int, bytes], List[str]] = {}
+        for group in same_partial_hash:
+            for path, entry in group:
+                if entry.content_hash is not None:
+                    by_content_hash.setdefault((entry.size, entry.content_hash), []).append(path)
+        for paths in by_content_hash.values():
+            if len(paths) > 1:
+                result.duplicates.update(sorted(paths)[1:])
+        return hashed
+
+
+class SoundLibrary(QtCore.QObject):
+    """
+    Keeps the sound catalog up to date for directory hotkeys, directories are scanned one at a time on a background
+    thread. Duplicates found by the last scan of each directory are left out of the files played from it.
+    Catalog is opened on the first scan.
+    """
+    directory_scanned = QtCore.pyqtSignal(str)
+    # Emitted from the scan thread, delivered queued on the library thread
+    _scan_finished = QtCore.pyqtSignal(str, object)
+
+    def __init__(self, catalog_path: Path = SOUND_CATALOG_PATH, max_workers: int = SCAN_WORKERS):
+        super().__init__()
+        self._catalog_path = catalog_path
+        self._max_workers = max_workers
+        self._scanner: Optional[LibraryScanner] = None
+        self._pending_directories: Deque[str] = deque()
+        self._scanning: Optional[str] = None
+        self._duplicates: Dict[str, Set[str]] = {}
+        self._scan_finished.connect(self._on_scan_finished)
+        self.stats = {"scans": 0, "files": 0, "changed": 0, "hashed": 0, "duplicates": 0}
+
+    @property
+    def scanner(self) -> LibraryScanner:
+        if self._scanner is None:
+            self._scanner = LibraryScanner(SoundCatalog(self._catalog_path), self._max_workers)
+        return self._scanner
+
+    @property
+    def catalog(self) -> SoundCatalog:
+        return self.scanner.catalog
+
+    def scan(self, directories: Iterable[str]):
+        """Scan directories in background, directories already waiting for a scan are not queued again."""
+        for directory in directories:
+            if directory not in self._pending_directories:
+                self._pending_directories.append(directory)
+        self._scan_next()
+
+    def unique_files(self, directory: str, files: List[str]) -> List[str]:
+        """Files from directory without duplicates found by the last scan of the directory."""
+        duplicates = self._duplicates.get(directory)
+        if not duplicates:
+            return files
+        return [path for path in files if path not in duplicates]
+
+    def _scan_next(self):
+        if self._scanning is not None or not self._pending_directories:
+            return
+
+        self._scanning = self._pending_directories.popleft()
+        scanner = self.scanner
+        threading.Thread(
+            target=self._scan_in_background, args=(scanner, self._scanning), name="sound library", daemon=True
+        ).start()
+
+    def _scan_in_background(self, scanner: LibraryScanner, directory: str):
+        try:
+            result = scanner.scan(directory)
+        except Exception as e:  # noqa PyBroadException scan errors shouldn't stop scanning other directories
+            logger.warning(f"Can't scan sound directory '{directory}': {e}")
+            result = None
+        self._scan_finished.emit(directory, result)
+
+    @QtCore.pyqtSlot(str, object)
+    def _on_scan_finished(self, directory: str, result: Optional[ScanResult]):
+        self._scanning = None
+        if result is not None:
+            logger.info(f"Scanned sound directory: {result}")
+            self._duplicates[directory] = result.duplicates
+            self.stats["scans"] += 1
+            self.stats["files"] += len(result.files)
+            self.stats["changed"] += result.changed_count
+            self.stats["hashed"] += result.hashed_count
+            self.stats["duplicates"] = sum(len(duplicates) for duplicates in self._duplicates.values())
+            self.directory_scanned.emit(directory)
+        self._scan_next()
+
+    def clear(self):
+        """Forget duplicates of scanned directories, for example when different profile is loaded."""
+        self._pending_directories.clear()
+        self._duplicates.clear()
@@ -0,0 +1,261 @@
+import os
+import time
+import heapq
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+from PyQt5 import QtCore
+
+from hotkey_entry import HotkeyEntry
+from profile_store import ProfileStore, EntryUsage
+from sound_cache import MEGABYTE, DecodedSound, Sound
+from player_pool import PlayerPoolManager
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRELOAD_COUNT: int = 20
+DEFAULT_PRELOAD_BUDGET: int = 64 * MEGABYTE
+# Usage of an entry counts half as much after this long, so what's used lately wins over what was used a lot long ago
+USAGE_HALF_LIFE_S: float = 7 * 24 * 60 * 60
+# Changed usage is saved at most this often, and when profile is switched or program exits
+USAGE_SAVE_INTERVAL_MS: int = 30 * 1000
+# Mouse has to stay on a row this long before its sound is preloaded, so moving across the table doesn't decode it all
+HOVER_PRELOAD_DELAY_MS: int = 150
+
+
+def _absolute_path(sound_path: str) -> str:
+    # Resolved the same way as when playing, so it's the same sound cache entry
+    return QtCore.QDir.current().absoluteFilePath(sound_path)
+
+
+class SoundPreloader:
+    """
+    Keeps sounds that are likely to be played next decoded in sound cache, so they don't wait for file I/O and
+    decoding on the first play.
+
+    Every play of an entry adds to its usage score which decays over time, scores are saved with the profile. When a
+    profile is loaded sounds of its most used entries are decoded in background one after another, until preload count
+    or memory budget is reached. Sound of hovered table row is also preloaded, in case it's about to be clicked.
+    Each play is counted as a hit if its sound was already in memory, by why it was there, so preload count and budget
+    can be tuned from stats.
+    """
+    def __init__(
+            self, player_pool_manager: PlayerPoolManager, profile_store: ProfileStore, *,
+            preload_count: int = DEFAULT_PRELOAD_COUNT, budget_bytes: int = DEFAULT_PRELOAD_BUDGET,
+            half_life_s: float = USAGE_HALF_LIFE_S
+    ):
+        self._player_pool_manager = player_pool_manager
+        self._profile_store = profile_store
+        self._preload_count = preload_count
+        self._budget_bytes = budget_bytes
+        self.half_life_s = half_life_s
+
+        self._entries: List[HotkeyEntry] = []
+        self._usage: EntryUsage = {}
+        self._changed_usage: Set[int] = set()
+        self._save_timer = QtCore.QTimer()
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(USAGE_SAVE_INTERVAL_MS)
+        self._save_timer.timeout.connect(self.save_usage)
+
+        # Paths still to preload, most used first, and preloaded ones with their size in memory
+        self._queue: Deque[str] = deque()
+        self._preloaded: Dict[str, int] = {}
+        self._preloaded_bytes = 0
+        # Preloading of a previous profile that's still in progress is ignored once this changes
+        self._generation = 0
+        self._preloading = False
+
+        self._hovered: Set[str] = set()
+        self._hovered_entry: Optional[HotkeyEntry] = None
+        self._hover_timer = QtCore.QTimer()
+        self._hover_timer.setSingleShot(True)
+        self._hover_timer.setInterval(HOVER_PRELOAD_DELAY_MS)
+        self._hover_timer.timeout.connect(self._preload_hovered)
+
+        self.stats = {
+            "plays": 0, "preloaded_hits": 0, "hovered_hits": 0, "cached_hits": 0, "misses": 0, "preloaded": 0,
+            "hover_preloads": 0
+        }
+
+    @property
+    def preload_count(self) -> int:
+        return self._preload_count
+
+    @preload_count.setter
+    def preload_count(self, preload_count: int):
+        """Set number of most used entries preloaded, 0 disables preloading of most used sounds."""
+        if preload_count != self._preload_count:
+            self._preload_count = max(0, preload_count)
+            self.preload()
+
+    @property
+    def budget_bytes(self) -> int:
+        return self._budget_bytes
+
+    @budget_bytes.setter
+    def budget_bytes(self, budget_bytes: int):
+        """Set maximum memory preloaded sounds can take, it's also capped by sound cache budget."""
+        if budget_bytes != self._budget_bytes:
+            self._budget_bytes = max(0, budget_bytes)
+            self.preload()
+
+    @property
+    def preloading(self) -> bool:
+        """Whether sounds of most used entries are still being preloaded."""
+        return self._preloading
+
+    @property
+    def preloaded_bytes(self) -> int:
+        return self._preloaded_bytes
+
+    @property
+    def hit_rates(self) -> Dict[str, float]:
+        """Share of plays of sound files that played from memory, in total and by why the sound was in memory."""
+        plays = self.stats["preloaded_hits"] + self.stats["hovered_hits"] + self.stats["cached_hits"]
+        counted = plays + self.stats["misses"]
+        if not counted:
+            return {"hit_rate": 0.0, "preloaded_hit_rate": 0.0, "hovered_hit_rate": 0.0}
+        return {
+            "hit_rate": round(plays / counted, 3),
+            "preloaded_hit_rate": round(self.stats["preloaded_hits"] / counted, 3),
+            "hovered_hit_rate": round(self.stats["hovered_hits"] / counted, 3)
+        }
+
+    def usage_score(self, entry: HotkeyEntry, now: float = None) -> float:
+        """Decayed number of plays of entry."""
+        score, updated = self._usage.get(entry.entry_id, (0.0, 0.0))
+        if not score:
+            return 0.0
+        now = time.time() if now is None else now
+        return score * 0.5 ** (max(0.0, now - updated) / self.half_life_s)
+
+    def set_entries(self, entries: List[HotkeyEntry]):
+        """
+        Switch to entries of a newly loaded profile and start preloading its most used sounds.
+        List is kept as is, entries appended to it later are taken into account on the next preload.
+        """
+        self.save_usage()
+        self._entries = entries
+        self._usage = self._profile_store.entry_usage(entry.entry_id for entry in entries)
+        self._hovered.clear()
+        self.preload()
+
+    def preload(self):
+        """Start preloading sounds of most used entries again, after entries or limits changed."""
+        self._generation += 1
+        self._queue.clear()
+        self._preloaded.clear()
+        self._preloaded_bytes = 0
+        self._preloading = False
+        if not self._preload_count or not self._budget_bytes or not self._entries:
+            return
+
+        now = time.time()
+        # Entries that were never used keep their order in profile, so a new profile preloads its first entries
+        most_used = heapq.nlargest(
+            self._preload_count, self._entries, key=lambda entry: self.usage_score(entry, now)
+        )
+        paths = dict.fromkeys(_absolute_path(entry.sound_path) for entry in most_used)
+        self._queue.extend(paths)
+        self._preloading = True
+        QtCore.QTimer.singleShot(0, lambda generation=self._generation: self._preload_next(generation))
+
+    def _preload_next(self, generation: int):
+        if generation != self._generation:
+            return
+
+        sound_cache = self._player_pool_manager.sound_cache
+        budget_bytes = min(self._budget_bytes, sound_cache.budget_bytes)
+        # With sound cache disabled there's nowhere to keep them
+        while self._queue and budget_bytes:
+            path = self._player_pool_manager.playable_path(self._queue.popleft())
+            # Directories play a random file each time, there's nothing to preload
+            if not os.path.isfile(path) or path in self._preloaded:
+                continue
+            size_bytes = os.path.getsize(path)
+            # Large files are streamed when played, they wouldn't be kept in memory anyway
+            if size_bytes >= sound_cache.streaming_threshold:
+                continue
+            # Decoded WAV is about as big as the file, other formats are only known once decoded
+            if path.lower().endswith(".wav") and self._preloaded_bytes + size_bytes > budget_bytes:
+                continue
+
+            sound_cache.load(
+                path, lambda sound: self._on_preloaded(generation, path, sound, budget_bytes), prefetch=True
+            )
+            return
+
+        self._preloading = False
+        logger.info(f"Preloaded {len(self._preloaded)} sounds, {self._preloaded_bytes / MEGABYTE:.1f} MB.")
+
+    def _on_preloaded(self, generation: int, path: str, sound: Optional[Sound], budget_bytes: int):
+        if generation != self._generation:
+            return
+
+        if isinstance(sound, DecodedSound):
+            size_bytes = sound.memory_bytes
+            if self._preloaded_bytes + size_bytes > budget_bytes:
+                # Stays in sound cache like any played sound, it's just not kept track of
+                self._queue.clear()
+            else:
+                self._preloaded[path] = size_bytes
+                self._preloaded_bytes += size_bytes
+                self.stats["preloaded"] += 1
+        # Next one on the next event loop iteration, cached sounds are loaded right away and GUI stays responsive
+        QtCore.QTimer.singleShot(0, lambda: self._preload_next(generation))
+
+    def hover(self, entry: HotkeyEntry):
+        """Entry is hovered in the table, its sound is preloaded if mouse stays on it for a moment."""
+        self._hovered_entry = entry
+        self._hover_timer.start()
+
+    def _preload_hovered(self):
+        entry, self._hovered_entry = self._hovered_entry, None
+        if entry is None or not self._player_pool_manager.sound_cache.budget_bytes:
+            return
+
+        path = self._player_pool_manager.playable_path(_absolute_path(entry.sound_path))
+        if not os.path.isfile(path) or self._player_pool_manager.sound_cache.is_cached(path):
+            return
+
+        self._hovered.add(path)
+        self.stats["hover_preloads"] += 1
+        self._player_pool_manager.sound_cache.load(path, lambda _sound: None, prefetch=True)
+
+    def record_play(self, entry: HotkeyEntry):
+        """Count play of entry towards its usage and hit rates, called right before the sound is played."""
+        self.stats["plays"] += 1
+        path = self._player_pool_manager.playable_path(_absolute_path(entry.sound_path))
+        if os.path.isfile(path):
+            if not self._player_pool_manager.sound_cache.is_cached(path):
+                self.stats["misses"] += 1
+            elif path in self._preloaded:
+                self.stats["preloaded_hits"] += 1
+            elif path in self._hovered:
+                self.stats["hovered_hits"] += 1
+            else:
+                self.stats["cached_hits"] += 1
+
+        if entry.entry_id is None:
+            return
+        now = time.time()
+        self._usage[entry.entry_id] = self.usage_score(entry, now) + 1, now
+        self._changed_usage.add(entry.entry_id)
+        if not self._save_timer.isActive():
+            self._save_timer.start()
+
+    def save_usage(self):
+        """Save changed usage scores to profile store."""
+        self._save_timer.stop()
+        if not self._changed_usage:
+            return
+
+        usage = {entry_id: self._usage[entry_id] for entry_id in self._changed_usage}
+        self._changed_usage.clear()
+        try:
+            self._profile_store.save_entry_usage(usage)
+        except Exception as e:  # noqa PyBroadException losing usage counts isn't worth interrupting playback
+            logger.warning(f"Can't save usage of {len(usage)} entries: {e}")
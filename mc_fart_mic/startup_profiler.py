@@ -0,0 +1,73 @@
+import os
+import time
+import logging
+from typing import List, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+logger = logging.getLogger(__name__)
+
+# Not imported from sound_cache, profiler is imported before anything that pulls in Qt
+MEGABYTE: int = 1024 * 1024
+
+
+def resident_memory() -> Optional[int]:
+    """
+    Resident memory of this process in bytes, from psutil or /proc on Linux.
+    :return: int bytes, None if it can't be read on this system
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class StartupProfiler:
+    """
+    Wall clock durations of consecutive startup phases, each mark ends the current phase and starts the next one.
+    Disabled profiler only checks a flag on mark so it can stay in the startup code.
+    """
+    def __init__(self, enabled: bool = False, started: float = None):
+        """
+        :param enabled: bool whether to record phases
+        :param started: float time.perf_counter() value when the first phase started, defaults to now
+        """
+        self.enabled = enabled
+        self._started = time.perf_counter() if started is None else started
+        self._last_mark = self._started
+        self._phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str):
+        """End phase with name phase."""
+        if not self.enabled:
+            return
+
+        now = time.perf_counter()
+        self._phases.append((phase, now - self._last_mark))
+        self._last_mark = now
+
+    @property
+    def total_ms(self) -> float:
+        return (self._last_mark - self._started) * 1000
+
+    def report(self) -> str:
+        lines = ["Startup phases:"]
+        for phase, duration in self._phases:
+            lines.append(f"    {phase:<32} {duration * 1000:>9.2f} ms")
+        lines.append(f"    {'total':<32} {self.total_ms:>9.2f} ms")
+        memory = resident_memory()
+        if memory is not None:
+            lines.append(f"    {'resident memory':<32} {memory / MEGABYTE:>9.2f} MB")
+        return "\n".join(lines)
+
+    def log_report(self):
+        report = self.report()
+        logger.info(report)
+        print(report, flush=True)
@@ -0,0 +1,334 @@
+import os
+import wave
+import hashlib
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import numpy
+except ImportError:  # Transcoding is optional, sounds play from the original files without it
+    numpy = None
+
+try:
+    import soundfile
+except ImportError:  # Formats libsndfile can't read are decoded by the multimedia backend
+    soundfile = None
+
+from PyQt5 import QtCore
+
+from constants import POSSIBLE_AUDIO_FORMATS, SURE_SUPPORTED_AUDIO_FORMATS
+from loudness import normalized_path
+from mixer import convert_frames, pcm_to_frames
+from sound_cache import MEGABYTE, BackendDecode, DecodedSound, DecodeError
+
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_CACHE_DIRECTORY = Path("transcoded")
+DEFAULT_TRANSCODE_CACHE_BUDGET: int = 512 * MEGABYTE
+TRANSCODE_WORKERS: int = 2
+# Formats that don't play on every backend, anything else is played from the original file
+TRANSCODED_FORMATS: Set[str] = POSSIBLE_AUDIO_FORMATS - set(SURE_SUPPORTED_AUDIO_FORMATS)
+_HASH_BLOCK_SIZE = 1024 * 1024
+# Outcomes of a transcoding job
+_TRANSCODED = "transcoded"
+_REUSED = "reused"
+_NEEDS_BACKEND_DECODE = "needs backend decode"
+
+# Sample rate, channel count
+OutputFormat = Tuple[int, int]
+FileKey = Tuple[str, int, int]
+
+
+def content_key(path: str, output_format: OutputFormat) -> str:
+    """Name of transcoded file in the cache, hash of source file content and output format."""
+    digest = hashlib.blake2b(f"{output_format[0]}:{output_format[1]}:16".encode(), digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_wav(frames: "numpy.ndarray", path: Path, sample_rate: int):
+    """Write float frames in range [-1, 1] as 16 bit WAV file, file appears at path only once it's complete."""
+    # Another worker can be writing the same file for a duplicate source
+    temporary_path = path.with_name(f"{path.stem}.{threading.get_ident()}.tmp")
+    with wave.open(str(temporary_path), "wb") as wav_file:
+        wav_file.setnchannels(frames.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes((numpy.clip(frames, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    os.replace(temporary_path, path)
+
+
+def evict_to_budget(directory: Path, budget_bytes: int, keep: Path = None) -> List[Path]:
+    """
+    Remove least recently used transcoded files until the rest fit in budget, files are touched whenever they play.
+    :return: list of removed files
+    """
+    files = []
+    for path in directory.glob("*.wav"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime_ns, stat.st_size, path))
+
+    total = sum(size for _mtime, size, _path in files)
+    removed = []
+    for _mtime, size, path in sorted(files):
+        if total <= budget_bytes:
+            break
+        elif path == keep:
+            continue
+
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+        removed.append(path)
+    return removed
+
+
+class TranscodeCache(QtCore.QObject):
+    """
+    Files in formats that don't play on every backend, transcoded in background to 16 bit PCM WAV in the format of the
+    output device, so they play trough the same fast path as WAV files and nothing is resampled when they play.
+
+    Transcoded files are saved in a directory named by hash of source content and output format, so renamed or
+    duplicated sources and files transcoded in previous runs are found without decoding again. Directory is limited
+    in size, least recently played files are removed first.
+    Files are decoded with soundfile (libsndfile) on worker threads if it's installed and can read the format,
+    otherwise by the multimedia backend, one file at a time.
+    """
+    transcoded = QtCore.pyqtSignal(str)
+    # Signals from worker threads, delivered queued on the cache thread
+    _job_finished = QtCore.pyqtSignal(object, object)
+    _sources_found = QtCore.pyqtSignal(object, object)
+
+    def __init__(
+            self, directory: Path = TRANSCODE_CACHE_DIRECTORY, budget_bytes: int = DEFAULT_TRANSCODE_CACHE_BUDGET,
+            max_workers: int = TRANSCODE_WORKERS
+    ):
+        super().__init__()
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._transcoded: Dict[Tuple[FileKey, OutputFormat], Path] = {}
+        self._pending: Dict[Tuple[FileKey, OutputFormat], Future] = {}
+        self._decode_queue: Deque[Tuple[FileKey, OutputFormat, Path]] = deque()
+        self._decode: Optional[BackendDecode] = None
+        self._enabled = False
+        self._job_finished.connect(self._on_job_finished)
+        self._sources_found.connect(self._on_sources_found)
+        self.stats = {"hits": 0, "misses": 0, _TRANSCODED: 0, _REUSED: 0, "failed": 0, "evicted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool):
+        if enabled and numpy is None:
+            logger.warning("Transcoding needs numpy installed, sounds will play from original files.")
+            enabled = False
+        self._enabled = enabled
+
+    @classmethod
+    def is_transcoded(cls, path: str) -> bool:
+        return os.path.splitext(path)[1].lower() in TRANSCODED_FORMATS
+
+    def get(self, path: str, output_format: OutputFormat) -> Optional[str]:
+        """
+        Path of transcoded file for path in output format, if it's not transcoded yet it's scheduled for transcoding
+        and None is returned.
+        :param path: absolute local file path
+        """
+        if not self._enabled or not self.is_transcoded(path):
+            return None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        key = (path, stat.st_size, stat.st_mtime_ns), output_format
+        transcoded_path = self._transcoded.get(key)
+        if transcoded_path is None:
+            self.stats["misses"] += 1
+            self._submit(key)
+            return None
+
+        try:
+            # Modification time is the last play time for eviction
+            os.utime(transcoded_path)
+        except OSError:
+            # Removed behind our back, transcode it again
+            del self._transcoded[key]
+            self._submit(key)
+            return None
+        self.stats["hits"] += 1
+        return str(transcoded_path)
+
+    def prepare(self, sound_paths: Iterable[str], output_format: Callable[[], OutputFormat]):
+        """
+        Transcode sound files and directories in background, ahead of the first play.
+        :param output_format: called once files are found, output device is often selected only after startup
+        """
+        if not self._enabled:
+            return
+
+        sound_paths = list(sound_paths)
+        threading.Thread(
+            target=lambda: self._sources_found.emit(list(self._iter_sources(sound_paths)), output_format),
+            name="transcode scan", daemon=True
+        ).start()
+
+    @classmethod
+    def _iter_sources(cls, sound_paths: List[str]) -> Iterator[FileKey]:
+        for sound_path in sound_paths:
+            if os.path.isdir(sound_path):
+                paths = (
+                    os.path.join(directory, name)
+                    for directory, _directories, names in os.walk(sound_path)
+                    for name in names if cls.is_transcoded(name)
+                )
+            else:
+                paths = (sound_path,) if cls.is_transcoded(sound_path) else ()
+
+            for path in paths:
+                path = normalized_path(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime_ns
+
+    @QtCore.pyqtSlot(object, object)
+    def _on_sources_found(self, file_keys: List[FileKey], output_format: Callable[[], OutputFormat]):
+        if not file_keys or not self._enabled:
+            return
+
+        output_format = output_format()
+        for file_key in file_keys:
+            key = file_key, output_format
+            if key not in self._transcoded:
+                self._submit(key)
+
+    def _submit(self, key: Tuple[FileKey, OutputFormat]):
+        if key in self._pending:
+            return
+
+        if self._executor is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._executor = ThreadPoolExecutor(self._max_workers, thread_name_prefix="transcode")
+        future = self._pending[key] = self._executor.submit(self._transcode, *key)
+        future.add_done_callback(lambda done: self._emit_result(key, done))
+
+    def _emit_result(self, key: Tuple[FileKey, OutputFormat], future: Future):
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:  # noqa PyBroadException reported on the cache thread
+            result = e
+        self._job_finished.emit(key, result)
+
+    def _transcode(self, file_key: FileKey, output_format: OutputFormat) -> Tuple[Path, str, List[Path]]:
+        """
+        Runs on a worker thread.
+        :return: tuple of transcoded file path, outcome of the job and files evicted to make space for it
+        """
+        path = file_key[0]
+        transcoded_path = self.directory / f"{content_key(path, output_format)}.wav"
+        if transcoded_path.exists():
+            return transcoded_path, _REUSED, []
+
+        frames, sample_rate = self._read_with_soundfile(path)
+        if frames is None:
+            return transcoded_path, _NEEDS_BACKEND_DECODE, []
+        return transcoded_path, _TRANSCODED, self._write(frames, sample_rate, output_format, transcoded_path)
+
+    @classmethod
+    def _read_with_soundfile(cls, path: str) -> Tuple[Optional["numpy.ndarray"], int]:
+        if soundfile is None:
+            return None, 0
+        try:
+            frames, sample_rate = soundfile.read(path, dtype="float32", always_2d=True)
+        except (RuntimeError, OSError) as e:
+            # Also raised for formats the installed libsndfile doesn't support
+            logger.info(f"Decoding '{path}' with the multimedia backend: {e}")
+            return None, 0
+        return frames, sample_rate
+
+    def _write(
+            self, frames: "numpy.ndarray", sample_rate: int, output_format: OutputFormat, transcoded_path: Path
+    ) -> List[Path]:
+        write_wav(convert_frames(frames, sample_rate, *output_format), transcoded_path, output_format[0])
+        return evict_to_budget(self.directory, self.budget_bytes, keep=transcoded_path)
+
+    def _write_decoded(
+            self, sound: DecodedSound, output_format: OutputFormat, transcoded_path: Path
+    ) -> Tuple[Path, str, List[Path]]:
+        """Runs on a worker thread, writes sound decoded by the backend."""
+        frames = pcm_to_frames(sound.pcm, sound.sample_size, sound.channel_count)
+        return transcoded_path, _TRANSCODED, self._write(frames, sound.sample_rate, output_format, transcoded_path)
+
+    @QtCore.pyqtSlot(object, object)
+    def _on_job_finished(self, key: Tuple[FileKey, OutputFormat], result: object):
+        if isinstance(result, Exception):
+            self._pending.pop(key, None)
+            self.stats["failed"] += 1
+            return logger.warning(f"Can't transcode '{key[0][0]}': {result}")
+
+        transcoded_path, outcome, evicted = result
+        if outcome == _NEEDS_BACKEND_DECODE:
+            self._decode_queue.append((*key, transcoded_path))
+            return self._decode_next()
+
+        self._pending.pop(key, None)
+        if evicted:
+            self.stats["evicted"] += len(evicted)
+            evicted = set(evicted)
+            self._transcoded = {
+                cached_key: path for cached_key, path in self._transcoded.items() if path not in evicted
+            }
+        self.stats[outcome] += 1
+        self._transcoded[key] = transcoded_path
+        self.transcoded.emit(key[0][0])
+
+    def _decode_next(self):
+        if self._decode is not None or not self._decode_queue:
+            return
+
+        file_key, output_format, transcoded_path = self._decode_queue.popleft()
+        self._decode = BackendDecode(
+            file_key[0], lambda result: self._on_decoded((file_key, output_format), transcoded_path, result)
+        )
+
+    def _on_decoded(self, key: Tuple[FileKey, OutputFormat], transcoded_path: Path, result: object):
+        self._decode = None
+        if self._executor is None:
+            return
+        elif isinstance(result, DecodeError):
+            self._job_finished.emit(key, result)
+        else:
+            future = self._pending[key] = self._executor.submit(self._write_decoded, result, key[1], transcoded_path)
+            future.add_done_callback(lambda done: self._emit_result(key, done))
+        self._decode_next()
+
+    def shutdown(self):
+        """Stop transcoding, files being written are finished in background."""
+        self._decode_queue.clear()
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,303 @@
+import os
+import json
+import stat
+import errno
+import socket
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple, Union
+
+from PyQt5 import QtCore
+
+from hotkey_entry import HotkeyEntry
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRIGGER_SERVER_ADDRESS = "127.0.0.1:28400"
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+# Longest request line, a batch of a few hundred triggers fits easily
+MAX_REQUEST_SIZE: int = 256 * 1024
+# Responses are written without waiting for the client until this much is buffered
+WRITE_BUFFER_LIMIT: int = 64 * 1024
+# How long stop waits for connected clients to be dropped
+STOP_TIMEOUT_S: float = 2.0
+
+# (host, port) for localhost TCP or path of Unix domain socket
+Address = Union[Tuple[str, int], str]
+
+
+class TriggerRequestError(Exception):
+    """Request can't be done, message is sent back to the client."""
+
+
+def parse_address(address: str) -> Address:
+    """
+    Parse trigger server address, 'host:port' or just 'port' for localhost TCP, anything else is Unix socket path.
+    :raises ValueError: if host is not local or Unix sockets are not supported on this system
+    """
+    host, separator, port = address.rpartition(":")
+    if port.isdigit():
+        host = host.strip("[]") if separator else LOCAL_HOSTS[0]
+        if host not in LOCAL_HOSTS:
+            raise ValueError(f"Trigger server only listens on local addresses, not on '{host}'.")
+        return host, int(port)
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError(f"Unix sockets are not supported on this system, use 'host:port' instead of '{address}'.")
+    return address
+
+
+def format_address(address: Address) -> str:
+    return address if isinstance(address, str) else f"{address[0]}:{address[1]}"
+
+
+def encode_message(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+class TriggerServer(QtCore.QObject):
+    """
+    Local socket API for triggering sounds from scripts (stream deck, chat bots) instead of synthetic key presses.
+
+    Protocol is one JSON object per line both ways, each request gets exactly one response line, in request order:
+        {"op": "play", "hotkey": "ctrl+1"}              plays every entry of hotkey in the loaded profile
+        {"op": "play", "sound": "sounds/a.wav"}         plays sound file or directory, optionally with priority,
+                                                        choke_group and start_offset_ms
+        {"op": "stop"}                                  stops all sounds
+        {"op": "load_profile", "name": "default"}
+        {"op": "batch", "requests": [...]}              any requests above, answered with one response
+        {"op": "ping"}
+    Response is {"ok": true, ...} or {"ok": false, "error": "..."}, "id" of the request is copied to its response.
+
+    Server runs its own asyncio event loop on a background thread. Hotkeys are looked up in a snapshot of the loaded
+    profile and submitted to hotkey dispatcher right on that thread, the same way keyboard hooks submit them, so they
+    never wait for the GUI thread. Other requests run on the GUI thread and are answered once they are done.
+    """
+    # Emitted from the server thread, delivered queued on the thread the server was created on
+    _command_received = QtCore.pyqtSignal(object, object)
+
+    def __init__(
+            self, address: str, *, submit: Callable[[HotkeyEntry], bool],
+            commands: Dict[str, Callable[[dict], Optional[dict]]]
+    ):
+        """
+        :param address: 'host:port' or 'port' for localhost TCP, or Unix socket path, port 0 picks a free port
+        :param submit: called on the server thread with each hotkey entry to play, returns whether it was queued
+        :param commands: op -> handler called on the GUI thread with the request, returns extra response fields
+        :raises ValueError: if address is invalid
+        """
+        super().__init__()
+        self._address = parse_address(address)
+        self._submit = submit
+        self._commands = commands
+        self._entries_by_hotkey: Dict[str, Tuple[HotkeyEntry, ...]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Connected clients, only touched on the server thread
+        self._client_writers: Set[asyncio.StreamWriter] = set()
+        self._client_tasks: Set[asyncio.Task] = set()
+        self._command_received.connect(self._run_command)
+        self.stats = {"connections": 0, "requests": 0, "triggers": 0, "errors": 0}
+
+    @property
+    def address(self) -> str:
+        """Address server listens on, with the actual port if it was started on port 0."""
+        return format_address(self._address)
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    def set_entries(self, entries: Iterable[HotkeyEntry]):
+        """Set hotkey entries that can be played by hotkey, usually all entries of the loaded profile."""
+        entries_by_hotkey = {}
+        for entry in entries:
+            entries_by_hotkey[entry.hotkey] = (*entries_by_hotkey.get(entry.hotkey, ()), entry)
+        # Replaced as a whole, server thread always sees either old or new entries
+        self._entries_by_hotkey = entries_by_hotkey
+
+    def start(self):
+        """
+        Start listening on a background thread, returns once the server listens.
+        :raises OSError: if server can't listen on the address
+        """
+        started = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                self._server = loop.run_until_complete(self._listen())
+            except OSError as e:
+                errors.append(e)
+                loop.close()
+                return
+            else:
+                self._loop = loop
+            finally:
+                started.set()
+            loop.run_forever()
+            loop.close()
+
+        threading.Thread(target=run, name="trigger server", daemon=True).start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        logger.info(f"Trigger server listening on {self.address}")
+
+    async def _listen(self) -> asyncio.AbstractServer:
+        if isinstance(self._address, str):
+            await self._remove_stale_socket(self._address)
+            return await asyncio.start_unix_server(self._serve_client, self._address, limit=MAX_REQUEST_SIZE)
+
+        server = await asyncio.start_server(
+            self._serve_client, self._address[0], self._address[1], limit=MAX_REQUEST_SIZE
+        )
+        self._address = self._address[0], server.sockets[0].getsockname()[1]
+        return server
+
+    @classmethod
+    async def _remove_stale_socket(cls, path: str):
+        """
+        Remove Unix socket left behind by a previous run that didn't exit cleanly.
+        :raises OSError: if another server still listens on the socket
+        """
+        try:
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                # Not ours to remove, listening fails with address in use
+                return
+        except FileNotFoundError:
+            return
+
+        try:
+            _reader, writer = await asyncio.open_unix_connection(path)
+        except ConnectionRefusedError:
+            logger.info(f"Removing stale trigger server socket '{path}'")
+            os.unlink(path)
+            return
+        writer.close()
+        raise OSError(errno.EADDRINUSE, f"Another server is already listening on '{path}'.")
+
+    def stop(self):
+        """Stop listening and serving connected clients, returns once their connections are dropped."""
+        loop, server = self._loop, self._server
+        if loop is None or server is None:
+            return
+
+        self._loop = self._server = None
+        closed = asyncio.run_coroutine_threadsafe(self._close(server), loop)
+        try:
+            closed.result(STOP_TIMEOUT_S)
+        except Exception as e:  # noqa PyBroadException quitting anyway, server thread is a daemon
+            logger.warning(f"Trigger server didn't stop cleanly: {e!r}")
+        loop.call_soon_threadsafe(loop.stop)
+        if isinstance(self._address, str) and os.path.exists(self._address):
+            os.unlink(self._address)
+
+    async def _close(self, server: asyncio.AbstractServer):
+        server.close()
+        for writer in self._client_writers:
+            writer.close()
+        for task in self._client_tasks:
+            task.cancel()
+        await asyncio.gather(*self._client_tasks, return_exceptions=True)
+        await server.wait_closed()
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+        task = asyncio.current_task()
+        self._client_writers.add(writer)
+        self._client_tasks.add(task)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Line over the limit, rest of the stream can't be split into requests reliably
+                    writer.write(encode_message({"ok": False, "error": "Request too long."}))
+                    break
+                if not line:
+                    break
+
+                writer.write(encode_message(await self._respond(line)))
+                if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                    await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelled by stop, client task ends normally so asyncio doesn't log it as an error
+            pass
+        finally:
+            self._client_writers.discard(writer)
+            self._client_tasks.discard(task)
+            writer.close()
+
+    async def _respond(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            self.stats["errors"] += 1
+            return {"ok": False, "error": "Request is not valid JSON."}
+        if not isinstance(request, dict):
+            self.stats["errors"] += 1
+            return {"ok": False, "error": "Request must be a JSON object."}
+
+        if request.get("op") == "batch":
+            requests = request.get("requests")
+            if not isinstance(requests, list):
+                self.stats["errors"] += 1
+                response = {"ok": False, "error": "Batch needs a list of requests."}
+            else:
+                response = {"ok": True, "responses": [await self._handle(request) for request in requests]}
+            if "id" in request:
+                response["id"] = request["id"]
+            return response
+        return await self._handle(request)
+
+    async def _handle(self, request: dict) -> dict:
+        self.stats["requests"] += 1
+        if not isinstance(request, dict):
+            response = {"ok": False, "error": "Request must be a JSON object."}
+        else:
+            try:
+                response = {"ok": True, **(await self._run(request) or {})}
+            except TriggerRequestError as e:
+                response = {"ok": False, "error": str(e)}
+            except Exception as e:  # noqa PyBroadException client gets an answer, details are in the log
+                logger.exception(f"Trigger request {request} failed")
+                response = {"ok": False, "error": f"Request failed: {e}"}
+
+            if "id" in request:
+                response["id"] = request["id"]
+
+        if not response["ok"]:
+            self.stats["errors"] += 1
+        return response
+
+    async def _run(self, request: dict) -> Optional[dict]:
+        op = request.get("op")
+        if op == "play" and "hotkey" in request:
+            entries = self._entries_by_hotkey.get(request["hotkey"])
+            if not entries:
+                raise TriggerRequestError(f"No hotkey '{request['hotkey']}' in the loaded profile.")
+            queued = sum(self._submit(entry) for entry in entries)
+            self.stats["triggers"] += queued
+            return {"queued": queued}
+        elif op == "ping":
+            return None
+        elif op not in self._commands:
+            raise TriggerRequestError(f"Unknown op '{op}'.")
+
+        future = Future()
+        self._command_received.emit(request, future)
+        return await asyncio.wrap_future(future)
+
+    @QtCore.pyqtSlot(object, object)
+    def _run_command(self, request: dict, future: Future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self._commands[request["op"]](request))
+        except Exception as e:  # noqa PyBroadException passed to the server thread
+            future.set_exception(e)
@@ -0,0 +1,103 @@
+"""
+Loading of Qt designer .ui layouts trough Python classes generated from them.
+
+Parsing .ui XML on every start is the slowest part of creating a window, so each layout is compiled once with
+uic.compileUi into layouts/compiled and the generated module is imported instead (its bytecode is cached by Python
+like for any other module). Generated module stores hash of the .ui file it was generated from, if the .ui file
+changed it is generated again. If generated module can't be written (read only install) layout is parsed at runtime.
+
+All layouts can also be compiled ahead of time, for example before packaging:
+    python ui_loader.py
+"""
+import io
+import sys
+import hashlib
+import logging
+import importlib.util
+from pathlib import Path
+from types import ModuleType
+from typing import Optional
+
+from PyQt5 import uic
+from PyQt5.QtWidgets import QWidget
+
+
+logger = logging.getLogger(__name__)
+
+LAYOUTS_DIRECTORY = Path("layouts")
+COMPILED_DIRECTORY = LAYOUTS_DIRECTORY / "compiled"
+SOURCE_HASH_PREFIX = "# Source hash: "
+
+
+def _source_hash(ui_path: Path) -> str:
+    return hashlib.sha1(ui_path.read_bytes()).hexdigest()
+
+
+def _compiled_path(ui_path: Path) -> Path:
+    return COMPILED_DIRECTORY / f"ui_{ui_path.stem}.py"
+
+
+def is_stale(ui_path: Path) -> bool:
+    """Whether generated module for .ui file is missing or was generated from a different version of it."""
+    try:
+        with open(_compiled_path(ui_path)) as f:
+            first_line = f.readline().rstrip("\n")
+    except FileNotFoundError:
+        return True
+    return first_line != f"{SOURCE_HASH_PREFIX}{_source_hash(ui_path)}"
+
+
+def compile_ui(ui_path: Path) -> Path:
+    """Generate Python module from .ui file, module is replaced atomically so it's never seen half written."""
+    code = io.StringIO()
+    uic.compileUi(str(ui_path), code)
+    compiled_path = _compiled_path(ui_path)
+    compiled_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = compiled_path.with_suffix(".tmp")
+    with open(temporary_path, "w") as f:
+        f.write(f"{SOURCE_HASH_PREFIX}{_source_hash(ui_path)}\n")
+        f.write(code.getvalue())
+    temporary_path.replace(compiled_path)
+    logger.info(f"Compiled '{ui_path}' to '{compiled_path}'.")
+    return compiled_path
+
+
+def _compiled_module(ui_path: Path) -> Optional[ModuleType]:
+    try:
+        if is_stale(ui_path):
+            compile_ui(ui_path)
+    except OSError as e:
+        logger.warning(f"Can't compile '{ui_path}': {e}, loading it at runtime.")
+        return None
+
+    compiled_path = _compiled_path(ui_path)
+    spec = importlib.util.spec_from_file_location(f"ui_{ui_path.stem}", str(compiled_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_ui(ui_name: str, widget: QWidget):
+    """
+    Set up widget from layout, same as uic.loadUi all named child widgets become attributes of the widget.
+    :param ui_name: str layout file name inside layouts directory, for example "settings.ui"
+    :param widget: QWidget to set up
+    """
+    ui_path = LAYOUTS_DIRECTORY / ui_name
+    module = _compiled_module(ui_path)
+    if module is None:
+        uic.loadUi(str(ui_path), widget)
+        return
+
+    ui_class = next(value for name, value in vars(module).items() if name.startswith("Ui_"))
+    ui = ui_class()
+    ui.setupUi(widget)
+    for name, value in vars(ui).items():
+        setattr(widget, name, value)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for path in sorted(LAYOUTS_DIRECTORY.glob("*.ui")):
+        if is_stale(path) or "--force" in sys.argv:
+            compile_ui(path)
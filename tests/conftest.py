@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+
+import pytest
+from PyQt5.QtCore import QCoreApplication
+
+# Modules of the program import each other by bare name, like when it's run from mc_fart_mic
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "mc_fart_mic"))
+
+from config import Config  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def qt_app() -> QCoreApplication:
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def saved_config(qt_app, monkeypatch, tmp_path):
+    """Config as if it was saved with given values, nothing is written to the real config file."""
+    monkeypatch.setattr(Config, "PATH", tmp_path / "config.json")
+
+    def set_saved_config(data: dict):
+        monkeypatch.setattr(Config, "_config_data", dict(data))
+
+    return set_saved_config
@@ -0,0 +1,109 @@
+import pytest
+
+import hotkey_dispatcher
+from hotkey_entry import HotkeyEntry
+from hotkey_dispatcher import DROP_NEWEST, DROP_OLDEST, HotkeyDispatcher
+
+
+class FakeClock:
+    """Stands in for time module of the dispatcher, time only moves when the test says so."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, ms: float):
+        self.now += ms / 1000
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(hotkey_dispatcher, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def played() -> list:
+    return []
+
+
+def create_dispatcher(played: list, **kwargs) -> HotkeyDispatcher:
+    dispatcher = HotkeyDispatcher(lambda entry, trace: played.append(entry), **kwargs)
+    dispatcher.repeat_window_ms = 150
+    dispatcher.cooldown_ms = 0
+    dispatcher.rate_limit_per_second = 0
+    return dispatcher
+
+
+def test_held_key_plays_once(qt_app, clock, played):
+    dispatcher = create_dispatcher(played)
+    entry = HotkeyEntry("a", "1.wav")
+    # Auto-repeat every 50 ms for a second, window slides with every repeat
+    accepted = []
+    for _ in range(20):
+        accepted.append(dispatcher.submit(entry))
+        clock.advance(50)
+    assert accepted == [True] + [False] * 19
+
+    clock.advance(200)
+    assert dispatcher.submit(entry)
+    # Trigger server requests are never repeats
+    assert dispatcher.submit(entry, coalesce_repeats=False)
+    qt_app.processEvents()
+    assert played == [entry] * 3
+    assert dispatcher.stats["coalesced"] == 19
+
+
+def test_cooldown_of_entry_overrides_setting(qt_app, clock, played):
+    dispatcher = create_dispatcher(played)
+    dispatcher.cooldown_ms = 1000
+    default_entry = HotkeyEntry("a", "1.wav")
+    short_entry = HotkeyEntry("b", "2.wav", cooldown_ms=300)
+
+    for _ in range(5):
+        dispatcher.submit(default_entry, coalesce_repeats=False)
+        dispatcher.submit(short_entry, coalesce_repeats=False)
+        clock.advance(250)
+    qt_app.processEvents()
+    # Triggers at 0, 250, 500, 750 and 1000 ms
+    assert played.count(default_entry) == 2
+    assert played.count(short_entry) == 3
+    assert dispatcher.stats["cooldown"] == 5
+
+
+def test_rate_limit_allows_bursts_then_refills(qt_app, clock, played):
+    dispatcher = create_dispatcher(played)
+    dispatcher.rate_limit_per_second = 2
+    dispatcher.rate_limit_burst = 3
+    entry = HotkeyEntry("a", "1.wav")
+
+    assert [dispatcher.submit(entry, coalesce_repeats=False) for _ in range(5)] == [True] * 3 + [False] * 2
+    clock.advance(500)
+    assert [dispatcher.submit(entry, coalesce_repeats=False) for _ in range(2)] == [True, False]
+    assert dispatcher.stats["rate_limited"] == 3
+
+
+@pytest.mark.parametrize("drop_policy, kept", [(DROP_OLDEST, [2, 3]), (DROP_NEWEST, [0, 1])])
+def test_full_queue_drops_by_policy(qt_app, clock, played, drop_policy, kept):
+    dispatcher = create_dispatcher(played, max_queue_size=2, drop_policy=drop_policy)
+    entries = [HotkeyEntry(str(index), f"{index}.wav") for index in range(4)]
+    for entry in entries:
+        dispatcher.submit(entry)
+
+    qt_app.processEvents()
+    assert played == [entries[index] for index in kept]
+    assert dispatcher.stats["dropped"] == 2
+
+
+def test_reset_forgets_queued_triggers_and_cooldowns(qt_app, clock, played):
+    dispatcher = create_dispatcher(played)
+    dispatcher.cooldown_ms = 1000
+    entry = HotkeyEntry("a", "1.wav")
+    dispatcher.submit(entry, coalesce_repeats=False)
+
+    dispatcher.reset()
+    qt_app.processEvents()
+    assert played == []
+    assert dispatcher.submit(entry, coalesce_repeats=False)
@@ -0,0 +1,75 @@
+from typing import Callable, Dict, List, Tuple
+
+import pytest
+
+import hotkey_registry
+from hotkey_entry import HotkeyEntry
+from hotkey_registry import HotkeyRegistry
+
+
+class FakeKeyboard:
+    """Stands in for keyboard module, records hotkey registrations instead of hooking the real keyboard."""
+    def __init__(self):
+        self.hotkeys: Dict[int, Tuple[str, Callable, tuple]] = {}
+        self.calls: List[Tuple[str, str]] = []
+        self._next_handle = 0
+
+    def add_hotkey(self, hotkey: str, callback: Callable, args: tuple = ()) -> int:
+        self._next_handle += 1
+        self.hotkeys[self._next_handle] = (hotkey, callback, args)
+        self.calls.append(("add", hotkey))
+        return self._next_handle
+
+    def remove_hotkey(self, handle: int):
+        hotkey, _callback, _args = self.hotkeys.pop(handle)
+        self.calls.append(("remove", hotkey))
+
+    def press(self, hotkey: str):
+        for registered_hotkey, callback, args in list(self.hotkeys.values()):
+            if registered_hotkey == hotkey:
+                callback(*args)
+
+
+@pytest.fixture
+def fake_keyboard(monkeypatch) -> FakeKeyboard:
+    fake_keyboard = FakeKeyboard()
+    monkeypatch.setattr(hotkey_registry, "keyboard", fake_keyboard)
+    return fake_keyboard
+
+
+def test_only_changed_hotkeys_are_registered(fake_keyboard):
+    played = []
+    registry = HotkeyRegistry(played.append)
+    assert registry.set_entries([HotkeyEntry("a", "1.wav"), HotkeyEntry("b", "2.wav"), HotkeyEntry("b", "3.wav")]) == (
+        3, 0, 0
+    )
+
+    fake_keyboard.calls.clear()
+    new_b = HotkeyEntry("b", "4.wav")
+    assert registry.set_entries([new_b, HotkeyEntry("c", "5.wav")]) == (1, 2, 1)
+    assert sorted(fake_keyboard.calls) == [("add", "c"), ("remove", "a"), ("remove", "b")]
+    assert len(registry) == 2
+
+    # Kept registration plays the entry of the new profile
+    fake_keyboard.press("b")
+    assert played == [new_b]
+
+
+def test_new_hotkeys_are_added_before_old_ones_are_removed(fake_keyboard):
+    registry = HotkeyRegistry(lambda entry: None)
+    registry.set_entries([HotkeyEntry("a", "1.wav"), HotkeyEntry("b", "2.wav")])
+
+    fake_keyboard.calls.clear()
+    registry.set_entries([HotkeyEntry("c", "3.wav"), HotkeyEntry("d", "4.wav")])
+    assert [call for call, _hotkey in fake_keyboard.calls] == ["add", "add", "remove", "remove"]
+
+
+def test_clear_removes_every_hotkey(fake_keyboard):
+    registry = HotkeyRegistry(lambda entry: None)
+    registry.set_entries([HotkeyEntry("a", "1.wav")])
+    registry.add(HotkeyEntry("a", "2.wav"))
+    assert len(fake_keyboard.hotkeys) == 2
+
+    registry.clear()
+    assert len(registry) == 0
+    assert fake_keyboard.hotkeys == {}
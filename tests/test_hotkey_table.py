@@ -0,0 +1,93 @@
+import pytest
+from PyQt5.QtCore import QModelIndex
+from PyQt5.QtTest import QAbstractItemModelTester
+
+from hotkey_entry import HotkeyEntry
+from hotkey_table import HotkeyTableModel
+from profile_store import ProfileStore
+
+PROFILE_NAME = "test"
+
+
+@pytest.fixture
+def profile_store(tmp_path) -> ProfileStore:
+    profile_store = ProfileStore(tmp_path / "profiles.sqlite3")
+    profile_store.create_profile(PROFILE_NAME)
+    profile_store.add_entries(PROFILE_NAME, [
+        HotkeyEntry(f"ctrl+{index}", f"sounds/{'fart' if index % 10 == 0 else 'beep'}_{index:03}.wav")
+        for index in range(450)
+    ])
+    yield profile_store
+    profile_store.close()
+
+
+@pytest.fixture
+def model(qt_app, profile_store) -> HotkeyTableModel:
+    model = HotkeyTableModel()
+    model.set_profile(profile_store, PROFILE_NAME)
+    return model
+
+
+def test_profile_is_read_page_by_page(model):
+    assert model.rowCount() == 0
+    assert model.canFetchMore(QModelIndex())
+
+    model.fetchMore(QModelIndex())
+    assert model.rowCount() == HotkeyTableModel.PAGE_SIZE
+    model.fetchMore(QModelIndex())
+    model.fetchMore(QModelIndex())
+    assert model.rowCount() == 450
+    assert model.entry(449).hotkey == "ctrl+449"
+
+    model.fetchMore(QModelIndex())
+    assert not model.canFetchMore(QModelIndex())
+    assert model.rowCount() == 450
+
+
+def test_page_is_read_once_when_view_asks_for_more_while_it_is_inserted(model):
+    # Model tester fetches more on every insert, like a view that's still short of rows
+    QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal, model)
+    while model.canFetchMore(QModelIndex()):
+        model.fetchMore(QModelIndex())
+    assert [model.entry(row).hotkey for row in range(model.rowCount())] == [f"ctrl+{index}" for index in range(450)]
+
+
+def test_search_reads_remaining_pages(model):
+    model.fetchMore(QModelIndex())
+    model.set_filter("FART")
+    assert model.rowCount() == 45
+    assert not model.canFetchMore(QModelIndex())
+    assert model.entry(44).sound_path == "sounds/fart_440.wav"
+
+    model.set_filter("")
+    assert model.rowCount() == 450
+
+
+def test_added_entry_comes_with_next_page_until_all_are_read(model, profile_store):
+    model.fetchMore(QModelIndex())
+    entry = profile_store.add_entry(PROFILE_NAME, HotkeyEntry("alt+a", "sounds/new.wav"))
+    model.append_entry(entry)
+    assert model.rowCount() == HotkeyTableModel.PAGE_SIZE
+
+    while model.canFetchMore(QModelIndex()):
+        model.fetchMore(QModelIndex())
+    assert model.rowCount() == 451
+    assert model.entry(450).hotkey == "alt+a"
+
+    model.append_entry(HotkeyEntry("alt+b", "sounds/other.wav"))
+    assert model.rowCount() == 452
+
+
+def test_appended_rows_are_announced_before_they_are_added(model):
+    while model.canFetchMore(QModelIndex()):
+        model.fetchMore(QModelIndex())
+    QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal, model)
+    row_counts = []
+    model.rowsAboutToBeInserted.connect(lambda parent, first, last: row_counts.append((model.rowCount(), first)))
+
+    model.append_entry(HotkeyEntry("alt+a", "sounds/fart_new.wav"))
+    model.set_filter("fart")
+    model.append_entry(HotkeyEntry("alt+b", "sounds/fart_other.wav"))
+    model.append_entry(HotkeyEntry("alt+c", "sounds/beep_other.wav"))
+    assert row_counts == [(450, 450), (46, 46)]
+    assert model.entry(46).hotkey == "alt+b"
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+import keyword_matcher
+from keyword_matcher import KeywordMatcher
+
+
+@pytest.fixture
+def matches() -> list:
+    return []
+
+
+def type_keys(matcher: KeywordMatcher, *names: str):
+    for name in names:
+        matcher.on_key_event(SimpleNamespace(name=name))
+
+
+def type_text(matcher: KeywordMatcher, text: str):
+    type_keys(matcher, *("space" if character == " " else character for character in text))
+
+
+def test_overlapping_keywords_are_all_matched(matches):
+    matcher = KeywordMatcher(matches.append)
+    matcher.set_keywords({"he": "he", "she": "she", "hers": "hers", "his": "his"})
+
+    type_text(matcher, "ushers")
+    assert matches == ["she", "he", "hers"]
+    assert sorted(matcher.find_all("UsHeRs")) == ["he", "hers", "she"]
+
+
+def test_keywords_are_matched_anywhere_and_case_insensitive(matches):
+    matcher = KeywordMatcher(matches.append)
+    matcher.set_keywords({"Fart": 1, "oh no": 2})
+
+    type_keys(matcher, "shift", "F", "a", "r", "t")
+    type_text(matcher, "xoh no")
+    assert matches == [1, 2]
+
+
+def test_backspace_edits_typed_text(matches):
+    matcher = KeywordMatcher(matches.append)
+    matcher.set_keywords({"fart": 1})
+
+    type_keys(matcher, "f", "a", "x", "backspace", "r", "t")
+    assert matches == [1]
+    # Deleting past the start of the buffer is harmless
+    type_keys(matcher, *["backspace"] * 10, "f", "a", "r", "t")
+    assert matches == [1, 1]
+
+
+def test_other_keys_break_the_typed_word(matches):
+    matcher = KeywordMatcher(matches.append)
+    matcher.set_keywords({"fart": 1})
+
+    type_keys(matcher, "f", "a", "enter", "r", "t")
+    assert matches == []
+
+
+def test_matching_continues_with_new_keywords(matches):
+    matcher = KeywordMatcher(matches.append)
+    matcher.set_keywords({"fart": 1})
+
+    type_text(matcher, "bur")
+    # Automaton is rewound trough typed text, so keyword started before the change still matches
+    matcher.set_keywords({"fart": 1, "burp": 2})
+    type_text(matcher, "p")
+    assert matches == [2]
+
+    matcher.set_keywords({"burp": 2})
+    type_text(matcher, "fart")
+    assert matches == [2]
+    assert matcher.keyword_count == 1
+
+
+def test_keywords_longer_than_buffer_are_skipped(matches):
+    matcher = KeywordMatcher(matches.append, max_keyword_length=4)
+    matcher.set_keywords({"fart": 1, "thunder": 2})
+    assert matcher.keyword_count == 1
+
+    matcher.max_keyword_length = 7
+    assert matcher.keyword_count == 2
+    type_text(matcher, "thunder")
+    assert matches == [2]
+
+    matcher.max_keyword_length = 0
+    type_text(matcher, "fart")
+    assert matches == [2]
+
+
+def test_keys_are_hooked_only_with_keywords_to_match(monkeypatch, matches):
+    hooks = []
+
+    def on_press(callback):
+        hooks.append(callback)
+        return callback
+
+    monkeypatch.setattr(keyword_matcher, "keyboard", SimpleNamespace(on_press=on_press, unhook=hooks.remove))
+    matcher = KeywordMatcher(matches.append, max_keyword_length=4)
+
+    matcher.set_keywords({"thunder": 1})
+    matcher.hook()
+    assert hooks == []
+
+    matcher.set_keywords({"fart": 1})
+    matcher.hook()
+    matcher.hook()
+    assert hooks == [matcher.on_key_event]
+    matcher.unhook()
+    assert hooks == []
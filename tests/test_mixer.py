@@ -0,0 +1,105 @@
+import time
+import wave
+import threading
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from sound_cache import DecodedSound, SoundCache  # noqa: E402
+from mixer import MixerEngine, WaveFileSink, convert_to_mixer_format  # noqa: E402
+
+SAMPLE_RATE = 8000
+BLOCK_FRAMES = 512
+
+
+def constant_sound(value: float, frame_count: int, *, sample_rate: int = SAMPLE_RATE) -> DecodedSound:
+    pcm = numpy.full(frame_count, round(value * 32768), dtype="<i2").tobytes()
+    return DecodedSound(pcm, sample_rate=sample_rate, channel_count=1, sample_size=16)
+
+
+def render_to_file(qt_app, tmp_path, engine: MixerEngine, block_count: int) -> "numpy.ndarray":
+    path = str(tmp_path / "mixed.wav")
+    sink = WaveFileSink(engine, path)
+    for _ in range(block_count):
+        sink.pump(BLOCK_FRAMES)
+    sink.close()
+    with wave.open(path, "rb") as wav_file:
+        assert (wav_file.getframerate(), wav_file.getnchannels()) == (SAMPLE_RATE, 1)
+        return numpy.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype="<i2")
+
+
+def test_voices_are_summed_and_end_with_their_sound(qt_app, tmp_path):
+    engine = MixerEngine(sample_rate=SAMPLE_RATE, channel_count=1)
+    engine.add_voice(constant_sound(0.25, 600))
+    engine.add_voice(constant_sound(0.5, 300))
+
+    samples = render_to_file(qt_app, tmp_path, engine, 2)
+    assert len(samples) == 2 * BLOCK_FRAMES
+    assert numpy.abs(samples[:300] - round(0.75 * 32767)).max() <= 2
+    assert numpy.abs(samples[300:600] - round(0.25 * 32767)).max() <= 2
+    assert not samples[600:].any()
+    assert engine.active_voice_count == 0
+
+
+def test_gain_and_start_position(qt_app, tmp_path):
+    engine = MixerEngine(sample_rate=SAMPLE_RATE, channel_count=1)
+    # 100 ms in at 8 kHz is 800 frames, 200 are left
+    engine.add_voice(constant_sound(0.5, 1000), gain=0.5, start_ms=100)
+
+    samples = render_to_file(qt_app, tmp_path, engine, 1)
+    assert numpy.abs(samples[:200] - round(0.25 * 32767)).max() <= 2
+    assert not samples[200:].any()
+
+
+def test_loud_mix_is_limited_without_wrapping(qt_app, tmp_path):
+    engine = MixerEngine(sample_rate=SAMPLE_RATE, channel_count=1)
+    for _ in range(3):
+        engine.add_voice(constant_sound(0.5, 4 * BLOCK_FRAMES))
+
+    samples = render_to_file(qt_app, tmp_path, engine, 2)
+    # Sum is 1.5, limiter brings it down to full scale instead of letting it clip or overflow
+    assert samples.min() > 0
+    assert samples.max() <= 32767
+    assert numpy.abs(samples[BLOCK_FRAMES:].astype(numpy.int32) - 32767).max() <= 4
+
+
+def test_sound_converted_before_caching_is_mixed_as_is(qt_app, tmp_path):
+    engine = MixerEngine(sample_rate=SAMPLE_RATE, channel_count=1)
+    sound = constant_sound(0.5, 100)
+    sound.converted[SAMPLE_RATE, 1] = numpy.full((100, 1), 0.125, dtype=numpy.float32)
+    engine.add_voice(sound)
+
+    samples = render_to_file(qt_app, tmp_path, engine, 1)
+    assert numpy.abs(samples[:100] - round(0.125 * 32767)).max() <= 2
+
+
+def test_sound_cache_prepares_sounds_on_worker_thread(qt_app, tmp_path):
+    path = tmp_path / "sound.wav"
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE // 2)
+        wav_file.writeframes(constant_sound(0.5, 400).pcm.tobytes())
+
+    prepared_on = []
+
+    def prepare(sound: DecodedSound):
+        prepared_on.append(threading.current_thread())
+        sound.converted[SAMPLE_RATE, 2] = convert_to_mixer_format(sound, SAMPLE_RATE, 2)
+
+    sound_cache = SoundCache()
+    sound_cache.prepare = prepare
+    loaded = []
+    sound_cache.load(str(path), loaded.append)
+    deadline = time.monotonic() + 5
+    while not loaded and time.monotonic() < deadline:
+        qt_app.processEvents()
+    sound_cache.shutdown()
+
+    assert loaded and loaded[0] is not None
+    sound = loaded[0]
+    assert prepared_on and prepared_on[0] is not threading.main_thread()
+    assert sound.converted[SAMPLE_RATE, 2].shape == (800, 2)
+    assert sound_cache.size_bytes == sound.memory_bytes > sound.size_bytes
+    assert sound_cache.is_cached(str(path))
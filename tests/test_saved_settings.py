@@ -0,0 +1,40 @@
+import pytest
+
+from sound_board import SoundBoard
+from saved_settings import SavedSettings
+from player_pool import PlayerPoolManager, MIN_MAX_CONCURRENT_SOUNDS, MAX_MAX_CONCURRENT_SOUNDS
+from latency_tracing import LatencyTracer
+from hotkey_dispatcher import HotkeyDispatcher
+from keyword_matcher import KeywordMatcher
+from loudness import LoudnessAnalyzer
+
+
+def apply_saved_settings() -> PlayerPoolManager:
+    player_pool_manager = SoundBoard.create_player_pool_manager()
+    latency_tracer = LatencyTracer()
+    hotkey_dispatcher = HotkeyDispatcher(lambda entry, trace: None, latency_tracer=latency_tracer)
+    SavedSettings.apply_saved_settings(
+        player_pool_manager, latency_tracer, hotkey_dispatcher, KeywordMatcher(hotkey_dispatcher.submit),
+        LoudnessAnalyzer()
+    )
+    return player_pool_manager
+
+
+@pytest.mark.parametrize("saved_value, expected_value", [
+    (30, MAX_MAX_CONCURRENT_SOUNDS),
+    (0, MIN_MAX_CONCURRENT_SOUNDS),
+    (4, 4)
+])
+def test_saved_max_concurrent_sounds_is_clamped_to_media_player_range(saved_config, saved_value, expected_value):
+    saved_config({"combo_box_playback_engine": "Media player", "slider_max_concurrent_sounds": saved_value})
+    player_pool_manager = apply_saved_settings()
+    assert isinstance(player_pool_manager, PlayerPoolManager)
+    assert player_pool_manager.main_player_pool.max_concurrent_sounds == expected_value
+
+
+def test_mixer_value_is_clamped_when_falling_back_to_media_player(saved_config, monkeypatch):
+    monkeypatch.setattr("sound_board.is_mixer_available", lambda: False)
+    saved_config({"combo_box_playback_engine": "Software mixer", "slider_max_concurrent_sounds": 64})
+    player_pool_manager = apply_saved_settings()
+    assert isinstance(player_pool_manager, PlayerPoolManager)
+    assert player_pool_manager.main_player_pool.max_concurrent_sounds == MAX_MAX_CONCURRENT_SOUNDS
@@ -0,0 +1,61 @@
+import socket
+import time
+
+import pytest
+
+from trigger_server import TriggerServer
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+def create_server(path) -> TriggerServer:
+    return TriggerServer(str(path), submit=lambda entry: True, commands={"stop": lambda request: None})
+
+
+def test_stale_socket_is_replaced(qt_app, tmp_path):
+    path = tmp_path / "trigger.sock"
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(str(path))
+    stale.close()
+
+    server = create_server(path)
+    server.start()
+    try:
+        assert server.running
+    finally:
+        server.stop()
+    assert not path.exists()
+
+
+def test_socket_of_running_server_is_left_alone(qt_app, tmp_path):
+    path = tmp_path / "trigger.sock"
+    server = create_server(path)
+    server.start()
+    try:
+        with pytest.raises(OSError):
+            create_server(path).start()
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(str(path))
+            client.sendall(b'{"op": "ping"}\n')
+            assert client.recv(100) == b'{"ok":true}\n'
+    finally:
+        server.stop()
+
+
+def test_stop_drops_connected_clients(qt_app, tmp_path):
+    path = tmp_path / "trigger.sock"
+    server = create_server(path)
+    server.start()
+    with socket.socket(socket.AF_UNIX) as idle_client, socket.socket(socket.AF_UNIX) as waiting_client:
+        idle_client.connect(str(path))
+        waiting_client.connect(str(path))
+        # Waits for the GUI thread, which doesn't process events until the server is stopped
+        waiting_client.sendall(b'{"op": "stop"}\n')
+        time.sleep(0.05)
+
+        server.stop()
+        assert not server.running
+        idle_client.settimeout(1)
+        waiting_client.settimeout(1)
+        assert idle_client.recv(100) == b""
+        assert waiting_client.recv(100) == b""